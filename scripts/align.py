@@ -0,0 +1,286 @@
+import argparse
+import bisect
+import csv
+import glob
+import hashlib
+import json
+import os
+
+from patterns import WORD_RE
+from build_metadata import load_json_safe
+from extract_document import caption_key
+
+ALIGN_OUT = "outputs/alignment.json"
+
+# paragraphs that share at least this much of their vocabulary count as the same paragraph, edited
+CHANGED_JACCARD = 0.5
+# how far ahead (in paragraphs) an unanchored paragraph looks for its counterpart
+GAP_WINDOW = 20
+
+
+# ---------- Normalization ----------
+def normalize(text):
+    """Lower-cased words joined by single spaces: punctuation, hyphenation and spacing differences vanish."""
+    return " ".join(WORD_RE.findall((text or "").lower()))
+
+
+def _key(norm):
+    return hashlib.blake2b(norm.encode("utf-8"), digest_size=8).digest()
+
+
+def _jaccard(a, b):
+    a, b = set(a.split()), set(b.split())
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+# ---------- Anchors ----------
+def anchors(keys_a, keys_b):
+    """
+    (i, j) pairs of paragraphs whose normalized text occurs exactly once on each
+    side, reduced to the longest chain that is increasing on both sides
+    (patience sorting, O(n log n)). Everything else is aligned between them.
+    """
+    def unique(keys):
+        seen = {}
+        for i, k in enumerate(keys):
+            seen[k] = None if k in seen else i
+        return {k: i for k, i in seen.items() if i is not None}
+
+    ua, ub = unique(keys_a), unique(keys_b)
+    pairs = sorted((i, ub[k]) for k, i in ua.items() if k in ub)
+
+    # longest increasing subsequence of j over pairs sorted by i
+    tails, tail_idx, prev = [], [], [None] * len(pairs)
+    for n, (_, j) in enumerate(pairs):
+        pos = bisect.bisect_left(tails, j)
+        if pos == len(tails):
+            tails.append(j)
+            tail_idx.append(n)
+        else:
+            tails[pos] = j
+            tail_idx[pos] = n
+        prev[n] = tail_idx[pos - 1] if pos else None
+    chain = []
+    n = tail_idx[-1] if tail_idx else None
+    while n is not None:
+        chain.append(pairs[n])
+        n = prev[n]
+    return chain[::-1]
+
+
+# ---------- Gaps ----------
+def _align_gap(norm_a, norm_b, a0, a1, b0, b1, out):
+    """Align paragraphs a0..a1 with b0..b1 (no anchors in between), appending to out."""
+    a, b = a0, b0
+    while a < a1 and b < b1:
+        na, nb = norm_a[a], norm_b[b]
+        if na == nb:
+            out["matched"].append([a, b])
+            a, b = a + 1, b + 1
+            continue
+
+        # one paragraph on one side is several consecutive ones on the other
+        group = _concatenation(na, norm_b, b, b1)
+        if group:
+            out["split"].append({"pdf": a, "docx": list(range(b, group))})
+            a, b = a + 1, group
+            continue
+        group = _concatenation(nb, norm_a, a, a1)
+        if group:
+            out["merged"].append({"pdf": list(range(a, group)), "docx": b})
+            a, b = group, b + 1
+            continue
+
+        # an edited paragraph: the most similar one within the window ahead on either side
+        best = None
+        for j in range(b, min(b1, b + GAP_WINDOW)):
+            sim = _jaccard(na, norm_b[j])
+            if sim >= CHANGED_JACCARD and (best is None or sim > best[0]):
+                best = (sim, a, j)
+        for i in range(a + 1, min(a1, a + GAP_WINDOW)):
+            sim = _jaccard(norm_a[i], nb)
+            if sim >= CHANGED_JACCARD and (best is None or sim > best[0]):
+                best = (sim, i, b)
+        if best is None:
+            out["pdf_only"].append(a)
+            a += 1
+            continue
+        sim, i, j = best
+        out["pdf_only"].extend(range(a, i))
+        out["docx_only"].extend(range(b, j))
+        out["changed"].append({"pdf": i, "docx": j, "similarity": round(sim, 3)})
+        a, b = i + 1, j + 1
+
+    out["pdf_only"].extend(range(a, a1))
+    out["docx_only"].extend(range(b, b1))
+
+
+def _concatenation(whole, norms, start, stop):
+    """End of the run norms[start:end] whose texts joined make up `whole`, or None."""
+    if not whole.startswith(norms[start]) or len(whole) == len(norms[start]):
+        return None
+    pos = len(norms[start])
+    end = start + 1
+    while end < stop and pos < len(whole):
+        part = norms[end]
+        if not part:
+            end += 1
+            continue
+        if whole[pos] != " " or not whole.startswith(part, pos + 1):
+            return None
+        pos += 1 + len(part)
+        end += 1
+    return end if pos == len(whole) and end - start > 1 else None
+
+
+def align_paragraphs(pdf_paragraphs, docx_paragraphs):
+    """
+    Match the paragraphs of the two formats. Returns lists of paragraph indexes:
+    matched [pdf, docx] pairs, changed (edited) pairs, split (one PDF paragraph
+    = several DOCX ones), merged (several PDF = one DOCX), pdf_only, docx_only.
+    """
+    norm_a = [normalize(p["text"]) for p in pdf_paragraphs]
+    norm_b = [normalize(p["text"]) for p in docx_paragraphs]
+    out = {"matched": [], "changed": [], "split": [], "merged": [], "pdf_only": [], "docx_only": []}
+
+    prev_a, prev_b = 0, 0
+    for i, j in anchors([_key(n) for n in norm_a], [_key(n) for n in norm_b]) + [(len(norm_a), len(norm_b))]:
+        _align_gap(norm_a, norm_b, prev_a, i, prev_b, j, out)
+        if i < len(norm_a):
+            out["matched"].append([i, j])
+        prev_a, prev_b = i + 1, j + 1
+    out["matched"].sort()
+    return out
+
+
+# ---------- Headings and captions ----------
+def heading_keys(headings):
+    return {(h.get("number"), normalize(h.get("title_full"))): h for h in headings}
+
+
+def caption_keys(captions):
+    return {caption_key(c["type"], c.get("label", c["number"])) or (c["type"], str(c["number"])): c
+            for c in captions}
+
+
+def _missing(a, b, describe):
+    return {
+        "missing_in_pdf": [describe(b[k]) for k in b if k not in a],
+        "missing_in_docx": [describe(a[k]) for k in a if k not in b],
+    }
+
+
+def compare(pdf, docx):
+    """
+    Full report for one paper. pdf/docx: metadata dicts (paragraphs, headings,
+    captions, references), e.g. *_metadata.json or DocumentResult.metadata().
+    "prefer" names the format whose detections miss less of what the other found.
+    """
+    alignment = align_paragraphs(pdf["paragraphs"], docx["paragraphs"])
+    headings = _missing(heading_keys(pdf["headings"]), heading_keys(docx["headings"]),
+                        lambda h: {"index": h["index"], "number": h.get("number"), "title": h.get("title_full")})
+    captions = _missing(caption_keys(pdf["captions"]), caption_keys(docx["captions"]),
+                        lambda c: {"index": c["index"], "type": c["type"], "number": c["number"]})
+
+    counts = {}
+    for fmt, meta in (("pdf", pdf), ("docx", docx)):
+        counts[fmt] = {k: len(meta[k]) for k in ("paragraphs", "headings", "captions", "references")}
+    missed = {
+        fmt: len(headings[f"missing_in_{fmt}"]) + len(captions[f"missing_in_{fmt}"])
+        for fmt in ("pdf", "docx")
+    }
+    aligned = len(alignment["matched"]) + len(alignment["changed"])
+    total = max(len(pdf["paragraphs"]), len(docx["paragraphs"]), 1)
+    # ties go to the PDF: its paragraphs carry page numbers
+    prefer = "docx" if missed["docx"] < missed["pdf"] else "pdf"
+    return {
+        "counts": counts,
+        "aligned_ratio": round(aligned / total, 3),
+        "paragraphs": alignment,
+        "headings": headings,
+        "captions": captions,
+        "prefer": prefer,
+    }
+
+
+def summary_row(name, report):
+    p = report["paragraphs"]
+    return {
+        "document": name,
+        "pdf_paragraphs": report["counts"]["pdf"]["paragraphs"],
+        "docx_paragraphs": report["counts"]["docx"]["paragraphs"],
+        "matched": len(p["matched"]),
+        "changed": len(p["changed"]),
+        "split": len(p["split"]),
+        "merged": len(p["merged"]),
+        "pdf_only": len(p["pdf_only"]),
+        "docx_only": len(p["docx_only"]),
+        "headings_missing_in_pdf": len(report["headings"]["missing_in_pdf"]),
+        "headings_missing_in_docx": len(report["headings"]["missing_in_docx"]),
+        "captions_missing_in_pdf": len(report["captions"]["missing_in_pdf"]),
+        "captions_missing_in_docx": len(report["captions"]["missing_in_docx"]),
+        "aligned_ratio": report["aligned_ratio"],
+        "prefer": report["prefer"],
+    }
+
+
+# ---------- Inputs ----------
+def load_metadata(path):
+    """A *_metadata.json, or a PDF/DOCX run through the pipeline."""
+    if path.endswith(".json"):
+        return load_json_safe(path)
+    from pipeline import Pipeline
+    return Pipeline().run(path).metadata()
+
+
+def pair_batch(directory):
+    """{stem: (pdf metadata path, docx metadata path)} for papers with both formats in a batch output dir"""
+    pairs = {}
+    for path in sorted(glob.glob(os.path.join(directory, "*_pdf_metadata.json"))):
+        stem = os.path.basename(path)[:-len("_pdf_metadata.json")]
+        docx = os.path.join(directory, f"{stem}_docx_metadata.json")
+        if os.path.exists(docx):
+            pairs[stem] = (path, docx)
+    return pairs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Align the paragraphs of a paper's PDF and DOCX and report the differences.")
+    parser.add_argument("pdf", nargs="?", default="outputs/pdf_metadata.json",
+                        help="PDF, or its *_metadata.json (default: outputs/pdf_metadata.json)")
+    parser.add_argument("docx", nargs="?", default="outputs/docx_metadata.json")
+    parser.add_argument("--batch", default=None,
+                        help="align every <stem>_pdf/<stem>_docx pair in this batch output directory")
+    parser.add_argument("--out", default=None,
+                        help=f"JSON report (default: {ALIGN_OUT}; with --batch, <dir>/alignment.json and .csv)")
+    args = parser.parse_args(argv)
+
+    if args.batch:
+        reports, rows = {}, []
+        for stem, (pdf_path, docx_path) in pair_batch(args.batch).items():
+            reports[stem] = compare(load_json_safe(pdf_path), load_json_safe(docx_path))
+            rows.append(summary_row(stem, reports[stem]))
+        out = args.out or os.path.join(args.batch, "alignment.json")
+        csv_path = os.path.splitext(out)[0] + ".csv"
+        if rows:
+            with open(csv_path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+                writer.writeheader()
+                writer.writerows(rows)
+        print(f"{len(rows)} PDF/DOCX pairs; prefer pdf: {sum(r['prefer'] == 'pdf' for r in rows)}, "
+              f"docx: {sum(r['prefer'] == 'docx' for r in rows)}")
+    else:
+        reports = compare(load_metadata(args.pdf), load_metadata(args.docx))
+        out = args.out or ALIGN_OUT
+        row = summary_row(os.path.basename(args.pdf), reports)
+        for k, v in row.items():
+            print(f"{k}: {v}")
+
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(reports, f, indent=2, ensure_ascii=False)
+    print(f"Wrote {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+import argparse
+import csv
+import functools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from pipeline import Pipeline, FILE_TYPES
+from build_metadata import MANIFEST_FIELDS, manifest_row, load_json_safe
+import instrument
+from stage_cache import StageCache, CACHE_MAX_BYTES, file_hash
+from manifest_index import ManifestIndex
+from shards import ShardWriter, dump_record, COMPRESSION, SHARD_MAX_BYTES
+from fingerprint import NEAR_DUP_THRESHOLD
+from revisions import revision_delta
+from extract_document import save_json
+
+BATCH_OUT_DIR = "outputs/batch"
+
+
+# ---------- Input collection ----------
+def collect_inputs(inputs, file_list=None):
+    """
+    inputs: directories and/or document paths
+    file_list: optional text file with one document path per line
+    Returns a sorted list of PDF/DOCX paths (duplicates removed).
+    """
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for name in os.listdir(item):
+                paths.append(os.path.join(item, name))
+        else:
+            paths.append(item)
+
+    if file_list:
+        with open(file_list, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    paths.append(line)
+
+    docs = []
+    seen = set()
+    for p in paths:
+        ext = os.path.splitext(p)[1].lower()
+        if ext in FILE_TYPES and os.path.isfile(p) and os.path.normpath(p) not in seen:
+            seen.add(os.path.normpath(p))
+            docs.append(p)
+    return sorted(docs)
+
+
+def document_prefix(path):
+    """'data/paper.pdf' -> 'paper_pdf' (keeps the PDF and DOCX of one paper apart)"""
+    stem, ext = os.path.splitext(os.path.basename(path))
+    return f"{stem}_{FILE_TYPES[ext.lower()]}"
+
+
+def prefix_clashes(paths):
+    """
+    {prefix: [paths]} for inputs that would share an output prefix ('a/paper.pdf'
+    and 'b/paper.pdf') and overwrite each other's files. The prefix stays the
+    bare file name so --previous can match revisions kept in other folders.
+    """
+    by_prefix = {}
+    for p in paths:
+        by_prefix.setdefault(document_prefix(p), []).append(p)
+    return {prefix: group for prefix, group in by_prefix.items() if len(group) > 1}
+
+
+def clash_message(clashes):
+    lines = [f"  {prefix}: {', '.join(group)}" for prefix, group in sorted(clashes.items())]
+    return "inputs with the same output prefix would overwrite each other:\n" + "\n".join(lines)
+
+
+# ---------- One document ----------
+_cache = None
+
+def get_cache(cache_dir, cache_max_bytes):
+    """The StageCache for cache_dir, opened once per process (scanning the cache dir is not free)."""
+    global _cache
+    if _cache is None or _cache.root != cache_dir:
+        _cache = StageCache(cache_dir, cache_max_bytes)
+    return _cache
+
+
+_fingerprints = None
+
+def _get_fingerprints(path, threshold):
+    # one connection per worker process; SQLite serializes the writers
+    global _fingerprints
+    if _fingerprints is None or _fingerprints.path != path:
+        from fingerprint import FingerprintIndex
+        _fingerprints = FingerprintIndex(path, threshold)
+    _fingerprints.threshold = threshold
+    return _fingerprints
+
+
+def process_document(path, out_dir=BATCH_OUT_DIR, dump_intermediates=False,
+                     cache_dir=None, cache_max_bytes=CACHE_MAX_BYTES,
+                     profile=False, profile_memory=False, page_workers=None, docx_styles=False,
+                     pdf_layout=False, progress=None, output="json", dedupe=None,
+                     dup_threshold=NEAR_DUP_THRESHOLD, previous_dir=None, stream=False):
+    """
+    Run the full pipeline for one document, writing <out_dir>/<prefix>_metadata.json.
+    progress is passed on to Pipeline.run (journal.py reports the stages with it).
+    output="jsonl" writes no files: the metadata comes back as one compact JSON line
+    in manifest["record"], for the caller to append to a shard (see shards.py).
+    dedupe: fingerprint index path; copies of documents already in it reuse their
+    detection outputs (see Pipeline.deduplicate).
+    stream: split PDFs page by page without holding their whole text (Pipeline stream).
+    previous_dir: output dir of a run over earlier revisions. If it has
+    <prefix>_metadata.json, only changed paragraphs are re-detected (see
+    Pipeline.revise) and <prefix>_delta.json lists what was added and removed.
+    """
+    start = time.perf_counter()
+    prefix = document_prefix(path)
+
+    cache = get_cache(cache_dir, cache_max_bytes) if cache_dir else None
+    fingerprints = _get_fingerprints(dedupe, dup_threshold) if dedupe else None
+    previous = load_json_safe(os.path.join(previous_dir, f"{prefix}_metadata.json")) if previous_dir else None
+    result = Pipeline(cache, page_workers, docx_styles, pdf_layout, fingerprints, stream).run(
+        path, profile=profile, profile_memory=profile_memory, progress=progress, previous=previous or None)
+    changes = revision_delta(previous, result) if result.revision else None
+    if output == "jsonl":
+        metadata = result.full_metadata()
+    else:
+        metadata = result.write(out_dir, prefix, dump_intermediates=dump_intermediates)
+        if changes:
+            save_json(changes, os.path.join(out_dir, f"{prefix}_delta.json"))
+
+    manifest = dict(metadata["manifest_partial"])
+    manifest["source_path"] = path
+    manifest["content_hash"] = result.content_hash or file_hash(path)
+    manifest["prefix"] = prefix
+    manifest["pid"] = os.getpid()
+    if result.duplicate_of:
+        manifest["duplicate_of"] = result.duplicate_of["doc"]
+    if changes:
+        manifest["reused_paragraphs"] = result.revision["reused"]
+    if output == "jsonl":
+        if changes:
+            metadata["delta"] = changes
+        manifest["record"] = dump_record(dict({"prefix": prefix, "source_path": path}, **metadata))
+    manifest["seconds"] = round(time.perf_counter() - start, 4)
+    return manifest
+
+
+def process_document_safe(path, out_dir, options):
+    """
+    process_document(path, out_dir, **options), but a broken file returns
+    {"file_name", "error"} instead of raising, so it cannot take a batch (or the
+    watcher) down.
+    """
+    try:
+        return process_document(path, out_dir, **options)
+    except Exception as e:
+        return {"file_name": os.path.basename(path), "error": f"{type(e).__name__}: {e}"}
+
+
+# ---------- Many documents ----------
+INDEX_BATCH_SIZE = 500
+
+
+def run_batch(paths, out_dir=BATCH_OUT_DIR, workers=None, index_path=None, shards=None, **options):
+    """
+    Process documents on a pool of `workers` processes (default: one per core).
+    options are passed on to process_document (dump_intermediates, cache_dir, ...).
+    Successful documents are upserted into the SQLite manifest index at
+    index_path (default <out_dir>/manifest.db) in batched transactions.
+    shards: a shards.ShardWriter; the metadata then goes into its JSONL shards
+    instead of one <prefix>_metadata.json per document.
+    Writes <out_dir>/batch_manifest.csv and returns the per-document results.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    if shards is not None:
+        options["output"] = "jsonl"
+    workers = workers or os.cpu_count() or 1
+    index = ManifestIndex(index_path or os.path.join(out_dir, "manifest.db"))
+
+    results = []
+    pending = []
+
+    def collect(r):
+        if "record" in r:
+            # written here, in the parent: one writer per shard, never interleaved
+            r["shard"] = shards.write(r.pop("record"))
+        results.append(r)
+        if not r.get("error"):
+            pending.append(r)
+        if len(pending) >= INDEX_BATCH_SIZE:
+            index.upsert_many(pending)
+            pending.clear()
+
+    try:
+        if workers == 1 or len(paths) <= 1:
+            for p in paths:
+                collect(process_document_safe(p, out_dir, options))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(process_document_safe, p, out_dir, options) for p in paths]
+                for fut in as_completed(futures):
+                    collect(fut.result())
+    finally:
+        if pending:
+            index.upsert_many(pending)
+        index.close()
+        if shards is not None:
+            shards.close()
+
+    results.sort(key=lambda r: r.get("prefix") or r["file_name"])
+    write_batch_manifest(results, os.path.join(out_dir, "batch_manifest.csv"))
+    return results
+
+
+def write_batch_manifest(results, out_path):
+    rows = [manifest_row(r) for r in results]
+    header = list(MANIFEST_FIELDS)
+    for r in rows:
+        header += [k for k in r if k.endswith(("_ms", "_peak_kb")) and k not in header]
+    header += ["seconds", "duplicate_of", "reused_paragraphs", "error"]
+    with open(out_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for r in rows:
+            writer.writerow([r.get(k) for k in header])
+
+
+def write_batch_trace(results, out_path):
+    """One Chrome trace for the whole run: a row per worker process."""
+    events = []
+    for r in results:
+        events += instrument.chrome_trace_events(r.get("stages"), r["file_name"], pid=0, tid=r.get("pid", 0))
+    instrument.write_chrome_trace(events, out_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract a corpus of PDF/DOCX documents in parallel.")
+    parser.add_argument("inputs", nargs="*", help="input directories and/or document files")
+    parser.add_argument("--file-list", help="text file with one document path per line")
+    parser.add_argument("--out-dir", default=BATCH_OUT_DIR)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--dump-intermediates", action="store_true",
+                        help="also write per-stage files (paragraphs, headings, ...) for debugging")
+    parser.add_argument("--cache-dir", default=None,
+                        help="reuse unchanged stage outputs from this content-addressed cache")
+    parser.add_argument("--cache-max-mb", type=int, default=CACHE_MAX_BYTES // (1024 * 1024))
+    parser.add_argument("--profile", action="store_true", help="record per-stage timings in the manifests")
+    parser.add_argument("--profile-memory", action="store_true", help="also record tracemalloc peaks (slower)")
+    parser.add_argument("--trace", default=None, help="write a Chrome trace JSON of all stages here")
+    parser.add_argument("--page-workers", type=int, default=None,
+                        help="split each big PDF's pages across this many processes "
+                             "(for a few huge documents; combine with --workers 1)")
+    parser.add_argument("--docx-styles", action="store_true",
+                        help="use DOCX paragraphs and their Heading styles instead of re-splitting the text")
+    parser.add_argument("--stream", action="store_true",
+                        help="split PDFs page by page instead of reading their whole text first "
+                             "(bounded memory for huge PDFs; no --page-workers or --pdf-layout)")
+    parser.add_argument("--pdf-layout", action="store_true",
+                        help="read PDF font sizes too: paragraphs in a larger font become headings")
+    parser.add_argument("--search-index", default=None,
+                        help="add the extracted paragraphs to this full-text index directory "
+                             "(implies --dump-intermediates; not with --output jsonl)")
+    parser.add_argument("--index", default=None, help="SQLite manifest index (default: <out-dir>/manifest.db)")
+    parser.add_argument("--output", choices=["json", "jsonl"], default="json",
+                        help="jsonl: append compact metadata records to size-bounded shards in <out-dir>/shards "
+                             "instead of writing files per document")
+    parser.add_argument("--shard-mb", type=int, default=SHARD_MAX_BYTES // (1024 * 1024))
+    parser.add_argument("--compress", choices=sorted(COMPRESSION), default="none", help="shard compression")
+    parser.add_argument("--dedupe", nargs="?", const="", default=None,
+                        help="fingerprint index (default: <out-dir>/fingerprints.db); copies of documents "
+                             "already in it reuse their headings/captions/references")
+    parser.add_argument("--dup-threshold", type=float, default=NEAR_DUP_THRESHOLD,
+                        help="estimated Jaccard similarity of word 5-grams that counts as a near-duplicate")
+    parser.add_argument("--previous", default=None,
+                        help="output dir of a run over earlier revisions: documents with a <prefix>_metadata.json "
+                             "there only re-detect changed paragraphs and get a <prefix>_delta.json")
+    parser.add_argument("--journal", nargs="?", const="", default=None,
+                        help="journal every document's state here (default: <out-dir>/journal.jsonl) "
+                             "and skip documents a previous run finished")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="with --journal: kill a document's worker after this many seconds")
+    parser.add_argument("--retries", type=int, default=None,
+                        help="with --journal: attempts after the first before a document is quarantined")
+    args = parser.parse_args(argv)
+    if args.search_index and args.output == "jsonl":
+        # the index is built from (and shows hits from) the *_paragraphs.json stage files
+        parser.error("--search-index needs the per-document files; it cannot be used with --output jsonl")
+
+    paths = collect_inputs(args.inputs, args.file_list)
+    if not paths:
+        parser.error("no PDF/DOCX documents found")
+    clashes = prefix_clashes(paths)
+    if clashes:
+        parser.error(clash_message(clashes) + "\nrename them or run the folders separately")
+
+    start = time.perf_counter()
+    runner = run_batch
+    if args.journal is not None:
+        from journal import run_journaled, DOC_TIMEOUT, MAX_RETRIES
+        runner = functools.partial(run_journaled, journal_path=args.journal or None,
+                                   timeout=args.timeout or DOC_TIMEOUT,
+                                   retries=MAX_RETRIES if args.retries is None else args.retries)
+    shards = None
+    if args.output == "jsonl":
+        shards = ShardWriter(os.path.join(args.out_dir, "shards"), max_bytes=args.shard_mb * 1024 * 1024,
+                             compression=args.compress)
+    results = runner(paths, args.out_dir, args.workers, args.index, shards,
+                     dump_intermediates=args.dump_intermediates or bool(args.search_index),
+                     cache_dir=args.cache_dir,
+                     cache_max_bytes=args.cache_max_mb * 1024 * 1024,
+                     profile=args.profile or bool(args.trace),
+                     profile_memory=args.profile_memory,
+                     page_workers=args.page_workers,
+                     docx_styles=args.docx_styles,
+                     pdf_layout=args.pdf_layout,
+                     dedupe=None if args.dedupe is None else args.dedupe or os.path.join(args.out_dir, "fingerprints.db"),
+                     dup_threshold=args.dup_threshold,
+                     previous_dir=args.previous,
+                     stream=args.stream)
+    elapsed = time.perf_counter() - start
+
+    if args.trace:
+        write_batch_trace(results, args.trace)
+
+    if args.search_index:
+        from search_index import SearchIndex, index_outputs
+        with SearchIndex(args.search_index) as search:
+            print(f"Added {index_outputs(search, [args.out_dir])} documents to {args.search_index}")
+
+    failed = [r for r in results if r.get("error")]
+    print(f"Processed {len(results)} documents in {elapsed:.2f}s ({len(failed)} failed)")
+    for r in failed:
+        print(f"  {r['file_name']}: {r['error']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+
+from extract_document import find_headings, find_captions, find_references, detect_fig_table
+from patterns import fig_re, table_re
+from build_metadata import create_metadata
+from pipeline import Pipeline
+from synthetic import generate
+
+BENCH_DIR = "outputs/benchmarks"
+
+# name -> synthetic.make_paper arguments; every size gets both a PDF and a DOCX
+SIZES = {
+    "small": {"pages": 2},
+    "medium": {"pages": 20},
+    "large": {"pages": 100},
+}
+
+
+# ---------- Stats ----------
+def percentile(values, p):
+    """nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[k]
+
+
+def time_stage(fn, repeats):
+    """Run fn() `repeats` times; returns (last result, list of seconds, cpu seconds)"""
+    wall = []
+    cpu = 0.0
+    result = None
+    for _ in range(repeats):
+        c0 = time.process_time()
+        t0 = time.perf_counter()
+        result = fn()
+        wall.append(time.perf_counter() - t0)
+        cpu += time.process_time() - c0
+    return result, wall, cpu
+
+
+def peak_memory(fn):
+    """Peak Python allocation (bytes) during one extra run of fn(), measured separately from timing."""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+# ---------- One document ----------
+def bench_document(path, file_type, repeats, work_dir):
+    """
+    Time every stage on one document, with the same extractor and splitter
+    Pipeline runs (read_pdf / extract_docx_text_fast, paragraph_records).
+    Returns one result dict per stage.
+    """
+    pipeline = Pipeline()
+    rows = []
+
+    # throughput is units/s: extract -> chars, split -> words, detectors -> paragraphs
+    def run(name, fn, count_of, units=None):
+        result, wall, cpu = time_stage(fn, repeats)
+        items = count_of(result)
+        total = sum(wall)
+        rows.append({
+            "stage": name,
+            "runs": repeats,
+            "items": items,
+            "mean_ms": round(total / repeats * 1000, 3),
+            "p50_ms": round(percentile(wall, 50) * 1000, 3),
+            "p90_ms": round(percentile(wall, 90) * 1000, 3),
+            "p99_ms": round(percentile(wall, 99) * 1000, 3),
+            "cpu_ms": round(cpu / repeats * 1000, 3),
+            "peak_kb": round(peak_memory(fn) / 1024, 1),
+            "throughput": round(repeats * (units if units is not None else items) / total, 1) if total else None,
+        })
+        return result
+
+    extract_name = "read_pdf" if file_type == "pdf" else "extract_docx_text_fast"
+    result = run(extract_name, lambda: pipeline.extract(path), lambda r: len(r.text))
+    words = len(result.text.split())
+
+    def split():
+        pipeline.split(result)
+        return result.records
+
+    doc = run("split_into_paragraphs", split, lambda d: len(d.paragraphs), words)
+    n = len(doc.paragraphs)
+    doc.headings = run("heading_detection", lambda: find_headings(doc), len, n)
+    doc.captions = run("detect_fig_table", lambda: find_captions(doc), len, n)
+    doc.references = run("detect_references", lambda: find_references(doc), len, n)
+
+    # create_metadata reads the stage files, so write them once first
+    result.write(work_dir, file_type, dump_intermediates=True)
+
+    def metadata():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return create_metadata(file_type, out_dir=work_dir, source_path=path)
+
+    run("create_metadata", metadata, lambda m: m["paragraph_count"])
+    return rows
+
+
+# ---------- Suite ----------
+def run_suite(sizes, repeats=5, formats=("pdf", "docx"), seed=0):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size_name, size in sizes.items():
+            docs = generate(tmp, size_name, formats=formats, seed=seed, **size)
+            for file_type in formats:
+                path = docs[file_type]
+                print(f"{size_name} {file_type}: {os.path.getsize(path) // 1024} KB")
+                for row in bench_document(path, file_type, repeats, os.path.join(tmp, size_name)):
+                    row.update({"size": size_name, "format": file_type, "pages": docs.get("pages")})
+                    results.append(row)
+    return results
+
+
+# ---------- Caption scan scaling ----------
+# single huge "paragraphs" like the ones a PDF without headings produces
+PATHOLOGICAL = {
+    "one_long_caption": lambda n: "Figure 1: " + "word " * (n // 5),
+    "dense_captions": lambda n: "Figure 3: pipeline output. Table 2: results. " * (n // 45),
+    "heads_without_separator": lambda n: "Fig 1 Table 2 " * (n // 14),
+    "fig_substrings": lambda n: "configure the figures " * (n // 22),
+}
+SCALING_SIZES = [125_000, 250_000, 500_000, 1_000_000]
+
+
+def bench_caption_scaling(sizes=SCALING_SIZES, repeats=3):
+    """
+    detect_fig_table against the plain fig_re/table_re regexes on one paragraph
+    of each pathological shape and size. Linear scaling shows as a flat ns/char.
+    """
+    def regex_scan(text):
+        # the previous detect_fig_table: one lazy regex per caption type
+        return [{"index": 0, "type": ctype, "number": int(m.group(1)),
+                 "text": m.group(0).strip(), "caption_text": m.group(2).strip()}
+                for ctype, pattern in (("figure", fig_re), ("table", table_re))
+                for m in pattern.finditer(text)]
+
+    rows = []
+    for shape, make in PATHOLOGICAL.items():
+        for n in sizes:
+            paras = [{"index": 0, "text": make(n)}]
+            chars = len(paras[0]["text"])
+            _, scan, _ = time_stage(lambda: detect_fig_table(paras), repeats)
+            _, regex, _ = time_stage(lambda: regex_scan(paras[0]["text"]), repeats)
+            rows.append({
+                "shape": shape,
+                "chars": chars,
+                "captions": len(detect_fig_table(paras)),
+                "scan_ms": round(min(scan) * 1000, 2),
+                "regex_ms": round(min(regex) * 1000, 2),
+                "scan_ns_per_char": round(min(scan) * 1e9 / chars, 1),
+            })
+    return rows
+
+
+def print_scaling(rows):
+    print(f"{'shape':<26}{'chars':>10}{'captions':>10}{'scan ms':>10}{'regex ms':>10}{'ns/char':>10}")
+    for r in rows:
+        print(f"{r['shape']:<26}{r['chars']:>10}{r['captions']:>10}{r['scan_ms']:>10.2f}"
+              f"{r['regex_ms']:>10.2f}{r['scan_ns_per_char']:>10.1f}")
+
+
+def print_table(results):
+    print(f"{'size':<8}{'fmt':<6}{'stage':<24}{'items':>8}{'p50 ms':>10}{'p90 ms':>10}{'peak KB':>10}{'thr/s':>12}")
+    for r in results:
+        print(f"{r['size']:<8}{r['format']:<6}{r['stage']:<24}{r['items']:>8}"
+              f"{r['p50_ms']:>10.2f}{r['p90_ms']:>10.2f}{r['peak_kb']:>10.1f}{r['throughput'] or 0:>12.1f}")
+
+
+def compare(baseline_path, results):
+    """Print p50 speedup of this run against an earlier JSON report."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    before = {(r["size"], r["format"], r["stage"]): r for r in baseline["results"]}
+    print(f"\nvs {baseline_path}:")
+    for r in results:
+        old = before.get((r["size"], r["format"], r["stage"]))
+        if old and r["p50_ms"]:
+            print(f"  {r['size']:<8}{r['format']:<6}{r['stage']:<24}"
+                  f"{old['p50_ms']:>10.2f} -> {r['p50_ms']:<10.2f} x{old['p50_ms'] / r['p50_ms']:.2f}")
+
+
+def save_report(report, out):
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved {out}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark each pipeline stage on synthetic papers.")
+    parser.add_argument("--sizes", nargs="*", default=list(SIZES),
+                        help="size names (small, medium, large) or page counts like 500")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--formats", nargs="*", default=["pdf", "docx"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="JSON report path (default: outputs/benchmarks/bench_<time>.json, "
+                             "or captions_<time>.json with --captions)")
+    parser.add_argument("--compare", default=None, help="earlier JSON report to compare against")
+    parser.add_argument("--captions", action="store_true",
+                        help="only measure caption scanning on pathological paragraphs up to 1 MB")
+    args = parser.parse_args(argv)
+
+    if args.captions:
+        rows = bench_caption_scaling(repeats=args.repeats)
+        print_scaling(rows)
+        save_report({
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeats": args.repeats,
+            "captions": rows,
+        }, args.out or os.path.join(BENCH_DIR, f"captions_{time.strftime('%Y%m%d_%H%M%S')}.json"))
+        return
+
+    sizes = {}
+    for s in args.sizes:
+        sizes[s] = SIZES[s] if s in SIZES else {"pages": int(s)}
+
+    results = run_suite(sizes, args.repeats, tuple(args.formats), args.seed)
+    print_table(results)
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeats": args.repeats,
+        "sizes": sizes,
+        "results": results,
+    }
+    save_report(report, args.out or os.path.join(BENCH_DIR, f"bench_{time.strftime('%Y%m%d_%H%M%S')}.json"))
+
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,22 @@
 import os
 import json
-import re
-import fitz  # PyMuPDF
+
+from instrument import instrumented, stage_columns
+from extract_document import link_report
+from patterns import WORD_RE
+from stage_cache import stage_signature
 
 OUT_DIR = "outputs"
 PDF_FILE = "data/realistic_extraction_paper.pdf"
 DOCX_FILE = "data/realistic_extraction_paper.docx"
 
+MANIFEST_FIELDS = [
+    "file_name", "file_type", "page_count", "word_count",
+    "paragraph_count", "heading_count",
+    "figure_caption_count", "table_caption_count",
+    "reference_count"
+]
+
 def load_json_safe(path):
     if path and os.path.exists(path):
         with open(path, "r", encoding="utf-8") as f:
@@ -19,43 +29,17 @@ def read_text_safe(path):
             return f.read()
     return ""
 
-def create_metadata(file_type):
+def assemble_metadata(file_type, file_name, raw_text, paragraphs, headings, captions,
+                      references, reference_links, page_count=None, manifest_partial=None,
+                      duplicate_of=None, word_count=None):
     """
-    file_type: "pdf" or "docx"
-    Produces outputs/<file_type>_metadata.json
+    Build the metadata dict from stage outputs that are already in memory.
+    create_metadata does the same after loading the stage files from disk.
+    word_count: pass it when raw_text was never held whole (streamed PDFs).
     """
-    os.makedirs(OUT_DIR, exist_ok=True)
-
-    # file-specific paths
-    content_path = os.path.join(OUT_DIR, f"{file_type}_content.txt")
-    paras_path = os.path.join(OUT_DIR, f"{file_type}_paragraphs.json")
-    headings_path = os.path.join(OUT_DIR, f"{file_type}_headings.json")
-    captions_path = os.path.join(OUT_DIR, f"{file_type}_captions.json")
-    references_path = os.path.join(OUT_DIR, f"{file_type}_references.json")
-    links_path = os.path.join(OUT_DIR, f"{file_type}_reference_links.json")
-    manifest_path = os.path.join(OUT_DIR, f"{file_type}_manifest.json")
-
-    # load everything safely
-    raw_text = read_text_safe(content_path)
-    paragraphs = load_json_safe(paras_path)
-    headings = load_json_safe(headings_path)
-    captions = load_json_safe(captions_path)
-    references = load_json_safe(references_path)
-    reference_links = load_json_safe(links_path)
-    manifest_partial = load_json_safe(manifest_path)  # optional earlier manifest
-
-    # page count (pdf only)
-    page_count = None
-    if file_type == "pdf" and os.path.exists(PDF_FILE):
-        try:
-            doc = fitz.open(PDF_FILE)
-            page_count = len(doc)
-            doc.close()
-        except Exception:
-            page_count = None
-
     # word count (simple token count)
-    word_count = len(re.findall(r"\w+", raw_text)) if raw_text else 0
+    if word_count is None:
+        word_count = len(WORD_RE.findall(raw_text)) if raw_text else 0
 
     # counts
     paragraph_count = len(paragraphs)
@@ -65,8 +49,8 @@ def create_metadata(file_type):
     reference_count = len(references)
 
     # assemble metadata
-    metadata = {
-        "file_name": "realistic_extraction_paper." + ("pdf" if file_type == "pdf" else "docx"),
+    return {
+        "file_name": file_name,
         "file_type": file_type,
         "page_count": page_count,
         "word_count": word_count,
@@ -80,15 +64,75 @@ def create_metadata(file_type):
         "captions": captions,
         "references": references,
         "reference_links": reference_links,
-        "manifest_partial": manifest_partial,  # optional included for completeness
+        "link_report": link_report(captions, reference_links),
+        "manifest_partial": manifest_partial if manifest_partial is not None else [],  # optional included for completeness
+        "duplicate_of": duplicate_of,  # {"doc", "similarity", "exact", "reused" (paragraphs)} when --dedupe found a copy
+        # the detector versions (and heading vocabulary) behind these outputs: revisions.py
+        # only reuses them for a later revision when they are still current
+        "detectors": {stage: stage_signature(stage) for stage in ("headings", "captions", "references")},
         "notes": ""
     }
 
-    out_path = os.path.join(OUT_DIR, f"{file_type}_metadata.json")
+def manifest_row(manifest):
+    """Manifest dict -> flat CSV row dict (stage timings become <stage>_ms columns)."""
+    row = {k: v for k, v in manifest.items() if k != "stages"}
+    row.update(stage_columns(manifest.get("stages")))
+    return row
+
+@instrumented("create_metadata", count=lambda m: m["paragraph_count"])
+def create_metadata(file_type, out_dir=OUT_DIR, prefix=None, source_path=None):
+    """
+    file_type: "pdf" or "docx"
+    prefix: output file prefix (defaults to file_type, batch runs use "<stem>_<type>")
+    source_path: original document (defaults to PDF_FILE / DOCX_FILE)
+    Produces <out_dir>/<prefix>_metadata.json
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    prefix = prefix or file_type
+    if source_path is None:
+        source_path = PDF_FILE if file_type == "pdf" else DOCX_FILE
+
+    # file-specific paths
+    content_path = os.path.join(out_dir, f"{prefix}_content.txt")
+    paras_path = os.path.join(out_dir, f"{prefix}_paragraphs.json")
+    headings_path = os.path.join(out_dir, f"{prefix}_headings.json")
+    captions_path = os.path.join(out_dir, f"{prefix}_captions.json")
+    references_path = os.path.join(out_dir, f"{prefix}_references.json")
+    links_path = os.path.join(out_dir, f"{prefix}_references_links.json")
+    manifest_path = os.path.join(out_dir, f"{prefix}_manifest.json")
+
+    # load everything safely
+    raw_text = read_text_safe(content_path)
+    paragraphs = load_json_safe(paras_path)
+    headings = load_json_safe(headings_path)
+    captions = load_json_safe(captions_path)
+    references = load_json_safe(references_path)
+    reference_links = load_json_safe(links_path)
+    manifest_partial = load_json_safe(manifest_path)  # optional earlier manifest
+
+    # page count (pdf only): the pipeline already recorded it in the manifest,
+    # the PDF is only opened again for outputs written without one
+    page_count = manifest_partial.get("page_count") if isinstance(manifest_partial, dict) else None
+    if page_count is None and file_type == "pdf" and os.path.exists(source_path):
+        try:
+            import fitz  # PyMuPDF, only needed for the page count
+            doc = fitz.open(source_path)
+            page_count = len(doc)
+            doc.close()
+        except Exception:
+            page_count = None
+
+    metadata = assemble_metadata(
+        file_type, os.path.basename(source_path), raw_text,
+        paragraphs, headings, captions, references, reference_links,
+        page_count=page_count, manifest_partial=manifest_partial
+    )
+
+    out_path = os.path.join(out_dir, f"{prefix}_metadata.json")
     with open(out_path, "w", encoding="utf-8") as f:
         json.dump(metadata, f, indent=2, ensure_ascii=False)
 
-    print(f"Wrote {out_path} (paragraphs={paragraph_count}, headings={heading_count}, captions={len(captions)}, references={reference_count})")
+    print(f"Wrote {out_path} (paragraphs={metadata['paragraph_count']}, headings={metadata['heading_count']}, captions={len(captions)}, references={metadata['reference_count']})")
     return metadata
 
 def main():
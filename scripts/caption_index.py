@@ -0,0 +1,168 @@
+import argparse
+import glob
+import json
+import os
+import tempfile
+
+from extract_document import caption_key, build_captions_map, link_references_to_captions, link_report
+
+CAPTION_INDEX_PATH = "outputs/caption_index.json"
+
+
+class CaptionIndex:
+    """
+    Captions of many documents keyed by (doc, type, number, sub-label), so
+    resolving a reference - in one document or across the corpus - is a dict
+    lookup instead of a rescan of every *_captions.json.
+
+    On disk it is one JSON file with each document's captions and the
+    mtime/size of the file they came from; update() only re-reads changed files.
+    """
+
+    def __init__(self, path=CAPTION_INDEX_PATH):
+        self.path = path
+        self.docs = {}      # doc -> {"stamp", "source", "captions"}
+        self.by_doc = {}    # (doc, type, number, sub) -> caption dict
+        self.by_key = {}    # (type, number, sub) -> [doc, ...]
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.docs = json.load(f)
+            for doc, entry in self.docs.items():
+                self._index(doc, entry["captions"])
+
+    def _index(self, doc, captions):
+        for c in captions:
+            key = caption_key(c["type"], c.get("label", c["number"]))
+            if key and (doc,) + key not in self.by_doc:
+                self.by_doc[(doc,) + key] = c
+                self.by_key.setdefault(key, []).append(doc)
+
+    def _unindex(self, doc):
+        for c in self.docs.get(doc, {}).get("captions", []):
+            key = caption_key(c["type"], c.get("label", c["number"]))
+            if key and self.by_doc.pop((doc,) + key, None) is not None:
+                self.by_key[key].remove(doc)
+                if not self.by_key[key]:
+                    del self.by_key[key]
+
+    # ----- writes -----
+    def add_document(self, doc, captions, source=None, stamp=None):
+        """Replace whatever was indexed for doc with these captions."""
+        self._unindex(doc)
+        self.docs[doc] = {"stamp": stamp, "source": source, "captions": captions}
+        self._index(doc, captions)
+
+    def remove_document(self, doc):
+        self._unindex(doc)
+        self.docs.pop(doc, None)
+
+    def update(self, directories):
+        """Index new or changed <prefix>_captions.json files; returns how many were (re)read."""
+        changed = 0
+        for directory in directories:
+            for path in sorted(glob.glob(os.path.join(directory, "*_captions.json"))):
+                prefix = path[:-len("_captions.json")]
+                st = os.stat(path)
+                stamp = [st.st_mtime_ns, st.st_size]
+                doc = os.path.normpath(prefix)
+                if self.docs.get(doc, {}).get("stamp") == stamp:
+                    continue
+                with open(path, "r", encoding="utf-8") as f:
+                    self.add_document(doc, json.load(f), source=prefix, stamp=stamp)
+                changed += 1
+        return changed
+
+    def save(self):
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(self.docs, f)
+        os.replace(tmp, self.path)
+
+    # ----- lookups -----
+    def get(self, doc, ref_type, ref_number):
+        """The caption a reference in doc points at, or None ("2a" falls back to "2")."""
+        key = caption_key(ref_type, ref_number)
+        if key is None:
+            return None
+        found = self.by_doc.get((doc,) + key)
+        if found is None and key[2]:
+            found = self.by_doc.get((doc,) + key[:2] + ("",))
+        return found
+
+    def find(self, ref_type, ref_number):
+        """Every document that has this caption: [(doc, caption), ...]"""
+        key = caption_key(ref_type, ref_number)
+        if key is None:
+            return []
+        if key not in self.by_key and key[2]:
+            key = key[:2] + ("",)
+        return [(doc, self.by_doc[(doc,) + key]) for doc in self.by_key.get(key, [])]
+
+    def resolve(self, doc, references):
+        """Link all references of one document at once (same records as link_references_to_captions)."""
+        captions = self.docs.get(doc, {}).get("captions", [])
+        return link_references_to_captions(references, build_captions_map(captions))
+
+    def report(self, doc, references):
+        """{"dangling": [...], "unreferenced": [...]} for one document."""
+        captions = self.docs.get(doc, {}).get("captions", [])
+        return link_report(captions, self.resolve(doc, references))
+
+
+def _load_references(index, doc):
+    path = (index.docs[doc].get("source") or doc) + "_references.json"
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Corpus-wide index of figure/table captions.")
+    parser.add_argument("--path", default=CAPTION_INDEX_PATH)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    u = sub.add_parser("update", help="index the *_captions.json files in these output directories")
+    u.add_argument("directories", nargs="+")
+
+    f = sub.add_parser("find", help='e.g. find figure 2a [--doc outputs/batch/paper_pdf]')
+    f.add_argument("type", choices=["figure", "table"])
+    f.add_argument("number")
+    f.add_argument("--doc", default=None)
+
+    r = sub.add_parser("report", help="dangling references and unreferenced captions")
+    r.add_argument("docs", nargs="*", help="document keys (default: all)")
+    args = parser.parse_args(argv)
+
+    index = CaptionIndex(args.path)
+    if args.command == "update":
+        changed = index.update(args.directories)
+        index.save()
+        print(f"Indexed {changed} new or changed documents ({len(index.docs)} total, {len(index.by_doc)} captions)")
+    elif args.command == "find":
+        if args.doc:
+            caption = index.get(os.path.normpath(args.doc), args.type, args.number)
+            hits = [(args.doc, caption)] if caption else []
+        else:
+            hits = index.find(args.type, args.number)
+        for doc, c in hits:
+            print(f"{doc}\tparagraph {c['index']}\t{c['text'][:120]}")
+        print(f"{len(hits)} documents")
+    elif args.command == "report":
+        docs = [os.path.normpath(d) for d in args.docs] or sorted(index.docs)
+        for doc in docs:
+            if doc not in index.docs:
+                print(f"{doc}: not indexed")
+                continue
+            rep = index.report(doc, _load_references(index, doc))
+            print(f"{doc}: {len(rep['dangling'])} dangling, {len(rep['unreferenced'])} unreferenced")
+            for l in rep["dangling"]:
+                print(f"    dangling {l['ref_text']} (paragraph {l['ref_index']})")
+            for c in rep["unreferenced"]:
+                print(f"    unreferenced {c['type']} {c['number']} (paragraph {c['index']})")
+
+
+if __name__ == "__main__":
+    main()
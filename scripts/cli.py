@@ -0,0 +1,150 @@
+"""
+One entry point for the pipeline:
+
+    python scripts/cli.py extract data/paper.pdf        # full pipeline -> outputs/
+    python scripts/cli.py detect outputs/pdf --stages links
+    python scripts/cli.py metadata outputs/pdf --source data/paper.pdf
+    python scripts/cli.py manifest query "file_type=pdf"
+    python scripts/cli.py batch|journal|shards|dupes|revise|stats|align|watch|serve|bench|search|captions ...  # the other scripts' own options
+
+Every module is imported inside the command that needs it, and fitz/python-docx
+only when a document is actually opened, so "manifest" or "detect" start fast.
+"""
+import argparse
+import importlib
+import os
+import sys
+
+OUT_DIR = "outputs"
+
+# commands that hand their arguments straight to another script's main()
+DELEGATED = {
+    "manifest": ("manifest_index", "query the SQLite manifest index"),
+    "batch": ("batch", "extract a corpus in parallel"),
+    "journal": ("journal", "state of a journaled batch run"),
+    "shards": ("shards", "read the JSONL metadata shards of a batch run"),
+    "dupes": ("fingerprint", "check documents against the near-duplicate index"),
+    "revise": ("revisions", "re-detect only the changed paragraphs of a new revision"),
+    "stats": ("corpus_stats", "corpus statistics and outliers from the manifest"),
+    "align": ("align", "align a paper's PDF and DOCX paragraphs and report differences"),
+    "watch": ("watch", "watch a folder and extract new files"),
+    "serve": ("server", "run the extraction service"),
+    "bench": ("benchmark", "benchmark the stages on synthetic papers"),
+    "search": ("search_index", "full-text index over extracted paragraphs"),
+    "captions": ("caption_index", "corpus-wide caption index and link report"),
+}
+
+DETECT_STAGES = ["headings", "captions", "references", "links"]
+
+
+# ---------- extract ----------
+def cmd_extract(args):
+    from batch import process_document, collect_inputs, prefix_clashes, clash_message
+    from manifest_index import ManifestIndex, INDEX_PATH
+
+    paths = collect_inputs(args.inputs)
+    if not paths:
+        sys.exit("no PDF/DOCX documents found")
+    clashes = prefix_clashes(paths)
+    if clashes:
+        sys.exit(clash_message(clashes))
+
+    with ManifestIndex(args.index or INDEX_PATH) as index:
+        for path in paths:
+            manifest = process_document(path, args.out_dir, dump_intermediates=not args.no_intermediates,
+                                        cache_dir=args.cache_dir, profile=args.profile,
+                                        docx_styles=args.docx_styles, pdf_layout=args.pdf_layout,
+                                        stream=args.stream)
+            index.upsert(manifest)
+            print(f"{path} -> {os.path.join(args.out_dir, manifest['prefix'])}_metadata.json "
+                  f"({manifest['paragraph_count']} paragraphs, {manifest['seconds']}s)")
+
+
+# ---------- detect ----------
+def cmd_detect(args):
+    """Re-run detection stages on a saved <prefix>_paragraphs.json (no document is opened)."""
+    from extract_document import (
+        heading_detection, detect_fig_table, detect_references,
+        build_captions_map, link_references_to_captions, save_json
+    )
+    from build_metadata import load_json_safe
+
+    prefix = args.prefix
+    paragraphs = load_json_safe(prefix + "_paragraphs.json")
+    if not paragraphs and set(args.stages) - {"links"}:
+        sys.exit(f"{prefix}_paragraphs.json is missing or empty (run extract first)")
+
+    results = {}
+    if "headings" in args.stages:
+        results["headings"] = heading_detection(paragraphs)
+    if "captions" in args.stages:
+        results["captions"] = detect_fig_table(paragraphs)
+    if "references" in args.stages:
+        results["references"] = detect_references(paragraphs)
+    if "links" in args.stages:
+        captions = results.get("captions", load_json_safe(prefix + "_captions.json"))
+        references = results.get("references", load_json_safe(prefix + "_references.json"))
+        results["references_links"] = link_references_to_captions(references, build_captions_map(captions))
+
+    for name, items in results.items():
+        save_json(items, f"{prefix}_{name}.json")
+        print(f"{prefix}_{name}.json: {len(items)}")
+
+
+# ---------- metadata ----------
+def cmd_metadata(args):
+    from build_metadata import create_metadata
+
+    out_dir, prefix = os.path.split(args.prefix)
+    file_type = args.type or prefix.rsplit("_", 1)[-1]
+    if file_type not in ("pdf", "docx"):
+        sys.exit("cannot tell the file type from the prefix; pass --type pdf|docx")
+    create_metadata(file_type, out_dir=out_dir or ".", prefix=prefix, source_path=args.source)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="Document extraction pipeline.")
+    sub = parser.add_subparsers(dest="command", metavar="command")
+    sub.required = True
+
+    e = sub.add_parser("extract", help="run the full pipeline on documents")
+    e.add_argument("inputs", nargs="+", help="PDF/DOCX files or directories")
+    e.add_argument("--out-dir", default=OUT_DIR)
+    e.add_argument("--index", default=None, help="SQLite manifest index (default: outputs/manifest.db)")
+    e.add_argument("--no-intermediates", action="store_true", help="only write metadata and manifest")
+    e.add_argument("--cache-dir", default=None)
+    e.add_argument("--profile", action="store_true")
+    e.add_argument("--docx-styles", action="store_true")
+    e.add_argument("--pdf-layout", action="store_true")
+    e.add_argument("--stream", action="store_true", help="split PDFs page by page (bounded memory)")
+    e.set_defaults(func=cmd_extract)
+
+    d = sub.add_parser("detect", help="re-run detection on saved paragraphs")
+    d.add_argument("prefix", help='output prefix, e.g. "outputs/pdf" for outputs/pdf_paragraphs.json')
+    d.add_argument("--stages", nargs="+", choices=DETECT_STAGES, default=DETECT_STAGES)
+    d.set_defaults(func=cmd_detect)
+
+    m = sub.add_parser("metadata", help="rebuild <prefix>_metadata.json from the stage files")
+    m.add_argument("prefix", help='output prefix, e.g. "outputs/pdf" or "outputs/batch/paper_pdf"')
+    m.add_argument("--type", choices=["pdf", "docx"], default=None)
+    m.add_argument("--source", default=None, help="original document (page count and file name)")
+    m.set_defaults(func=cmd_metadata)
+
+    for name, (_, help_text) in DELEGATED.items():
+        sub.add_parser(name, help=help_text, add_help=False)
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in DELEGATED:
+        module = importlib.import_module(DELEGATED[argv[0]][0])
+        sys.argv[0] = f"cli.py {argv[0]}"  # argparse usage lines in the delegated script
+        return module.main(argv[1:])
+
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import time
+import warnings
+
+import numpy as np
+
+from manifest_index import INDEX_PATH, COUNT_FIELDS
+
+STATS_PATH = "outputs/corpus_stats.json"
+PERCENTILES = [1, 5, 25, 50, 75, 95, 99]
+HISTOGRAM_BINS = 10
+Z_THRESHOLD = 3.0
+TOP_OUTLIERS = 20
+
+# columns computed from the count columns (NaN where the denominator is 0 or missing)
+DERIVED = {
+    "caption_count": lambda c: c["figure_caption_count"] + c["table_caption_count"],
+    "references_per_caption": lambda c: _ratio(c["reference_count"], c["caption_count"]),
+    "words_per_paragraph": lambda c: _ratio(c["word_count"], c["paragraph_count"]),
+    "words_per_page": lambda c: _ratio(c["word_count"], c["page_count"]),
+}
+
+
+def _ratio(a, b):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(b > 0, a / b, np.nan)
+
+
+# ---------- Loading ----------
+# Only the numeric manifest columns are read; paragraphs and the rest of the
+# metadata never leave disk. NULL / empty cells become NaN.
+
+def load_index(db_path=INDEX_PATH):
+    """(doc_keys, file_types, {column: float64 array}) from the SQLite manifest index"""
+    conn = sqlite3.connect(db_path)
+    try:
+        # counts are never negative, so -1 stands in for NULL until the array exists
+        numbers = np.array(conn.execute(
+            "SELECT " + ", ".join(f"IFNULL({c}, -1)" for c in COUNT_FIELDS) + " FROM documents ORDER BY rowid"
+        ).fetchall(), dtype=np.float64).reshape(-1, len(COUNT_FIELDS))
+        names = conn.execute("SELECT doc_key, IFNULL(file_type, '') FROM documents ORDER BY rowid").fetchall()
+    finally:
+        conn.close()
+    numbers[numbers < 0] = np.nan
+    doc_keys, file_types = zip(*names) if names else ((), ())
+    return _columns(doc_keys, file_types, numbers)
+
+
+def load_csv(csv_path):
+    """Same as load_index, from a manifest CSV (manifest.csv or batch_manifest.csv)."""
+    with open(csv_path, "r", newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        key_col = header.index("source_path") if "source_path" in header else header.index("file_name")
+        type_col = header.index("file_type")
+        count_cols = [header.index(c) for c in COUNT_FIELDS]
+        doc_keys, file_types, cells = [], [], []
+        for r in reader:
+            r += [""] * (len(header) - len(r))
+            doc_keys.append(r[key_col])
+            file_types.append(r[type_col])
+            cells.extend(r[i] or "nan" for i in count_cols)
+    numbers = np.array(cells, dtype=np.float64).reshape(-1, len(COUNT_FIELDS))
+    return _columns(doc_keys, file_types, numbers)
+
+
+def _columns(doc_keys, file_types, numbers):
+    # fixed-width string arrays: comparing and np.unique on them is far faster than on objects
+    return (np.array(doc_keys, dtype=str), np.array(file_types, dtype=str),
+            {c: numbers[:, i] for i, c in enumerate(COUNT_FIELDS)})
+
+
+# ---------- Statistics ----------
+def add_derived(columns):
+    for name, compute in DERIVED.items():
+        columns[name] = compute(columns)
+    return columns
+
+
+def describe(matrix, names):
+    """Count, mean, std, min, percentiles and max of every column of matrix at once (NaNs skipped)."""
+    present = ~np.isnan(matrix)
+    count = present.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        total = np.where(present, matrix, 0).sum(axis=0)
+        mean = total / count
+        var = np.where(present, (matrix - mean) ** 2, 0).sum(axis=0) / count
+    filled = count > 0
+    pct = np.full((len(PERCENTILES), len(names)), np.nan)
+    mins = np.full(len(names), np.nan)
+    maxs = np.full(len(names), np.nan)
+    if filled.any():
+        sub = matrix[:, filled]
+        pct[:, filled] = np.nanpercentile(sub, PERCENTILES, axis=0)
+        mins[filled] = np.nanmin(sub, axis=0)
+        maxs[filled] = np.nanmax(sub, axis=0)
+
+    stats = {}
+    for j, name in enumerate(names):
+        stats[name] = {
+            "count": int(count[j]),
+            "mean": _num(mean[j]),
+            "std": _num(np.sqrt(var[j])),
+            "min": _num(mins[j]),
+            **{f"p{q}": _num(pct[i, j]) for i, q in enumerate(PERCENTILES)},
+            "max": _num(maxs[j]),
+        }
+    return stats
+
+
+def histograms(matrix, names, bins=HISTOGRAM_BINS):
+    """Equal-width histogram per column between its 1st and 99th percentile (the tails get their own counts)."""
+    result = {}
+    for j, name in enumerate(names):
+        col = matrix[:, j]
+        col = col[~np.isnan(col)]
+        if not col.size:
+            continue
+        lo, hi = np.percentile(col, [1, 99])
+        if hi <= lo:
+            hi = lo + 1
+        counts, edges = np.histogram(col, bins=bins, range=(lo, hi))
+        result[name] = {
+            "edges": [_num(e) for e in edges],
+            "counts": counts.tolist(),
+            "below": int((col < lo).sum()),
+            "above": int((col > hi).sum()),
+        }
+    return result
+
+
+def zscores(matrix, groups):
+    """z-score of every cell against the mean/std of its column within the same group (file type)."""
+    z = np.full(matrix.shape, np.nan)
+    for g in np.unique(groups):
+        rows = groups == g
+        sub = matrix[rows]
+        # all-NaN columns (page_count of DOCX) warn and come out NaN, which is what we want
+        with warnings.catch_warnings(), np.errstate(invalid="ignore", divide="ignore"):
+            warnings.simplefilter("ignore", RuntimeWarning)
+            mean = np.nanmean(sub, axis=0)
+            std = np.nanstd(sub, axis=0)
+            z[rows] = np.where(std > 0, (sub - mean) / std, 0)
+    return z
+
+
+def _num(x):
+    x = float(x)
+    return None if np.isnan(x) else round(x, 4)
+
+
+def corpus_report(doc_keys, file_types, columns, z_threshold=Z_THRESHOLD, top=TOP_OUTLIERS):
+    """The whole summary as one JSON-serializable dict."""
+    columns = add_derived(dict(columns))
+    names = list(columns)
+    matrix = np.column_stack([columns[n] for n in names]) if len(doc_keys) else np.empty((0, len(names)))
+
+    report = {
+        "documents": int(len(doc_keys)),
+        "columns": describe(matrix, names),
+        "histograms": histograms(matrix, names),
+        "by_type": {},
+    }
+    for t in np.unique(file_types):
+        rows = file_types == t
+        report["by_type"][t or "unknown"] = {
+            "documents": int(rows.sum()),
+            "columns": describe(matrix[rows], names),
+        }
+
+    # outliers: |z| above the threshold within the document's own file type
+    z = zscores(matrix, file_types)
+    flagged = np.abs(np.nan_to_num(z)) > z_threshold
+    rows, cols = np.nonzero(flagged)
+    order = np.argsort(-np.abs(z[rows, cols]))[:top]
+    report["outliers"] = {
+        "z_threshold": z_threshold,
+        "documents": int(flagged.any(axis=1).sum()),
+        "by_column": {names[j]: int(flagged[:, j].sum()) for j in range(len(names))},
+        "top": [{
+            "doc": str(doc_keys[rows[i]]),
+            "column": names[cols[i]],
+            "value": _num(matrix[rows[i], cols[i]]),
+            "z": _num(z[rows[i], cols[i]]),
+        } for i in order],
+    }
+
+    # documents that almost certainly failed to extract, whatever their z-score
+    empty = (np.nan_to_num(columns["word_count"]) == 0) | (np.nan_to_num(columns["paragraph_count"]) == 0)
+    report["empty_documents"] = {"count": int(empty.sum()), "docs": [str(d) for d in doc_keys[empty][:top]]}
+    return report
+
+
+def print_report(report):
+    print(f"{report['documents']} documents")
+    header = ["column", "count", "mean", "p5", "p50", "p95", "max", "outliers"]
+    print("\t".join(header))
+    for name, s in report["columns"].items():
+        print("\t".join(str(v) for v in (name, s["count"], s["mean"], s["p5"], s["p50"], s["p95"], s["max"],
+                                         report["outliers"]["by_column"].get(name, 0))))
+    for t, sub in report["by_type"].items():
+        medians = ", ".join(f"{n}={s['p50']}" for n, s in sub["columns"].items() if n in COUNT_FIELDS)
+        print(f"{t}: {sub['documents']} documents, medians {medians}")
+    out = report["outliers"]
+    print(f"{out['documents']} documents with |z| > {out['z_threshold']}, "
+          f"{report['empty_documents']['count']} with no text")
+    for o in out["top"]:
+        print(f"    {o['doc']}\t{o['column']}={o['value']}\tz={o['z']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Corpus statistics over the numeric manifest fields.")
+    parser.add_argument("--db", default=None, help=f"SQLite manifest index (default: {INDEX_PATH})")
+    parser.add_argument("--csv", default=None, help="read a manifest CSV instead of the index")
+    parser.add_argument("--out", default=STATS_PATH, help="where to write the JSON report")
+    parser.add_argument("--z", type=float, default=Z_THRESHOLD, help="outlier threshold (per file type)")
+    parser.add_argument("--top", type=int, default=TOP_OUTLIERS)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    if args.csv:
+        doc_keys, file_types, columns = load_csv(args.csv)
+    else:
+        db = args.db or INDEX_PATH
+        if not os.path.exists(db):
+            parser.error(f"no manifest index at {db}")
+        doc_keys, file_types, columns = load_index(db)
+    loaded = time.perf_counter()
+    report = corpus_report(doc_keys, file_types, columns, args.z, args.top)
+    report["seconds"] = {"load": round(loaded - start, 3), "stats": round(time.perf_counter() - loaded, 3)}
+
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print_report(report)
+    print(f"Wrote {args.out} (load {report['seconds']['load']}s, stats {report['seconds']['stats']}s)")
+
+
+if __name__ == "__main__":
+    main()
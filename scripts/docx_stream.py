@@ -0,0 +1,121 @@
+import zipfile
+import xml.etree.ElementTree as ET
+
+from extract_document import extract_docx_text
+from instrument import instrumented
+
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+BODY, P, TBL, R, HYPERLINK = W + "body", W + "p", W + "tbl", W + "r", W + "hyperlink"
+PPR, PSTYLE, VAL = W + "pPr", W + "pStyle", W + "val"
+
+# run children that contribute text, as python-docx's Run.text renders them
+RUN_TEXT = {W + "tab": "\t", W + "ptab": "\t", W + "cr": "\n", W + "noBreakHyphen": "-"}
+
+# styles.xml stores built-in names in lower case ("heading 1"); python-docx shows "Heading 1"
+BUILTIN_STYLES = {"normal", "title", "subtitle", "caption", "body text", "list paragraph", "quote"}
+
+
+def read_style_names(zf):
+    """styleId -> display name from word/styles.xml (small, parsed in one go)"""
+    try:
+        root = ET.fromstring(zf.read("word/styles.xml"))
+    except KeyError:
+        return {}
+    names = {}
+    for style in root.iter(W + "style"):
+        style_id = style.get(W + "styleId")
+        name_el = style.find(W + "name")
+        name = name_el.get(VAL) if name_el is not None else style_id
+        if name and (name in BUILTIN_STYLES or name.startswith("heading ")):
+            name = name[0].upper() + name[1:]
+        names[style_id] = name
+    return names
+
+
+def _run_text(run):
+    parts = []
+    for child in run:
+        if child.tag == W + "t":
+            parts.append(child.text or "")
+        elif child.tag == W + "br":
+            # only line breaks become "\n"; page/column breaks add nothing
+            if child.get(W + "type", "textWrapping") == "textWrapping":
+                parts.append("\n")
+        elif child.tag in RUN_TEXT:
+            parts.append(RUN_TEXT[child.tag])
+    return "".join(parts)
+
+
+def _paragraph(p, style_names):
+    style = None
+    ppr = p.find(PPR)
+    if ppr is not None:
+        ps = ppr.find(PSTYLE)
+        if ps is not None:
+            style = style_names.get(ps.get(VAL), ps.get(VAL))
+
+    # same runs python-docx's Paragraph.text uses: direct runs and runs inside hyperlinks
+    parts = []
+    for child in p:
+        if child.tag == R:
+            parts.append(_run_text(child))
+        elif child.tag == HYPERLINK:
+            parts.extend(_run_text(r) for r in child if r.tag == R)
+    return {"style": style or "Normal", "text": "".join(parts)}
+
+
+def iter_docx_paragraphs(docx_path, include_tables=False):
+    """
+    Stream {"style", "text"} per paragraph straight from word/document.xml.
+    By default only body paragraphs are yielded (like python-docx's Document.paragraphs);
+    include_tables adds paragraphs inside table cells. Each finished top-level element
+    is dropped from the tree, so memory stays flat however long the document is.
+    """
+    with zipfile.ZipFile(docx_path) as zf:
+        style_names = read_style_names(zf)
+        with zf.open("word/document.xml") as f:
+            stack = []
+            body = None
+            tables = 0
+            for event, elem in ET.iterparse(f, events=("start", "end")):
+                if event == "start":
+                    stack.append(elem.tag)
+                    if elem.tag == BODY:
+                        body = elem
+                    elif elem.tag == TBL:
+                        tables += 1
+                    continue
+
+                stack.pop()
+                parent = stack[-1] if stack else None
+                if elem.tag == P and (parent == BODY or (include_tables and tables and parent == W + "tc")):
+                    yield _paragraph(elem, style_names)
+                elif elem.tag == TBL:
+                    tables -= 1
+
+                if parent == BODY and body is not None:
+                    body.remove(elem)
+
+
+@instrumented("extract_docx_text")
+def extract_docx_text_fast(docx_path):
+    """Same text as extract_docx_text, without building the python-docx object model."""
+    try:
+        return "".join(p["text"] + "\n" for p in iter_docx_paragraphs(docx_path))
+    except (KeyError, zipfile.BadZipFile, ET.ParseError):
+        # unusual packages: let python-docx deal with them
+        return extract_docx_text(docx_path)
+
+
+def index_docx_paragraphs(docx_path, include_tables=False):
+    """
+    DOCX paragraphs as indexed paragraph dicts with their style name
+    ({"index", "text", "style"}), one per non-empty paragraph. heading_detection
+    uses the style to recognise "Heading N" paragraphs directly.
+    """
+    indexed = []
+    for p in iter_docx_paragraphs(docx_path, include_tables):
+        text = " ".join(p["text"].split())
+        if text:
+            indexed.append({"index": len(indexed), "text": text, "style": p["style"]})
+    return indexed
@@ -1,24 +1,142 @@
 
-import fitz
-from docx import Document
+# fitz and python-docx are imported inside the functions that need them,
+# so importing this module (or anything built on it) stays cheap.
+import bisect
+import itertools
 import json
 import os
-import re
+
+from instrument import instrumented
+from records import CompactDocument, Paragraph, Heading, Caption, Reference, clean_title
+from patterns import (
+    WHITESPACE_RE, BOUNDARY_RE, BOUNDARY_HEADINGS, num_re, known_re,
+    fig_re, table_re, fig_head_re, table_head_re, caption_label_re,
+    ref_re, ref_token_re
+)
 
 # File paths
 PDF_PATH = "data/realistic_extraction_paper.pdf"
 DOCX_PATH = "data/realistic_extraction_paper.docx"
 OUT_DIR = "outputs"
 
+
+def iter_pdf_pages(pdf_path):
+    """Yield (page_number, text) one page at a time (page numbers start at 1)."""
+    import fitz
+    doc = fitz.open(pdf_path)
+    try:
+        for page in doc:
+            yield page.number + 1, page.get_text("text")
+    finally:
+        doc.close()
+
+def pdf_page_count(pdf_path):
+    """Number of pages, without reading any text."""
+    import fitz
+    with fitz.open(pdf_path) as doc:
+        return doc.page_count
+
+@instrumented("extract_pdf_text")
 def extract_pdf_text(pdf_path):
+    return "".join(text for _, text in iter_pdf_pages(pdf_path))
+
+# below this many pages the process pool costs more than it saves
+PARALLEL_MIN_PAGES = 64
+
+def read_pdf_page(page, layout=False):
+    """
+    (text, runs) for one fitz page. text is page.get_text("text"). With layout,
+    runs lists (offset in text, font size) at every line whose size differs from
+    the line before. text and sizes come from the same text page, so the
+    layout analysis runs once.
+    """
+    import fitz
+    textpage = page.get_textpage(flags=fitz.TEXTFLAGS_TEXT)
+    text = page.get_text("text", textpage=textpage)
+    runs = []
+    if layout:
+        pos = 0
+        for block in page.get_text("dict", textpage=textpage)["blocks"]:
+            for line in block.get("lines", ()):
+                line_text = "".join(span["text"] for span in line["spans"])
+                at = text.find(line_text, pos) if line_text.strip() else -1
+                if at == -1:
+                    continue
+                size = round(max(span["size"] for span in line["spans"]), 1)
+                if not runs or runs[-1][1] != size:
+                    runs.append((at, size))
+                pos = at + len(line_text)
+    return text, runs
+
+def _read_page_range(job):
+    # runs in a worker process: each worker opens its own fitz handle
+    import fitz
+    pdf_path, start, end, layout = job
     doc = fitz.open(pdf_path)
-    text = ""
-    for page in doc:
-        text += page.get_text("text")
+    try:
+        return [read_pdf_page(doc[i], layout) for i in range(start, end)]
+    finally:
+        doc.close()
+
+def read_pdf_pages(pdf_path, layout=False, workers=None, min_pages=PARALLEL_MIN_PAGES):
+    """
+    read_pdf_page for every page, in page order. Big documents (>= min_pages) are
+    read by `workers` processes over contiguous page ranges; small ones serially
+    through a single open.
+    """
+    import fitz
+    doc = fitz.open(pdf_path)
+    page_count = len(doc)
+    workers = min(workers or os.cpu_count() or 1, page_count)
+    if workers <= 1 or page_count < min_pages:
+        try:
+            return [read_pdf_page(page, layout) for page in doc]
+        finally:
+            doc.close()
     doc.close()
-    return text
 
+    # a few ranges per worker so one slow range (scanned pages, big tables) does not stall the rest
+    size = -(-page_count // (workers * 4))
+    jobs = [(pdf_path, start, min(start + size, page_count), layout) for start in range(0, page_count, size)]
+
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        parts = list(pool.map(_read_page_range, jobs))
+    return [page for part in parts for page in part]
+
+@instrumented("extract_pdf_text", count=lambda r: len(r["text"]))
+def read_pdf(pdf_path, layout=False, workers=None):
+    """
+    Everything the pipeline needs from a PDF, from one open:
+      text          the same string as extract_pdf_text
+      page_count
+      page_offsets  offset in text where each page starts
+    and with layout (get_text("dict")):
+      font_runs       [offset in text, font size] wherever the size changes
+      body_font_size  the size most of the text is set in
+    workers > 1 spreads the pages of big PDFs over processes (see read_pdf_pages).
+    """
+    pages = read_pdf_pages(pdf_path, layout, workers or 1)
+    offsets, runs, chars = [], [], {}
+    pos = 0
+    for text, page_runs in pages:
+        offsets.append(pos)
+        for at, size in page_runs:
+            if not runs or runs[-1][1] != size:
+                runs.append([pos + at, size])
+        pos += len(text)
+    result = {"text": "".join(text for text, _ in pages), "page_count": len(pages), "page_offsets": offsets}
+    if layout:
+        # characters per size decide the body size
+        for (at, size), nxt in zip(runs, runs[1:] + [[pos, None]]):
+            chars[size] = chars.get(size, 0) + nxt[0] - at
+        result["font_runs"] = runs
+        result["body_font_size"] = max(chars, key=chars.get) if chars else None
+    return result
+
+@instrumented("extract_docx_text")
 def extract_docx_text(docx_path):
+    from docx import Document
     d = Document(docx_path)
     text = ""
     for p in d.paragraphs:
@@ -29,39 +147,229 @@ def save_text(text, out_path):
     with open(out_path, "w", encoding="utf-8") as f:
         f.write(text)
 
-def split_into_paragraphs(raw_text):
-
-    if not raw_text:
-        return []
-
-    # 1) normalize newlines and collapse whitespace
+def normalize_text(raw_text):
+    # normalize newlines and collapse whitespace
     text = raw_text.replace("\r\n", "\n").replace("\r", "\n")
-    text = re.sub(r"\s+", " ", text).strip()
+    return WHITESPACE_RE.sub(" ", text).strip()
 
-    # 2) pattern for heading boundaries
-    
-    heading_pattern = re.compile(
-        r"Abstract\b|Figures\b|Tables\b|\d+(?:\.\d+)*\.\s+[A-Z]"
-    )
-
-    paragraphs = []
+def paragraph_spans(text):
+    """(start, end) of every paragraph in text that is already normalized"""
+    spans = []
     prev = 0
 
-    # 3) cut the text whenever a heading-like pattern starts
-    for m in heading_pattern.finditer(text):
+    def add(start, end):
+        # same as text[start:end].strip(), without building the string
+        while start < end and text[start] == " ":
+            start += 1
+        while end > start and text[end - 1] == " ":
+            end -= 1
+        if end > start:
+            spans.append((start, end))
+
+    # cut the text whenever a heading-like pattern starts
+    for m in BOUNDARY_RE.finditer(text):
         start = m.start()
         if start > prev:
-            chunk = text[prev:start].strip()
-            if chunk:
-                paragraphs.append(chunk)
+            add(prev, start)
         prev = start
 
-    # 4) add the final tail
-    tail = text[prev:].strip()
-    if tail:
-        paragraphs.append(tail)
+    # add the final tail
+    add(prev, len(text))
+    return spans
+
+@instrumented("split_into_paragraphs")
+def split_into_paragraphs(raw_text):
+
+    if not raw_text:
+        return []
 
-    return paragraphs
+    # 1) normalize newlines and collapse whitespace
+    text = normalize_text(raw_text)
+
+    # 2) cut the text whenever a heading-like pattern starts
+    return [text[start:end] for start, end in paragraph_spans(text)]
+
+# a boundary heading split across two pages starts at most this far from the end of the first
+BOUNDARY_HEADING_MAX = max(map(len, BOUNDARY_HEADINGS), default=0)
+
+def open_tail(text, lo=0):
+    """
+    Earliest offset (not before lo) where a BOUNDARY_RE match could still start
+    once more text is appended: a boundary heading cut short, or a trailing
+    "1.2. " whose capital is on the next page. Everything before it is settled.
+    """
+    i = len(text)
+    if i > lo and text[i - 1] == " ":
+        i -= 1
+    while i > lo and text[i - 1] in "0123456789.":
+        i -= 1
+    return max(min(i, len(text) - BOUNDARY_HEADING_MAX), lo)
+
+def split_paragraphs_stream(pages):
+    """
+    Streaming version of split_into_paragraphs.
+    pages: iterable of (page_number, text), e.g. iter_pdf_pages(path)
+    Yields (page_number, paragraph, page_breaks) where page_number is the page the paragraph
+    starts on and page_breaks the [offset, page] of every later page beginning inside it.
+    Only the unfinished paragraph is kept between pages, as a list of pieces, and
+    each page is scanned once: the next scan resumes at its open_tail. The
+    paragraphs are the same as split_into_paragraphs on the joined text.
+    """
+    # offsets below are into the joined (whitespace-collapsed) text
+    parts = []         # the current paragraph from `start` up to `scanned`
+    tail = ""          # text from `scanned` on, scanned again with the next page
+    start = 0          # where the current paragraph starts
+    scanned = 0
+    offsets = []       # (offset, page_number) for every page from the current paragraph's on
+    ends_with_space = False
+
+    def emit(text):
+        stripped = text.strip()
+        if not stripped:
+            return None
+        lead = start + len(text) - len(text.lstrip())
+        end = lead + len(stripped)
+        page = offsets[0][1]
+        for off, num in offsets:
+            if off > lead:
+                break
+            page = num
+        # pages that begin inside the paragraph, as pdf_paragraphs records them
+        return page, stripped, [[off - lead, num] for off, num in offsets if lead < off < end]
+
+    # a trailing (None, None) marks the end of the document
+    for page_number, page_text in itertools.chain(pages, [(None, None)]):
+        final = page_number is None
+        piece = ""
+        if not final:
+            # same whitespace collapsing as split_into_paragraphs, one page at a time
+            piece = WHITESPACE_RE.sub(" ", page_text or "")
+            if ends_with_space and piece.startswith(" "):
+                piece = piece[1:]
+            if not piece:
+                continue
+            ends_with_space = piece.endswith(" ")
+            offsets.append((scanned + len(tail), page_number))
+
+        window = tail + piece
+        resume = None
+        last_end = 0
+        cut_before = start
+        # before the end, a match is only final once at least one more character
+        # follows it ("Abstract" could still become "Abstracts" on the next page)
+        for m in BOUNDARY_RE.finditer(window):
+            if not final and m.end() >= len(window):
+                resume = m.start()
+                break
+            at = scanned + m.start()
+            if at > start:
+                item = emit("".join(parts) + window[max(start - scanned, 0):m.start()])
+                if item:
+                    yield item
+                parts = []
+            start = at
+            last_end = m.end()
+
+        if final:
+            item = emit("".join(parts) + window[max(start - scanned, 0):])
+            if item:
+                yield item
+            return
+
+        # settle everything before the open tail (never inside the last match)
+        keep = max(open_tail(window, last_end) if resume is None else resume, last_end)
+        cut = max(start - scanned, 0)
+        if keep > cut:
+            parts.append(window[cut:keep])
+        tail = window[keep:]
+        scanned += keep
+        if start != cut_before:
+            # only the pages from the current paragraph's on
+            first_page = [num for off, num in offsets if off <= start][-1]
+            offsets = [(start, first_page)] + [(off, num) for off, num in offsets if off > start]
+
+def iter_pdf_paragraphs(pdf_path):
+    """
+    Stream indexed paragraphs from a PDF with bounded memory: the same dicts as
+    pdf_paragraphs ({"index", "page", "text"}, plus "page_breaks" when the
+    paragraph crosses a page).
+    """
+    for i, (page, text, breaks) in enumerate(split_paragraphs_stream(iter_pdf_pages(pdf_path))):
+        item = {"index": i, "page": page, "text": text}
+        if breaks:
+            item["page_breaks"] = breaks
+        yield item
+
+def normalized_offsets(raw_text, offsets):
+    """
+    Where each of the sorted offsets into raw_text lands in normalize_text(raw_text).
+    The text between two offsets is collapsed on its own and joined the way
+    split_paragraphs_stream joins pages, so this is one pass over raw_text.
+    """
+    mapped = []
+    length = 0
+    prev = 0
+    ends_with_space = False
+    for offset in offsets:
+        piece = WHITESPACE_RE.sub(" ", raw_text[prev:offset])
+        if ends_with_space and piece.startswith(" "):
+            piece = piece[1:]
+        if piece:
+            ends_with_space = piece.endswith(" ")
+        length += len(piece)
+        mapped.append(length)
+        prev = offset
+    # normalize_text strips the leading space (and the trailing one, hence the clamp)
+    lead = 1 if WHITESPACE_RE.match(raw_text) else 0
+    total = len(normalize_text(raw_text)) if mapped else 0
+    return [min(max(m - lead, 0), total) for m in mapped]
+
+@instrumented("split_into_paragraphs", count=lambda doc: len(doc.paragraphs))
+def paragraph_records(raw_text, page_offsets=None, font_runs=None, body_font_size=None):
+    """
+    CompactDocument over normalize_text(raw_text) with one Paragraph record per
+    paragraph split_into_paragraphs finds. For text from read_pdf (page_offsets) also
+      page         the page the paragraph starts on
+      page_breaks  [offset in the paragraph, page] for each later page it runs into
+    and, when read_pdf had layout:
+      font_size    size of the line the paragraph starts with
+      font_scale   font_size / body_font_size
+      font_run     how many characters from the start are set in font_size
+    """
+    text = normalize_text(raw_text or "")
+    doc = CompactDocument(text)
+    spans = paragraph_spans(text)
+    if page_offsets is None:
+        doc.paragraphs = [Paragraph(i, start, end) for i, (start, end) in enumerate(spans)]
+        return doc
+
+    page_starts = normalized_offsets(raw_text, page_offsets)
+    runs = font_runs or []
+    run_starts = normalized_offsets(raw_text, [at for at, _ in runs])
+
+    for i, (start, end) in enumerate(spans):
+        p = Paragraph(i, start, end, max(bisect.bisect_right(page_starts, start), 1))
+
+        breaks = []
+        for j in range(bisect.bisect_right(page_starts, start), bisect.bisect_left(page_starts, end)):
+            if breaks and breaks[-1][0] == page_starts[j] - start:
+                breaks.pop()  # empty pages in between
+            breaks.append([page_starts[j] - start, j + 1])
+        p.page_breaks = breaks or None
+
+        k = bisect.bisect_right(run_starts, start) - 1
+        if k >= 0 and body_font_size:
+            size = runs[k][1]
+            run_end = run_starts[k + 1] if k + 1 < len(run_starts) else len(text)
+            p.font_size = size
+            p.font_scale = round(size / body_font_size, 2)
+            p.font_run = min(run_end, end) - start
+        doc.paragraphs.append(p)
+    return doc
+
+def pdf_paragraphs(raw_text, page_offsets, font_runs=None, body_font_size=None):
+    """paragraph_records for text from read_pdf, as indexed paragraph dicts"""
+    return paragraph_records(raw_text, page_offsets, font_runs, body_font_size).to_dicts("paragraphs")
 
 def index_paragraphs(paragraphs):
     indexed = []
@@ -75,223 +383,298 @@ def save_json(obj, out_path):
 
 
 
-import re
-
-def clean_title(s):
-    s = re.sub(r'\s+', ' ', (s or "")).strip()
-    return s.rstrip(' .:;,-—')
+# a paragraph that starts in a font this much bigger than the body text is a
+# heading (title, unnumbered section), if that bigger run is short enough
+HEADING_FONT_SCALE = 1.2
+HEADING_FONT_MAX_CHARS = 200
 
-def heading_detection(indexed_paras):
-    known = [
-        "Abstract","Introduction","Methodology","Methods","Materials",
-        "Results","Discussion","Conclusion","Conclusions","References",
-        "Acknowledgements","Figures","Tables","Related work","Background",
-        "Experimental setup","Supplementary","Acknowledgments"
-    ]
+def _strip_span(s, start, end):
+    """(start, end) of s[start:end].strip()"""
+    while start < end and s[start].isspace():
+        start += 1
+    while end > start and s[end - 1].isspace():
+        end -= 1
+    return start, end
 
-    num_re = re.compile(r'^\s*(\d+(?:\.\d+)*)\.\s*(.+)$')
-    known_re = re.compile(r'^\s*(?:' + r'|'.join(re.escape(k) for k in known) + r')\b', re.I)
+def _first_word(s, start, end):
+    """(start, end) of s[start:end].split()[0], for a span that is already stripped"""
+    m = WHITESPACE_RE.search(s, start, end)
+    return start, m.start() if m else end
 
+@instrumented("heading_detection")
+def find_headings(doc, paragraphs=None):
+    """
+    Heading records for the paragraphs of a CompactDocument (default: all of
+    them). Titles are kept as offsets; clean_title runs when they are serialized.
+    """
     headings = []
 
-    for item in indexed_paras:
-        idx = item.get("index")
-        text = (item.get("text") or "").strip()
+    for p in doc.paragraphs if paragraphs is None else paragraphs:
+        # the paragraph string only lives for this iteration
+        para = doc.text[p.start:p.end]
+        text = para.strip()
         if not text:
             continue
+        base = p.start + len(para) - len(para.lstrip())
+
+        def heading(number, classification, start, end):
+            # short = first word of the title (usually the heading), full = the whole title
+            short_start, short_end = _first_word(text, start, end)
+            return Heading(p.index, number, classification,
+                           base + short_start, base + short_end, base + start, base + end)
 
         # -------- NUMBERED HEADING --------
         m = num_re.match(text)
         if m:
-            number = m.group(1)
-            rest = m.group(2).strip()
-
-            # short = first word of rest (usually the heading)
-            title_short = clean_title(rest.split()[0])
-
-            # full = entire remainder cleaned
-            title_full = clean_title(rest)
-
-            headings.append({
-                "index": idx,
-                "number": number,
-                "title_short": title_short,
-                "title_full": title_full,
-                "classification": "numbered",
-                "method": "num_re"
-            })
+            headings.append(heading(m.group(1), "numbered", *_strip_span(text, m.start(2), m.end(2))))
             continue
 
         # -------- KNOWN HEADING --------
-        k = known_re.match(text)
-        if k:
-            # short = the known heading word itself
-            title_short = clean_title(text.split()[0])
-
-            # full = entire paragraph cleaned
-            title_full = clean_title(text)
-
-            headings.append({
-                "index": idx,
-                "number": None,
-                "title_short": title_short,
-                "title_full": title_full,
-                "classification": "known",
-                "method": "known_re"
-            })
+        if known_re.match(text):
+            headings.append(heading(None, "known", 0, len(text)))
             continue
 
+        # -------- LARGE FONT --------
+        # only PDF paragraphs read with layout (paragraph_records) carry a font size
+        if p.font_scale and p.font_scale >= HEADING_FONT_SCALE:
+            end = len(text) if p.font_run is None else min(p.font_run, len(text))
+            title_full = clean_title(text[:end])
+            if title_full and len(title_full) <= HEADING_FONT_MAX_CHARS:
+                headings.append(heading(None, "font", 0, end))
+                continue
+
+        # -------- DOCX HEADING STYLE --------
+        # only paragraphs from docx_stream.index_docx_paragraphs carry a style
+        style = p.style or ""
+        if style.startswith("Heading") or style == "Title":
+            headings.append(heading(None, "style", 0, len(text)))
+
     return headings
 
-def detect_fig_table(indexed_paras):
+def heading_detection(indexed_paras):
+    """find_headings over indexed paragraph dicts, returned as heading dicts"""
+    doc = CompactDocument.from_paragraph_dicts(indexed_paras)
+    doc.headings = find_headings(doc)
+    return doc.to_dicts("headings")
+
+# merged PDF chunks can be megabytes long: only this much of a paragraph is
+# scanned for captions, and only this many "fig"/"table" words per type are
+# tried as caption heads (fixed limits, so the output never depends on load)
+CAPTION_SCAN_CHARS = 2_000_000
+CAPTION_SCAN_HEADS = 20_000
+
+# the case folding (?i) does for "fig"/"table", one character for one character
+# (so offsets stay valid); "İ" and "ı" match "i" under re.IGNORECASE as well
+CAPTION_FOLD = str.maketrans({c: c.lower() for c in "FIGTABLE"} | {"İ": "i", "ı": "i"})
+
+def caption_boundaries(text):
+    """
+    Offsets of every "fig" and every "table" in text, in any case: where a
+    caption head can start and where fig_re/table_re end a caption.
+    Returns (fig offsets, table offsets, all offsets sorted).
+    """
+    folded = text.translate(CAPTION_FOLD)
+    found = []
+    for word in ("fig", "table"):
+        offsets = []
+        i = folded.find(word)
+        while i != -1:
+            offsets.append(i)
+            i = folded.find(word, i + 1)
+        found.append(offsets)
+    return found[0], found[1], sorted(found[0] + found[1])
+
+def caption_spans(text, head_re, starts, boundaries):
+    """
+    (head_start, label, caption_start, end) for every caption head_re matches at
+    one of `starts`, the same spans fig_re/table_re find: each caption runs to the
+    first boundary after its first character, or to the end of the text.
+    """
+    spans = []
+    resume = 0
+    n = len(text)
+    for start in starts:
+        if start < resume:
+            # swallowed by the previous caption, as finditer would have skipped it
+            continue
+        m = head_re.match(text, start)
+        if m is None:
+            continue
+        cap = m.end()
+        if cap == n:
+            # the caption needs one character: only trailing whitespace can give it one
+            if not m.group(2):
+                continue
+            cap -= 1
+        i = bisect.bisect_right(boundaries, cap)
+        end = boundaries[i] if i < len(boundaries) else n
+        spans.append((start, m.group(1), cap, end))
+        resume = end
+    return spans
+
+@instrumented("detect_fig_table")
+def find_captions(doc, paragraphs=None):
+    """Caption records for the paragraphs of a CompactDocument (default: all of them)"""
     captions = []
 
-    fig_re = re.compile(
-    r'(?i)\b(?:figure|fig)\.?\s*(\d+)\s*[:\-\.]\s*(.+?)(?=Figure|Fig|Table|$)')
-
-    table_re = re.compile(
-    r'(?i)\btable\.?\s*(\d+)\s*[:\-\.]\s*(.+?)(?=Figure|Fig|Table|$)')
-
-
-    for item in indexed_paras:
-        idx = item["index"]
-        text = item["text"]
-
-        # ----- FIGURES: find ALL -----
-        for m in fig_re.finditer(text):
-            captions.append({
-                "index": idx,
-                "type": "figure",
-                "number": int(m.group(1)),
-                "text": m.group(0).strip(),
-                "caption_text": m.group(2).strip()
-            })
-
-        # ----- TABLES: find ALL -----
-        for m in table_re.finditer(text):
-            captions.append({
-                "index": idx,
-                "type": "table",
-                "number": int(m.group(1)),
-                "text": m.group(0).strip(),
-                "caption_text": m.group(2).strip()
-            })
+    for p in doc.paragraphs if paragraphs is None else paragraphs:
+        text = doc.text[p.start:min(p.end, p.start + CAPTION_SCAN_CHARS)]
+
+        if "\n" in text:
+            # "." in fig_re/table_re stops at line breaks; paragraphs from
+            # split_into_paragraphs never have any, so this is only a fallback
+            found = [(ctype, m.start(), m.group(1), m.start(2), m.end())
+                     for ctype, pattern in (("figure", fig_re), ("table", table_re))
+                     for m in pattern.finditer(text)]
+        else:
+            # find the keywords once, try a head only where one starts, slice between them
+            fig_at, table_at, boundaries = caption_boundaries(text)
+            found = [(ctype,) + span
+                     for ctype, head_re, starts in (("figure", fig_head_re, fig_at), ("table", table_head_re, table_at))
+                     for span in caption_spans(text, head_re, starts[:CAPTION_SCAN_HEADS], boundaries)]
+
+        # figures first, then tables, each in text order; "number" is the label without its sub-label
+        for ctype, start, label, cap, end in found:
+            number = int(caption_label_re.match(label).group(1))
+            captions.append(Caption(p.index, ctype, number, label, p.start + start, p.start + cap, p.start + end,
+                                    p.page_at(start)))
 
     return captions
 
+def detect_fig_table(indexed_paras):
+    """find_captions over indexed paragraph dicts, returned as caption dicts"""
+    doc = CompactDocument.from_paragraph_dicts(indexed_paras)
+    doc.captions = find_captions(doc)
+    return doc.to_dicts("captions")
 
-import re
 
-# ---------- Regex patterns ----------
-range_re = re.compile(r'(?i)\b(?:fig(?:ure)?|table)s?\.?\s*(\d+)\s*[–—-]\s*(\d+)\b')
-list_re = re.compile(r'(?i)\b(?:fig(?:ure)?|table)s?\.?\s*((?:\d+[a-z]?(?:\s*(?:,|and|&)\s*)?)+)\b')
-paren_re = re.compile(r'(?i)(?:\(|\b)(?:see|cf\.?|see also)?\s*(fig(?:ure)?|table)\.?\s*(\d+[a-z]?(?:\s*[–—-]\s*\d+)?)\b(?:\))?')
-single_re = re.compile(r'(?i)\b(?:fig(?:ure)?|table)\.?\s*(\d+[a-z]?)\b')
+# ref_re (patterns.py) matches a figure/table keyword followed by a number and any
+# further numbers joined by ranges ("1-3") or lists ("1, 2a and 4").
+# ranges wider than this are kept as their two endpoints ("Tables 1-2000" is not 2000 mentions)
+MAX_RANGE_EXPANSION = 50
 
 
 # ---------- Helper ----------
-def expand_list(s):
-    """Turn '1, 2a and 4' into ['1','2a','4']"""
-    parts = re.split(r'[,\s]+|and|&', s, flags=re.I)
-    return [p for p in (p.strip() for p in parts) if p]
-
-
-def detect_references(indexed_paras):
+def expand_ref_numbers(s):
+    """Turn '1-3, 5a and 7' into ['1','2','3','5a','7'] (ranges only between plain numbers)"""
+    nums = []
+    pending_range = False
+    for m in ref_token_re.finditer(s):
+        if m.group(2):
+            pending_range = bool(nums)
+            continue
+        num = m.group(1)
+        if pending_range and nums[-1].isdigit() and num.isdigit():
+            start, end = int(nums[-1]), int(num)
+            if start < end <= start + MAX_RANGE_EXPANSION:
+                nums.extend(str(n) for n in range(start + 1, end + 1))
+            else:
+                nums.append(num)
+        else:
+            nums.append(num)
+        pending_range = False
+
+    # "Figs. 1, 1 and 2" -> one reference per number
+    seen = set()
+    return [n for n in nums if not (n.lower() in seen or seen.add(n.lower()))]
+
+
+@instrumented("detect_references")
+def find_references(doc, paragraphs=None):
+    """
+    Reference records for the paragraphs of a CompactDocument (default: all of
+    them). Single pass over each paragraph: every mention ("Figure 2", "Fig. 1, 2
+    and 4", "Tables 1–3", "(see Fig. 2a)") is matched once and expanded into one
+    reference per number. start/end are the character span of the whole mention.
+
+    >>> doc = CompactDocument.from_paragraph_dicts([{"index": 0, "text": "Figure 1 and 2019 data, Tables 1, 2 and 3"}])
+    >>> [(r.ref_type, r.ref_number) for r in find_references(doc)]
+    [('figure', '1'), ('table', '1'), ('table', '2'), ('table', '3')]
+    """
     references = []
 
-    for item in indexed_paras:
-        idx = item.get("index")
-        text = (item.get("text") or "")
-        lower = text.lower()
-
-        # ---- 1) RANGES: 'Figure 1-3' → 1,2,3 ----
-        for m in range_re.finditer(text):
-            start = int(m.group(1))
-            end = int(m.group(2))
-            ref_type = "figure" if "fig" in m.group(0).lower() else "table"
-
-            for num in range(start, end + 1):
-                references.append({
-                    "index": idx,
-                    "ref_type": ref_type,
-                    "ref_number": str(num),
-                    "ref_text": f"{ref_type.capitalize()} {num}",
-                })
-
-        # ---- 2) LISTS: 'Fig. 1, 2a and 4' ----
-        for m in list_re.finditer(text):
-            ref_type = "figure" if "fig" in m.group(0).lower() else "table"
-            nums = expand_list(m.group(1))
-
-            for num in nums:
-                references.append({
-                    "index": idx,
-                    "ref_type": ref_type,
-                    "ref_number": num,
-                    "ref_text": f"{ref_type.capitalize()} {num}",
-                })
-
-        # ---- 3) Parenthetical: '(see Fig. 2a)' ----
-        for m in paren_re.finditer(text):
-            ref_type = "figure" if "fig" in m.group(0).lower() else "table"
-            val = m.group(2)
-
-            # could be a range inside parentheses
-            if re.search(r'[–—-]', val):
-                start, end = re.split(r'[–—-]', val)
-                start = int(start)
-                end = int(end)
-                for num in range(start, end + 1):
-                    references.append({
-                        "index": idx,
-                        "ref_type": ref_type,
-                        "ref_number": str(num),
-                        "ref_text": f"{ref_type.capitalize()} {num}",
-                    })
-            else:
-                references.append({
-                    "index": idx,
-                    "ref_type": ref_type,
-                    "ref_number": val,
-                    "ref_text": f"{ref_type.capitalize()} {val}",
-                })
-
-        # ---- 4) Single references: 'Figure 2a' ----
-        for m in single_re.finditer(text):
-            ref_type = "figure" if "fig" in m.group(0).lower() else "table"
-            num = m.group(1)
-
-            references.append({
-                "index": idx,
-                "ref_type": ref_type,
-                "ref_number": num,
-                "ref_text": f"{ref_type.capitalize()} {num}",
-            })
+    for p in doc.paragraphs if paragraphs is None else paragraphs:
+        text = doc.text[p.start:p.end]
+
+        for m in ref_re.finditer(text):
+            ref_type = "figure" if m.group(1) else "table"
+            page = p.page_at(m.start())
+            for num in expand_ref_numbers(m.group(2)):
+                references.append(Reference(p.index, ref_type, num, m.start(), m.end(), page))
 
     return references
 
-def build_captions_map(captions):
+def detect_references(indexed_paras):
+    """find_references over indexed paragraph dicts, returned as reference dicts"""
+    doc = CompactDocument.from_paragraph_dicts(indexed_paras)
+    doc.references = find_references(doc)
+    return doc.to_dicts("references")
+
+def caption_key(kind, number):
+    """("figure", "2a") -> ("figure", 2, "a"); None if number is not <digits>[letter]"""
+    m = caption_label_re.fullmatch(str(number).strip().lower())
+    return (kind.lower(), int(m.group(1)), m.group(2)) if m else None
+
+def captions_map(entries):
+    """(type, number, sub-label) -> paragraph index, from (type, label, index) entries; the first caption of a number wins"""
     m = {}
-    for c in captions:
-        key = f"{c['type'].capitalize()} {c['number']}"
-        if key not in m:
-            m[key] = c["index"]
-        return m
+    for kind, label, index in entries:
+        key = caption_key(kind, label)
+        if key and key not in m:
+            m[key] = index
+    return m
 
+def build_captions_map(captions):
+    """captions_map of caption dicts"""
+    return captions_map((c["type"], c.get("label", c["number"]), c["index"]) for c in captions)
+
+def resolve_caption(caption_map, ref_type, ref_number):
+    """Caption index for one reference: "Fig. 2a" uses a "2a" caption if there is one, else "2"."""
+    key = caption_key(ref_type, ref_number)
+    if key is None:
+        return None
+    found = caption_map.get(key)
+    if found is None and key[2]:
+        found = caption_map.get(key[:2] + ("",))
+    return found
+
+@instrumented("link_references")
 def link_references_to_captions(references,caption_map):
     link = []
     for r in references:
-        key = f"{r['type'].capitalize()} {r['number']}"
-        caption_index = caption_map.get(key)
+        caption_index = resolve_caption(caption_map, r["ref_type"], r["ref_number"])
         link.append({
             "ref_index" : r.get("index"),
-            "ref_text" : r.get("text"),
-            "ref_type" : r.get("type"),
-            "ref_number" : r.get("number"),
+            "ref_text" : r.get("ref_text"),
+            "ref_type" : r.get("ref_type"),
+            "ref_number" : r.get("ref_number"),
             "caption_index": caption_index
         })
     return link
 
+@instrumented("link_references")
+def link_records(captions, references):
+    """Caption index (or None) each Reference record links to, from the Caption records"""
+    caption_map = captions_map((c.type, c.label, c.index) for c in captions)
+    return [resolve_caption(caption_map, r.ref_type, r.ref_number) for r in references]
+
+def link_report(captions, links):
+    """
+    dangling: references whose caption was not found
+    unreferenced: captions no reference points at
+    """
+    linked = set()
+    for l in links:
+        key = caption_key(l["ref_type"], l["ref_number"])
+        if l.get("caption_index") is not None and key:
+            linked.add(key)
+            linked.add(key[:2] + ("",))
+    return {
+        "dangling": [l for l in links if l.get("caption_index") is None],
+        "unreferenced": [c for c in captions
+                         if caption_key(c["type"], c.get("label", c["number"])) not in linked],
+    }
+
 
 
 
@@ -301,208 +684,59 @@ def link_references_to_captions(references,caption_map):
 
     
 def main():
+    # imported here because pipeline builds on the functions above
+    from pipeline import Pipeline
+    from manifest_index import ManifestIndex, INDEX_PATH, INDEX_CSV_PATH
+    from stage_cache import file_hash
+    import argparse
+    import instrument
+
+    parser = argparse.ArgumentParser(description="Extract the sample PDF and DOCX into outputs/.")
+    parser.add_argument("--profile", action="store_true", help="record per-stage timings in the manifests")
+    parser.add_argument("--profile-memory", action="store_true", help="also record tracemalloc peaks (slower)")
+    parser.add_argument("--trace", default=None, help="write a Chrome trace JSON of the stages here")
+    parser.add_argument("--no-csv", action="store_true", help="only update the SQLite index, skip manifest_index.csv")
+    args = parser.parse_args()
+    profile = args.profile or args.profile_memory or bool(args.trace)
+
     if not os.path.exists(OUT_DIR):
         os.makedirs(OUT_DIR)
 
+    pipeline = Pipeline()
+
     print("Extracting PDF...")
-    pdf_text = extract_pdf_text(PDF_PATH)
+    pdf_result = pipeline.run(PDF_PATH, profile=profile, profile_memory=args.profile_memory)
 
     print("Extracting DOCX...")
-    docx_text = extract_docx_text(DOCX_PATH)
+    docx_result = pipeline.run(DOCX_PATH, profile=profile, profile_memory=args.profile_memory)
 
     print("\nPDF preview:")
-    print(pdf_text[:1000])
+    print(pdf_result.text[:1000])
 
     print("\nDOCX preview:")
-    print(docx_text[:1000])
-
- 
-    save_text(pdf_text, OUT_DIR + "/pdf_content.txt")
-    save_text(docx_text, OUT_DIR + "/docx_content.txt")
-    print("\nSaved raw text.")
-
-
-    pdf_paras = split_into_paragraphs(pdf_text)
-    docx_paras = split_into_paragraphs(docx_text)
-    print(f"PDF paragraphs: {len(pdf_paras)}, DOCX paragraphs: {len(docx_paras)}")
-
-
-    indexed_pdf = index_paragraphs(pdf_paras)
-    indexed_docx = index_paragraphs(docx_paras)
-
-    save_json(indexed_pdf, OUT_DIR + "/pdf_paragraphs.json")
-    save_json(indexed_docx, OUT_DIR + "/docx_paragraphs.json")
-    print("Saved paragraph JSONs.")
-
-    import json
-
-with open("outputs/pdf_paragraphs.json","r",encoding="utf-8") as f:
-    pdf_paragraphs = json.load(f)
-
-with open("outputs/docx_paragraphs.json","r",encoding="utf-8") as f:
-    docx_paragraphs = json.load(f)
-
-pdf_headings = heading_detection(pdf_paragraphs)
-docx_headings = heading_detection(docx_paragraphs)
-
-with open("outputs/pdf_headings.json","w",encoding="utf-8") as f:
-    json.dump(pdf_headings, f, indent=2, ensure_ascii=False)
-
-with open("outputs/docx_headings.json","w",encoding="utf-8") as f:
-    json.dump(docx_headings, f, indent=2, ensure_ascii=False)
-
-with open("outputs/pdf_paragraphs.json","r",encoding="utf-8") as f:
-    pdf_paragraphs = json.load(f)
-
-with open("outputs/docx_paragraphs.json","r",encoding="utf-8") as f:
-    docx_paragraphs = json.load(f)
-
-pdf_captions = detect_fig_table(pdf_paragraphs)
-docx_captions = detect_fig_table(docx_paragraphs)
-
-with open("outputs/pdf_captions.json", "w", encoding="utf-8") as f:
-    json.dump(pdf_captions, f, indent=2, ensure_ascii=False)
-
-with open("outputs/docx_captions.json", "w", encoding="utf-8") as f:
-    json.dump(docx_captions, f, indent=2, ensure_ascii=False)
-
-
-with open("outputs/pdf_paragraphs.json","r",encoding="utf-8") as f:
-    pdf_paragraphs = json.load(f)
-
-with open("outputs/docx_paragraphs.json","r",encoding="utf-8") as f:
-    docx_paragraphs = json.load(f)
-
-pdf_references = detect_fig_table(pdf_paragraphs)
-docx_references = detect_fig_table(docx_paragraphs)
-
-with open("outputs/pdf_references.json", "w", encoding="utf-8") as f:
-    json.dump(pdf_references, f, indent=2, ensure_ascii=False)
-
-with open("outputs/pdf_captions.json", "r", encoding="utf-8") as f:
-    pdf_captions = json.load(f)
-
-with open("outputs/pdf_references.json", "r", encoding="utf-8") as f:
-    pdf_references = json.load(f)
-
-with open("outputs/docx_captions.json", "r", encoding="utf-8") as f:
-    docx_captions = json.load(f)
-
-with open("outputs/docx_references.json", "r", encoding="utf-8") as f:
-    docx_references = json.load(f)
-
-
-pdf_caption_map = build_captions_map(pdf_captions)
-docx_caption_map = build_captions_map(docx_captions)
-
-pdf_links = link_references_to_captions(pdf_references, pdf_caption_map)
-docx_links = link_references_to_captions(docx_references, docx_caption_map)
-
-with open("outputs/pdf_references_links.json","w",encoding="utf-8") as f:
-    json.dump(pdf_links, f, indent=2, ensure_ascii = False)
-with open("outputs/docx_references_links.json","w",encoding="utf-8") as f:
-    json.dump(docx_links, f, indent=2, ensure_ascii = False)
-print("Refernces saved successfully!")
-
-with open("outputs/pdf_paragraphs.json", "r", encoding="utf-8") as f:
-        pdf_paragraphs = json.load(f)
-
-with open("outputs/pdf_headings.json", "r", encoding="utf-8") as f:
-        pdf_headings = json.load(f)
-
-with open("outputs/pdf_captions.json", "r", encoding="utf-8") as f:
-        pdf_captions = json.load(f)
-
-with open("outputs/pdf_references.json", "r", encoding="utf-8") as f:
-        pdf_references = json.load(f)
-
-pdf_doc = fitz.open("data/realistic_extraction_paper.pdf")
-pdf_page_count = len(pdf_doc)
-pdf_doc.close()
-
-with open("outputs/pdf_content.txt", "r", encoding="utf-8") as f:
-        pdf_text = f.read()
-        pdf_word_count = len(re.findall(r"\w+", pdf_text))
-
-with open("outputs/docx_paragraphs.json", "r", encoding="utf-8") as f:
-        docx_paragraphs = json.load(f)
-
-with open("outputs/docx_headings.json", "r", encoding="utf-8") as f:
-        docx_headings = json.load(f)
-
-with open("outputs/docx_captions.json", "r", encoding="utf-8") as f:
-        docx_captions = json.load(f)
-
-with open("outputs/docx_references.json", "r", encoding="utf-8") as f:
-        docx_references = json.load(f)
-
-with open("outputs/docx_content.txt", "r", encoding="utf-8") as f:
-        docx_text = f.read()
-        docx_word_count = len(re.findall(r"\w+", docx_text))
-pdf_manifest = {
-        "file_name": "realistic_extraction_paper.pdf",
-        "file_type": "pdf",
-        "page_count": pdf_page_count,
-        "word_count": pdf_word_count,
-        "paragraph_count": len(pdf_paragraphs),
-        "heading_count": len(pdf_headings),
-        "figure_caption_count": sum(1 for c in pdf_captions if c["type"] == "figure"),
-        "table_caption_count": sum(1 for c in pdf_captions if c["type"] == "table"),
-        "reference_count": len(pdf_references)
-    }
-docx_manifest = {
-        "file_name": "realistic_extraction_paper.docx",
-        "file_type": "docx",
-        "page_count": None,
-        "word_count": docx_word_count,
-        "paragraph_count": len(docx_paragraphs),
-        "heading_count": len(docx_headings),
-        "figure_caption_count": sum(1 for c in docx_captions if c["type"] == "figure"),
-        "table_caption_count": sum(1 for c in docx_captions if c["type"] == "table"),
-        "reference_count": len(docx_references)
-    }
-
-
-    
-with open("outputs/pdf_manifest.json", "w", encoding="utf-8") as f:
-        json.dump(pdf_manifest, f, indent=2, ensure_ascii=False)
-
-with open("outputs/docx_manifest.json", "w", encoding="utf-8") as f:
-        json.dump(docx_manifest, f, indent=2, ensure_ascii=False)
-
-
-import csv
-csv_header = [
-        "file_name", "file_type", "page_count", "word_count",
-        "paragraph_count", "heading_count",
-        "figure_caption_count", "table_caption_count",
-        "reference_count"
-    ]
-
-csv_exists = os.path.exists("outputs/manifest.csv")
-
-with open("outputs/manifest.csv", "a", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-
-       
-        if not csv_exists:
-            writer.writerow(csv_header)
-
-        writer.writerow([
-            pdf_manifest["file_name"], pdf_manifest["file_type"], pdf_manifest["page_count"],
-            pdf_manifest["word_count"], pdf_manifest["paragraph_count"],
-            pdf_manifest["heading_count"], pdf_manifest["figure_caption_count"],
-            pdf_manifest["table_caption_count"], pdf_manifest["reference_count"]
-        ])
-
-        writer.writerow([
-            docx_manifest["file_name"], docx_manifest["file_type"], docx_manifest["page_count"],
-            docx_manifest["word_count"], docx_manifest["paragraph_count"],
-            docx_manifest["heading_count"], docx_manifest["figure_caption_count"],
-            docx_manifest["table_caption_count"], docx_manifest["reference_count"]
-        ])
-
-print("Manifest generation complete.")
+    print(docx_result.text[:1000])
+
+    print(f"PDF paragraphs: {len(pdf_result.records.paragraphs)}, DOCX paragraphs: {len(docx_result.records.paragraphs)}")
+
+    # everything stays in memory until here; write the stage files once
+    pdf_result.write(OUT_DIR, "pdf", dump_intermediates=True)
+    docx_result.write(OUT_DIR, "docx", dump_intermediates=True)
+    print("Saved text, paragraphs, headings, captions, references and links.")
+
+    # upsert, so a rerun replaces this document's row instead of adding another
+    with ManifestIndex(INDEX_PATH) as index:
+        for r in (pdf_result, docx_result):
+            index.upsert(r.manifest(), r.source_path, r.content_hash or file_hash(r.source_path))
+        if not args.no_csv:
+            index.export_csv(INDEX_CSV_PATH)
+    print("Manifest generation complete.")
+
+    if args.trace:
+        events = []
+        for tid, r in enumerate([pdf_result, docx_result]):
+            events += instrument.chrome_trace_events(r.stages, r.file_name, tid=tid)
+        instrument.write_chrome_trace(events, args.trace)
+        print(f"Wrote trace {args.trace}")
 
 
 if __name__ == "__main__":
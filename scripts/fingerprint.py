@@ -0,0 +1,225 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import zlib
+from array import array
+
+from instrument import instrumented
+from patterns import WORD_RE
+
+FINGERPRINT_PATH = "outputs/batch/fingerprints.db"
+
+# MinHash signature: NUM_HASHES slots (one-permutation hashing: every shingle
+# is hashed once and lands in one slot), cut into BANDS bands of ROWS slots for
+# LSH. Two documents become candidates when one band matches; with 16 x 8 that
+# happens for ~95% of pairs at Jaccard 0.8 and ~0.1% at 0.4.
+NUM_HASHES = 128
+BANDS = 16
+ROWS = NUM_HASHES // BANDS
+SHINGLE_WORDS = 5
+NEAR_DUP_THRESHOLD = 0.8
+
+SLOT_BITS = NUM_HASHES.bit_length() - 1
+MAX_VALUE = (1 << (64 - SLOT_BITS)) - 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_key TEXT PRIMARY KEY,
+    exact_hash TEXT NOT NULL,
+    paragraph_count INTEGER,
+    signature BLOB,
+    detections BLOB,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_documents_exact ON documents (exact_hash);
+CREATE TABLE IF NOT EXISTS bands (
+    band INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    doc_key TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_bands_bucket ON bands (band, bucket);
+CREATE INDEX IF NOT EXISTS idx_bands_doc ON bands (doc_key);
+"""
+
+
+# ---------- Fingerprints ----------
+def _hash64(data):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+
+def exact_hash(texts):
+    """sha256 of the paragraph texts: equal for copies that split into the same paragraphs"""
+    h = hashlib.sha256()
+    for text in texts:
+        h.update(text.encode("utf-8"))
+        h.update(b"\n")
+    return h.hexdigest()
+
+
+def shingles(texts, size=SHINGLE_WORDS):
+    """Overlapping runs of `size` lower-cased words across the whole document (its paragraph texts)."""
+    words = [w for text in texts for w in WORD_RE.findall(text.lower())]
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def minhash(shingle_set):
+    """
+    NUM_HASHES-slot signature of a shingle set, or None if it is empty. The low
+    bits of a shingle's hash pick its slot, the rest is the value kept if it is
+    the smallest there. Empty slots borrow from the next filled one, so short
+    documents still compare slot by slot.
+    """
+    if not shingle_set:
+        return None
+    sig = [None] * NUM_HASHES
+    for s in shingle_set:
+        h = _hash64(s.encode("utf-8"))
+        slot, value = h & (NUM_HASHES - 1), h >> SLOT_BITS
+        if sig[slot] is None or value < sig[slot]:
+            sig[slot] = value
+    filled = [i for i, v in enumerate(sig) if v is not None]
+    for i in range(NUM_HASHES):
+        if sig[i] is None:
+            j = next((k for k in filled if k > i), filled[0])
+            # how far the borrowed value came keeps the borrowing itself consistent between documents
+            sig[i] = (sig[j] + ((j - i) % NUM_HASHES) * 0x9E3779B97F4A7C15) & MAX_VALUE
+    return sig
+
+
+def similarity(a, b):
+    """Estimated Jaccard similarity: the share of slots two signatures agree on."""
+    return sum(x == y for x, y in zip(a, b)) / NUM_HASHES
+
+
+def band_buckets(sig):
+    """(band, bucket) for each LSH band; bucket is a signed 64-bit hash of the band's slots."""
+    buckets = []
+    for band in range(BANDS):
+        rows = array("Q", sig[band * ROWS:(band + 1) * ROWS]).tobytes()
+        buckets.append((band, _hash64(rows) - (1 << 63)))
+    return buckets
+
+
+@instrumented("fingerprint")
+def fingerprint(texts):
+    """{"exact_hash", "paragraph_count", "signature"} of a document's paragraph texts, in order"""
+    texts = list(texts)
+    return {
+        "exact_hash": exact_hash(texts),
+        "paragraph_count": len(texts),
+        "signature": minhash(shingles(texts)),
+    }
+
+
+# ---------- Index ----------
+class FingerprintIndex:
+    """
+    Fingerprints of every document processed so far, kept in SQLite so they
+    persist across runs and can be shared by the worker processes of a batch.
+    Each document also stores its detection outputs and paragraph hashes
+    (zlib-compressed JSON), which is what a later duplicate reuses.
+    """
+
+    def __init__(self, path=FINGERPRINT_PATH, threshold=NEAR_DUP_THRESHOLD):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.threshold = threshold
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def close(self):
+        self.conn.close()
+
+    def add(self, doc_key, fp, detections):
+        sig = fp["signature"]
+        blob = array("Q", sig).tobytes() if sig else None
+        packed = zlib.compress(json.dumps(detections, ensure_ascii=False).encode("utf-8"))
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?)",
+                (doc_key, fp["exact_hash"], fp["paragraph_count"], blob, packed, time.time()))
+            self.conn.execute("DELETE FROM bands WHERE doc_key = ?", (doc_key,))
+            if sig:
+                self.conn.executemany("INSERT INTO bands VALUES (?, ?, ?)",
+                                      [(band, bucket, doc_key) for band, bucket in band_buckets(sig)])
+
+    def remove(self, doc_key):
+        with self.conn:
+            self.conn.execute("DELETE FROM documents WHERE doc_key = ?", (doc_key,))
+            self.conn.execute("DELETE FROM bands WHERE doc_key = ?", (doc_key,))
+
+    def find(self, fp, exclude=None):
+        """
+        Best earlier copy of a document: {"doc", "similarity", "exact", "paragraph_count"}
+        or None. An identical paragraph hash wins; otherwise LSH candidates are
+        compared by signature and the most similar one above threshold is returned.
+        """
+        row = self.conn.execute(
+            "SELECT doc_key, paragraph_count FROM documents WHERE exact_hash = ? AND doc_key != ? LIMIT 1",
+            (fp["exact_hash"], exclude or "")).fetchone()
+        if row:
+            return {"doc": row[0], "similarity": 1.0, "exact": True, "paragraph_count": row[1]}
+        sig = fp["signature"]
+        if not sig:
+            return None
+
+        candidates = set()
+        for band, bucket in band_buckets(sig):
+            candidates.update(r[0] for r in self.conn.execute(
+                "SELECT doc_key FROM bands WHERE band = ? AND bucket = ?", (band, bucket)))
+        candidates.discard(exclude)
+
+        best = None
+        for doc_key in candidates:
+            blob, count = self.conn.execute(
+                "SELECT signature, paragraph_count FROM documents WHERE doc_key = ?", (doc_key,)).fetchone()
+            sim = similarity(sig, array("Q", blob))
+            if sim >= self.threshold and (best is None or sim > best["similarity"]):
+                best = {"doc": doc_key, "similarity": round(sim, 3), "exact": False, "paragraph_count": count}
+        return best
+
+    def detections(self, doc_key):
+        row = self.conn.execute("SELECT detections FROM documents WHERE doc_key = ?", (doc_key,)).fetchone()
+        return json.loads(zlib.decompress(row[0])) if row and row[0] else None
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Look up documents in the near-duplicate fingerprint index.")
+    parser.add_argument("documents", nargs="*", help="PDF/DOCX files to check against the index")
+    parser.add_argument("--index", default=FINGERPRINT_PATH)
+    parser.add_argument("--threshold", type=float, default=NEAR_DUP_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    from pipeline import Pipeline
+    with FingerprintIndex(args.index, args.threshold) as index:
+        print(f"{index.count()} documents fingerprinted in {args.index}")
+        pipeline = Pipeline()
+        for path in args.documents:
+            result = pipeline.extract(path)
+            pipeline.split(result)
+            match = index.find(fingerprint(result.records.paragraph_texts()), exclude=os.path.normpath(path))
+            if match:
+                kind = "exact copy" if match["exact"] else f"near-duplicate ({match['similarity']:.2f})"
+                print(f"{path}: {kind} of {match['doc']}")
+            else:
+                print(f"{path}: no duplicate")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import contextlib
+import functools
+import json
+import os
+import time
+import tracemalloc
+
+# The recorder for the document currently being processed (None = disabled).
+# When disabled, an instrumented function costs one global lookup and a call.
+_active = None
+
+
+class Recorder:
+    """
+    Collects one record per stage: wall/CPU time, item count and (opt-in) peak memory.
+    A stage that runs inside another one (extract_docx_text_fast falling back to
+    extract_docx_text) is recorded with "parent": the outer stage's name. Its
+    time is already part of the parent's, so stage_columns leaves it out.
+    """
+
+    def __init__(self, doc=None, memory=False):
+        self.doc = doc
+        self.memory = memory
+        self.stages = []
+        self.active = []  # stages entered and not yet exited, innermost last
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+
+class _Stage:
+    __slots__ = ("recorder", "name", "items", "parent", "_ts", "_t0", "_c0", "_m0", "_peak")
+
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+        self.items = None
+        self.parent = None
+
+    def __enter__(self):
+        active = self.recorder.active
+        self.parent = active[-1] if active else None
+        active.append(self)
+        if self.recorder.memory:
+            # peak is measured per stage, relative to what was allocated before it;
+            # resetting it would lose the outer stage's peak so far, so keep that first
+            if self.parent is not None:
+                self.parent._peak = max(self.parent._peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            self._m0 = tracemalloc.get_traced_memory()[0]
+            self._peak = self._m0
+        self._ts = time.time()
+        self._c0 = time.process_time()
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self._t0
+        cpu = time.process_time() - self._c0
+        record = {
+            "stage": self.name,
+            "start": self._ts,
+            "wall_ms": round(wall * 1000, 3),
+            "cpu_ms": round(cpu * 1000, 3),
+            "items": self.items,
+        }
+        if self.parent is not None:
+            record["parent"] = self.parent.name
+        if self.recorder.memory:
+            peak = max(self._peak, tracemalloc.get_traced_memory()[1])
+            record["peak_kb"] = round((peak - self._m0) / 1024, 1)
+            if self.parent is not None:
+                self.parent._peak = max(self.parent._peak, peak)
+        if exc_type is not None:
+            record["error"] = exc_type.__name__
+        self.recorder.active.pop()
+        self.recorder.stages.append(record)
+        return False
+
+
+@contextlib.contextmanager
+def recording(doc=None, memory=False):
+    """
+    with recording(doc="paper.pdf", memory=True) as rec:
+        ... run pipeline functions ...
+    rec.stages -> list of stage records
+    """
+    global _active
+    rec = Recorder(doc, memory)
+    prev = _active
+    _active = rec
+    started = memory and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        yield rec
+    finally:
+        _active = prev
+        if started:
+            tracemalloc.stop()
+
+
+def stage(name):
+    """Context manager for code that is not a single function; no-op when disabled."""
+    if _active is None:
+        return _NullStage()
+    return _active.stage(name)
+
+
+class _NullStage:
+    __slots__ = ("items",)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+def instrumented(name, count=len):
+    """Decorator: record fn as stage `name` while a recording is active; count(result) -> items"""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            rec = _active
+            if rec is None:
+                return fn(*args, **kwargs)
+            with rec.stage(name) as s:
+                result = fn(*args, **kwargs)
+                s.items = count(result)
+            return result
+        return inner
+    return wrap
+
+
+# ---------- Output ----------
+def stage_columns(stages):
+    """Flatten stage records into manifest.csv columns: {"<stage>_ms": wall, ...} (nested stages left out)"""
+    cols = {}
+    for s in stages or []:
+        if s.get("parent"):
+            continue
+        key = s["stage"] + "_ms"
+        cols[key] = round(cols.get(key, 0) + s["wall_ms"], 3)
+        if "peak_kb" in s:
+            cols[s["stage"] + "_peak_kb"] = max(cols.get(s["stage"] + "_peak_kb", 0), s["peak_kb"])
+    return cols
+
+
+def chrome_trace_events(stages, doc, pid=None, tid=0):
+    """Stage records -> Chrome trace "complete" events (open in chrome://tracing or Perfetto)."""
+    pid = pid if pid is not None else os.getpid()
+    events = []
+    for s in stages or []:
+        args = {"doc": doc, "items": s.get("items"), "cpu_ms": s.get("cpu_ms")}
+        if s.get("parent"):
+            args["parent"] = s["parent"]
+        if "peak_kb" in s:
+            args["peak_kb"] = s["peak_kb"]
+        events.append({
+            "name": s["stage"],
+            "cat": "pipeline",
+            "ph": "X",
+            "ts": int(s["start"] * 1_000_000),
+            "dur": int(s["wall_ms"] * 1000),
+            "pid": pid,
+            "tid": tid,
+            "args": args,
+        })
+    return events
+
+
+def write_chrome_trace(events, out_path):
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
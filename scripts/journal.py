@@ -0,0 +1,275 @@
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from multiprocessing.connection import wait
+
+from batch import process_document, write_batch_manifest, BATCH_OUT_DIR
+from manifest_index import ManifestIndex
+
+JOURNAL_NAME = "journal.jsonl"
+DOC_TIMEOUT = 600.0
+MAX_RETRIES = 2
+
+# states a document is not processed again from (until the file changes)
+FINAL_STATES = ("metadata_written", "quarantined")
+
+
+def file_stamp(path):
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+# ---------- Journal ----------
+class Journal:
+    """
+    Append-only JSONL log of what happened to every document:
+
+        queued -> extracted -> detected -> metadata_written
+        ... -> failed (queued again) -> ... -> quarantined
+
+    Each line is flushed and fsynced before the run moves on, so after a crash
+    or a kill the journal says which documents are finished. A torn last line
+    is skipped on replay. A document whose file changed (mtime/size) since it
+    was journaled starts over with no failed attempts.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.docs = {}  # path -> {"state", "stamp", "attempts", "error", "manifest"}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self._apply(json.loads(line))
+                    except (ValueError, KeyError):
+                        continue
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.f = open(path, "a", encoding="utf-8")
+
+    def close(self):
+        self.f.close()
+
+    def _apply(self, record):
+        doc = self.docs.setdefault(record["path"], {
+            "state": None, "stamp": None, "attempts": 0, "error": None, "manifest": None
+        })
+        state = record["state"]
+        if state == "queued" and record.get("stamp") != doc["stamp"]:
+            doc.update(stamp=record.get("stamp"), attempts=0, error=None, manifest=None)
+        elif state == "failed":
+            doc["attempts"] += 1
+            doc["error"] = record.get("error")
+        elif state == "metadata_written":
+            doc["manifest"] = record.get("manifest")
+            doc["error"] = None
+        doc["state"] = state
+
+    def record(self, path, state, **fields):
+        record = {"time": round(time.time(), 3), "path": path, "state": state}
+        record.update(fields)
+        self.f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self._apply(record)
+
+    def pending(self, path, stamp):
+        """Does this document still need processing?"""
+        doc = self.docs.get(path)
+        if doc is None or doc["stamp"] != stamp or doc["state"] not in FINAL_STATES:
+            return True
+        # documents are only journaled once their shard is committed, so a missing
+        # shard was removed after the run
+        shard = (doc["manifest"] or {}).get("shard")
+        return bool(shard) and not os.path.exists(shard)
+
+    def counts(self):
+        counts = {}
+        for doc in self.docs.values():
+            counts[doc["state"]] = counts.get(doc["state"], 0) + 1
+        return counts
+
+
+# ---------- Workers ----------
+def _work(conn, out_dir, options):
+    """Worker process: takes paths from conn until it gets None, reports every state back."""
+    while True:
+        try:
+            path = conn.recv()
+        except EOFError:
+            return
+        if path is None:
+            return
+        try:
+            manifest = process_document(path, out_dir, progress=lambda state: conn.send(("state", path, state)),
+                                        **options)
+            conn.send(("done", path, manifest))
+        except Exception as e:
+            conn.send(("failed", path, f"{type(e).__name__}: {e}"))
+
+
+class Worker:
+    """One worker process and the document it is on; killed and replaced when that takes too long."""
+
+    def __init__(self, out_dir, options):
+        self.conn, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_work, args=(child, out_dir, options))
+        self.process.start()
+        child.close()
+        self.path = None
+        self.deadline = None
+
+    def assign(self, path, timeout):
+        self.conn.send(path)
+        self.path = path
+        self.deadline = time.monotonic() + timeout
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.kill()
+
+
+# ---------- Journaled batch ----------
+def run_journaled(paths, out_dir=BATCH_OUT_DIR, workers=None, index_path=None, shards=None,
+                  journal_path=None, timeout=DOC_TIMEOUT, retries=MAX_RETRIES, **options):
+    """
+    run_batch that can be killed and started again. Documents the journal
+    (default <out_dir>/journal.jsonl) already has as metadata_written or
+    quarantined are skipped. Each document gets `timeout` wall-clock seconds;
+    a worker that overruns is killed and replaced. A failed document is retried
+    `retries` times, then quarantined. shards works as in run_batch.
+    Returns the per-document results of this run and the earlier ones.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    if shards is not None:
+        options["output"] = "jsonl"
+    journal = Journal(journal_path or os.path.join(out_dir, JOURNAL_NAME))
+    index = ManifestIndex(index_path or os.path.join(out_dir, "manifest.db"))
+
+    todo = deque()
+    for path in paths:
+        stamp = file_stamp(path)
+        if journal.pending(path, stamp):
+            journal.record(path, "queued", stamp=stamp)
+            todo.append(path)
+
+    # (path, manifest) of documents whose records are in the shard still being
+    # written: journaling them before it is committed would let a crash lose
+    # records the next run takes as written
+    unjournaled = []
+
+    def finished(path, manifest):
+        journal.record(path, "metadata_written", manifest=manifest)
+        index.upsert(manifest)
+
+    def committed():
+        for item in unjournaled:
+            finished(*item)
+        unjournaled.clear()
+
+    def fail(path, error):
+        journal.record(path, "failed", error=error, attempt=journal.docs[path]["attempts"] + 1)
+        if journal.docs[path]["attempts"] > retries:
+            journal.record(path, "quarantined", error=error)
+            print(f"  quarantined {path}: {error}")
+        else:
+            todo.append(path)
+
+    pool = [Worker(out_dir, options) for _ in range(min(workers or os.cpu_count() or 1, len(todo)))]
+    try:
+        while True:
+            for w in pool:
+                if w.path is None and todo:
+                    w.assign(todo.popleft(), timeout)
+            busy = [w for w in pool if w.path is not None]
+            if not busy:
+                break
+
+            now = time.monotonic()
+            ready = wait([w.conn for w in busy], timeout=max(min(w.deadline for w in busy) - now, 0))
+            for w in busy:
+                if w.conn not in ready:
+                    continue
+                try:
+                    while w.conn.poll():
+                        kind, path, payload = w.conn.recv()
+                        if kind == "state":
+                            journal.record(path, payload)
+                            continue
+                        if kind == "done":
+                            if "record" in payload:
+                                shard_count = len(shards.written)
+                                payload["shard"] = shards.write(payload.pop("record"))
+                                unjournaled.append((path, payload))
+                                if len(shards.written) > shard_count:
+                                    committed()
+                            else:
+                                finished(path, payload)
+                        else:
+                            fail(path, payload)
+                        w.path = None
+                except (EOFError, OSError):
+                    # the worker died (a crash inside fitz, the OOM killer, ...)
+                    w.kill()
+                    pool[pool.index(w)] = Worker(out_dir, options)
+                    if w.path is not None:
+                        fail(w.path, f"worker exited with code {w.process.exitcode}")
+
+            now = time.monotonic()
+            for i, w in enumerate(pool):
+                if w.path is not None and now > w.deadline:
+                    w.kill()
+                    pool[i] = Worker(out_dir, options)
+                    fail(w.path, f"timed out after {timeout}s")
+    finally:
+        for w in pool:
+            w.stop()
+        if shards is not None:
+            shards.close()
+            committed()
+        index.close()
+        journal.close()
+
+    results = []
+    for path in paths:
+        doc = journal.docs.get(path) or {}
+        if doc.get("state") == "metadata_written" and doc.get("manifest"):
+            results.append(doc["manifest"])
+        elif doc.get("state") == "quarantined":
+            results.append({"file_name": os.path.basename(path), "source_path": path, "error": doc["error"]})
+    results.sort(key=lambda r: r.get("prefix") or r["file_name"])
+    write_batch_manifest(results, os.path.join(out_dir, "batch_manifest.csv"))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show the state of a journaled batch run.")
+    parser.add_argument("journal", nargs="?", default=os.path.join(BATCH_OUT_DIR, JOURNAL_NAME))
+    parser.add_argument("--state", default=None, help="list the documents in this state (e.g. quarantined)")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.journal):
+        parser.error(f"no journal at {args.journal}")
+    journal = Journal(args.journal)
+    journal.close()
+    print(", ".join(f"{state}: {n}" for state, n in sorted(journal.counts().items())))
+    if args.state:
+        for path, doc in sorted(journal.docs.items()):
+            if doc["state"] == args.state:
+                print(f"{path}\tattempts={doc['attempts']}\t{doc['error'] or ''}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+import argparse
+import csv
+import json
+import os
+import re
+import sqlite3
+import time
+
+from build_metadata import MANIFEST_FIELDS
+from instrument import stage_columns
+
+INDEX_PATH = "outputs/manifest.db"
+# not outputs/manifest.csv: read-files.py writes that one with its own columns
+INDEX_CSV_PATH = "outputs/manifest_index.csv"
+
+COUNT_FIELDS = [
+    "page_count", "word_count", "paragraph_count", "heading_count",
+    "figure_caption_count", "table_caption_count", "reference_count"
+]
+
+# documents are keyed by doc_key (normalized source path, or file name when unknown)
+COLUMNS = ["doc_key", "file_name", "content_hash", "file_type"] + COUNT_FIELDS + ["total_ms", "stages", "updated_at"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_key TEXT PRIMARY KEY,
+    file_name TEXT NOT NULL,
+    content_hash TEXT,
+    file_type TEXT,
+    page_count INTEGER,
+    word_count INTEGER,
+    paragraph_count INTEGER,
+    heading_count INTEGER,
+    figure_caption_count INTEGER,
+    table_caption_count INTEGER,
+    reference_count INTEGER,
+    total_ms REAL,
+    stages TEXT,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_documents_hash ON documents (content_hash);
+CREATE INDEX IF NOT EXISTS idx_documents_type ON documents (file_type);
+""" + "".join(
+    f"CREATE INDEX IF NOT EXISTS idx_documents_{c} ON documents ({c});\n" for c in COUNT_FIELDS
+)
+
+UPSERT = (
+    f"INSERT INTO documents ({', '.join(COLUMNS)}) VALUES ({', '.join('?' for _ in COLUMNS)}) "
+    f"ON CONFLICT(doc_key) DO UPDATE SET "
+    + ", ".join(f"{c} = excluded.{c}" for c in COLUMNS[1:])
+)
+
+# "table_caption_count>5", "file_type=pdf", "word_count<=100"
+CONDITION_RE = re.compile(r'^\s*(\w+)\s*(>=|<=|!=|=|>|<)\s*(.+?)\s*$')
+
+
+def _row(manifest, source_path=None, content_hash=None):
+    source_path = source_path or manifest.get("source_path")
+    stages = manifest.get("stages")
+    return (
+        os.path.normpath(source_path) if source_path else manifest["file_name"],
+        manifest["file_name"],
+        content_hash or manifest.get("content_hash"),
+        manifest.get("file_type"),
+        *[manifest.get(c) for c in COUNT_FIELDS],
+        round(sum(s["wall_ms"] for s in stages), 3) if stages else manifest.get("total_ms"),
+        json.dumps(stages) if stages else None,
+        time.time(),
+    )
+
+
+def parse_condition(text):
+    """'table_caption_count>5' -> ("table_caption_count", ">", 5)"""
+    m = CONDITION_RE.match(text)
+    if not m or m.group(1) not in COLUMNS:
+        raise ValueError(f"bad condition {text!r} (columns: {', '.join(COLUMNS)})")
+    column, op, value = m.groups()
+    if column in COUNT_FIELDS or column in ("total_ms", "updated_at"):
+        try:
+            value = float(value) if "." in value else int(value)
+        except ValueError:
+            raise ValueError(f"bad condition {text!r} ({column} takes a number)") from None
+    return column, op, value
+
+
+class ManifestIndex:
+    """
+    SQLite index of document manifests. Reruns update a document's row in
+    place (upsert on doc_key) instead of appending a duplicate.
+    """
+
+    def __init__(self, path=INDEX_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def close(self):
+        self.conn.close()
+
+    # ----- writes -----
+    def upsert(self, manifest, source_path=None, content_hash=None):
+        with self.conn:
+            self.conn.execute(UPSERT, _row(manifest, source_path, content_hash))
+
+    def upsert_many(self, manifests):
+        """One transaction for many manifests (each may carry source_path/content_hash keys)."""
+        with self.conn:
+            self.conn.executemany(UPSERT, [_row(m) for m in manifests])
+
+    def delete(self, doc_key):
+        with self.conn:
+            self.conn.execute("DELETE FROM documents WHERE doc_key = ?", (doc_key,))
+
+    # ----- reads -----
+    def get(self, doc_key):
+        row = self.conn.execute("SELECT * FROM documents WHERE doc_key = ?", (doc_key,)).fetchone()
+        return dict(row) if row else None
+
+    def query(self, conditions=(), order_by=None, descending=False, limit=None):
+        """
+        conditions: strings like "table_caption_count>5" or (column, op, value) tuples, ANDed.
+        Returns a list of row dicts.
+        """
+        where = []
+        params = []
+        for cond in conditions:
+            column, op, value = parse_condition(cond) if isinstance(cond, str) else cond
+            if column not in COLUMNS:
+                raise ValueError(f"unknown column {column!r}")
+            where.append(f"{column} {op} ?")
+            params.append(value)
+
+        sql = "SELECT * FROM documents"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        if order_by:
+            if order_by not in COLUMNS:
+                raise ValueError(f"unknown column {order_by!r}")
+            sql += f" ORDER BY {order_by}" + (" DESC" if descending else "")
+        if limit:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        return [dict(r) for r in self.conn.execute(sql, params)]
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    # ----- CSV -----
+    def export_csv(self, csv_path, rows=None):
+        """Write a manifest CSV from the index, one row per document (plus <stage>_ms columns if profiled)."""
+        rows = self.query(order_by="doc_key") if rows is None else rows
+        flat = []
+        header = MANIFEST_FIELDS + ["content_hash", "total_ms"]
+        for r in rows:
+            r = dict(r, **stage_columns(json.loads(r["stages"]) if r.get("stages") else None))
+            header += [k for k in r if k.endswith(("_ms", "_peak_kb")) and k not in header]
+            flat.append(r)
+
+        os.makedirs(os.path.dirname(csv_path) or ".", exist_ok=True)
+        with open(csv_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            for r in flat:
+                writer.writerow([r.get(k) for k in header])
+        return len(rows)
+
+    def import_csv(self, csv_path):
+        """Load an existing manifest.csv (rows keyed by file name); duplicate rows collapse."""
+        with open(csv_path, "r", newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            if reader.fieldnames[:len(MANIFEST_FIELDS)] != MANIFEST_FIELDS:
+                raise ValueError(f"{csv_path} does not have the manifest header")
+            manifests = []
+            for r in reader:
+                m = {k: (r.get(k) or None) for k in r}
+                for c in COUNT_FIELDS:
+                    m[c] = int(m[c]) if m.get(c) not in (None, "") else None
+                manifests.append(m)
+        self.upsert_many(manifests)
+        return len(manifests)
+
+
+def print_rows(rows, columns=("doc_key", "file_type") + tuple(COUNT_FIELDS)):
+    print("\t".join(columns))
+    for r in rows:
+        print("\t".join("" if r[c] is None else str(r[c]) for c in columns))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query the SQLite manifest index.")
+    parser.add_argument("--db", default=INDEX_PATH)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    q = sub.add_parser("query", help='e.g. query "table_caption_count>5" "file_type=pdf"')
+    q.add_argument("conditions", nargs="*")
+    q.add_argument("--order-by", default=None)
+    q.add_argument("--desc", action="store_true")
+    q.add_argument("--limit", type=int, default=None)
+
+    g = sub.add_parser("show", help="one document by doc_key")
+    g.add_argument("doc_key")
+
+    e = sub.add_parser("export-csv", help="write the index as a manifest CSV")
+    e.add_argument("csv_path")
+
+    i = sub.add_parser("import-csv", help="load an existing manifest.csv")
+    i.add_argument("csv_path")
+
+    args = parser.parse_args(argv)
+    with ManifestIndex(args.db) as index:
+        if args.command == "query":
+            try:
+                rows = index.query(args.conditions, args.order_by, args.desc, args.limit)
+            except ValueError as e:
+                parser.error(str(e))
+            print_rows(rows)
+            print(f"{len(rows)} of {index.count()} documents")
+        elif args.command == "show":
+            row = index.get(args.doc_key)
+            print(json.dumps(row, indent=2) if row else f"{args.doc_key} not found")
+        elif args.command == "export-csv":
+            print(f"Wrote {index.export_csv(args.csv_path)} rows to {args.csv_path}")
+        elif args.command == "import-csv":
+            print(f"Imported {index.import_csv(args.csv_path)} rows")
+
+
+if __name__ == "__main__":
+    main()
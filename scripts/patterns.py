@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import re
+
+# Every regular expression the pipeline matches with, compiled once at import.
+# PATTERNS maps a name to the compiled pattern for code that wants to look
+# patterns up (or benchmark them) by name; modules import the constants.
+PATTERNS = {}
+
+
+def register(name, pattern, flags=0):
+    compiled = re.compile(pattern, flags)
+    PATTERNS[name] = compiled
+    return compiled
+
+
+# ---------- Heading vocabulary ----------
+# Section titles live in headings.json (or the file HEADINGS_CONFIG names):
+# "known" are classified as headings at the start of a paragraph (any case),
+# "boundaries" also cut paragraphs wherever they occur in the text (exact case).
+HEADINGS_CONFIG = os.environ.get("HEADINGS_CONFIG") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "headings.json")
+
+
+def load_vocabulary(path=HEADINGS_CONFIG):
+    """(known headings, boundary headings) from a vocabulary file; boundaries are known headings too."""
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    boundaries = list(config.get("boundaries", []))
+    known = list(config.get("known", []))
+    known += [b for b in boundaries if b not in known]
+    return known, boundaries
+
+
+def trie_pattern(words, fold=False):
+    """
+    Regex source matching any of words, laid out as their trie: every branch
+    point tests the next character once, so a match costs the length of the
+    word found however many words there are (an alternation of the words
+    would try them one by one). fold=True merges words that differ in case,
+    for patterns compiled with re.I.
+    """
+    root = {}
+    for word in words:
+        node = root
+        for ch in (word.lower() if fold else word):
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def emit(node):
+        parts = [re.escape(ch) + emit(child) for ch, child in sorted(node.items()) if ch]
+        if not parts:
+            return ""
+        body = parts[0] if len(parts) == 1 else "(?:" + "|".join(parts) + ")"
+        # a word ending here with longer ones going on: the rest is optional
+        return f"(?:{body})?" if "" in node else body
+
+    return emit(root)
+
+
+KNOWN_HEADINGS, BOUNDARY_HEADINGS = load_vocabulary()
+
+# goes into the stage cache signature of paragraphs and headings: editing the
+# vocabulary invalidates them like a version bump would
+VOCABULARY_DIGEST = hashlib.sha256(
+    json.dumps([KNOWN_HEADINGS, BOUNDARY_HEADINGS]).encode("utf-8")).hexdigest()[:12]
+
+
+# ---------- Text ----------
+WHITESPACE_RE = register("whitespace", r"\s+")
+WORD_RE = register("word", r"\w+")
+
+# where split_into_paragraphs cuts: boundary headings and numbered headings
+BOUNDARY_RE = register(
+    "paragraph_boundary",
+    (r"(?:" + trie_pattern(BOUNDARY_HEADINGS) + r")\b|" if BOUNDARY_HEADINGS else "")
+    + r"\d+(?:\.\d+)*\.\s+[A-Z]")
+
+
+# ---------- Headings ----------
+num_re = register("numbered_heading", r'^\s*(\d+(?:\.\d+)*)\.\s*(.+)$')
+# (?!) never matches: an empty vocabulary classifies nothing
+known_re = register("known_heading", r'^\s*(?:' + (trie_pattern(KNOWN_HEADINGS, fold=True) or "(?!)") + r')\b', re.I)
+
+
+# ---------- Captions ----------
+# A caption is a head ("Figure 3:", "Table 2.") and everything up to the next
+# "fig"/"table" (any case) or the end of the paragraph. fig_re/table_re say that
+# in one regex; detect_fig_table finds the "fig"/"table" offsets once, matches
+# the head patterns only there and slices between them (same matches, one pass).
+# Group 1 is the label: the number and an optional sub-label letter ("2a").
+fig_re = register("figure_caption", r'(?i)\b(?:figure|fig)\.?\s*(\d+[a-z]?)\s*[:\-\.]\s*(.+?)(?=Figure|Fig|Table|$)')
+table_re = register("table_caption", r'(?i)\btable\.?\s*(\d+[a-z]?)\s*[:\-\.]\s*(.+?)(?=Figure|Fig|Table|$)')
+
+# group 2 is the whitespace after the separator (the caption may have to give one back)
+fig_head_re = register("figure_caption_head", r'(?i)\b(?:figure|fig)\.?\s*(\d+[a-z]?)\s*[:\-\.](\s*)')
+table_head_re = register("table_caption_head", r'(?i)\btable\.?\s*(\d+[a-z]?)\s*[:\-\.](\s*)')
+
+caption_label_re = register("caption_label", r'(\d+)([a-z]?)')
+
+
+# ---------- References ----------
+# One combined pattern: a figure/table keyword followed by a number and any
+# further numbers joined by ranges ("1-3") or lists ("1, 2a and 4").
+# Covers what used to be four separate passes (range, list, parenthetical, single).
+# A list only goes on with numbers of up to three digits, so the year in
+# "Figure 1 and 2019 data" is not read as Figure 2019.
+REF_NUM = r'\d+[a-z]?'
+REF_LIST_NUM = r'\d{1,3}(?!\d)[a-z]?'
+REF_RANGE = r'\s*[–—-]\s*' + REF_NUM
+REF_LIST = r'\s*(?:,\s*(?:and\b|&)?|and\b|&)\s*' + REF_LIST_NUM
+ref_re = register(
+    "reference",
+    r'(?i)\b(?:(fig(?:ure)?s?)|tables?)\.?\s*'
+    r'(' + REF_NUM + r'(?:' + REF_RANGE + r'|' + REF_LIST + r')*)\b'
+)
+ref_token_re = register("reference_token", r'(?i)(' + REF_NUM + r')|([–—-])')
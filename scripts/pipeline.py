@@ -0,0 +1,282 @@
+import os
+
+from extract_document import (
+    read_pdf, save_text, save_json, pdf_page_count, iter_pdf_paragraphs, paragraph_records,
+    find_headings, find_captions, find_references, link_records
+)
+from build_metadata import assemble_metadata, MANIFEST_FIELDS
+from docx_stream import extract_docx_text_fast, index_docx_paragraphs
+from fingerprint import fingerprint
+from records import CompactDocument, Heading, Caption, Reference, to_rows, from_rows
+from revisions import ParagraphMemo, redetect, record_key, DETECTIONS
+from stage_cache import file_hash, stage_signature
+from patterns import WORD_RE
+import instrument
+
+OUT_DIR = "outputs"
+FILE_TYPES = {".pdf": "pdf", ".docx": "docx"}
+
+
+class DocumentResult:
+    """
+    All stage outputs for one document, passed between stages in memory.
+    records (records.CompactDocument) holds the paragraphs and detections as
+    offsets into one shared text buffer; the dicts and strings of the output
+    files are only built by metadata() and write().
+    """
+
+    def __init__(self, source_path, file_type, text="", page_count=None, content_hash=None, layout=None):
+        self.source_path = source_path
+        self.file_type = file_type
+        self.text = text
+        self.page_count = page_count
+        self.content_hash = content_hash
+        self.layout = layout or {}  # PDF only: page_offsets (and font_runs, body_font_size) from read_pdf
+        self.duplicate_of = None    # set when detection was reused from an earlier copy
+        self.revision = None        # {"reused", "redetected"} paragraphs, when revised from an earlier run
+        self.word_count = None      # counted over the paragraphs when text is not kept (stream)
+        self.records = CompactDocument()
+        self.stages = []  # instrument stage records, when the run was profiled
+
+    @property
+    def file_name(self):
+        return os.path.basename(self.source_path)
+
+    def metadata(self):
+        r = self.records
+        return assemble_metadata(
+            self.file_type, self.file_name, self.text,
+            r.to_dicts("paragraphs"), r.to_dicts("headings"), r.to_dicts("captions"),
+            r.to_dicts("references"), r.to_dicts("links"),
+            page_count=self.page_count, duplicate_of=self.duplicate_of, word_count=self.word_count
+        )
+
+    def manifest(self):
+        metadata = self.metadata()
+        manifest = {k: metadata[k] for k in MANIFEST_FIELDS}
+        if self.stages:
+            manifest["stages"] = self.stages
+        return manifest
+
+    def full_metadata(self):
+        """The metadata dict exactly as create_metadata returns it (manifest_partial included)."""
+        metadata = self.metadata()
+        manifest = {k: metadata[k] for k in MANIFEST_FIELDS}
+        if self.stages:
+            manifest["stages"] = self.stages
+        metadata["manifest_partial"] = manifest
+        return metadata
+
+    def write(self, out_dir=OUT_DIR, prefix=None, dump_intermediates=False):
+        """
+        Serialize once: <prefix>_metadata.json and <prefix>_manifest.json.
+        dump_intermediates also writes the per-stage files (content, paragraphs,
+        headings, captions, references, references_links) for debugging.
+        Returns the metadata dict.
+        """
+        os.makedirs(out_dir, exist_ok=True)
+        base = os.path.join(out_dir, prefix or self.file_type)
+        metadata = self.full_metadata()
+
+        if dump_intermediates:
+            save_text(self.text, base + "_content.txt")
+            save_json(metadata["paragraphs"], base + "_paragraphs.json")
+            save_json(metadata["headings"], base + "_headings.json")
+            save_json(metadata["captions"], base + "_captions.json")
+            save_json(metadata["references"], base + "_references.json")
+            save_json(metadata["reference_links"], base + "_references_links.json")
+
+        save_json(metadata["manifest_partial"], base + "_manifest.json")
+        save_json(metadata, base + "_metadata.json")
+        return metadata
+
+
+class Pipeline:
+    """
+    extract -> paragraphs -> headings -> captions -> references -> links,
+    all in memory. Nothing touches the disk until DocumentResult.write().
+
+    cache: optional stage_cache.StageCache; stages whose inputs and version
+    are unchanged are then loaded from it instead of recomputed.
+    page_workers: extract big PDFs with this many processes (see extract_document.read_pdf_pages).
+    docx_styles: take DOCX paragraphs (and their "Heading N" styles) straight from the
+    document instead of re-splitting the flattened text.
+    pdf_layout: also read font sizes from PDFs, so paragraphs set in a larger font
+    are reported as headings. Page numbers are always recorded.
+    fingerprints: optional fingerprint.FingerprintIndex; a document whose
+    paragraphs match an earlier one then reuses its detection outputs.
+    stream: split PDFs page by page (iter_pdf_paragraphs) instead of reading the
+    whole text first, so a huge PDF never has its text in memory at once.
+    result.text stays empty and the word count comes from the paragraphs;
+    page_workers and pdf_layout do not apply.
+    """
+
+    def __init__(self, cache=None, page_workers=None, docx_styles=False, pdf_layout=False, fingerprints=None,
+                 stream=False):
+        self.cache = cache
+        self.page_workers = page_workers
+        self.docx_styles = docx_styles
+        self.pdf_layout = pdf_layout
+        self.fingerprints = fingerprints
+        self.stream = stream
+
+    def _cached(self, content_hash, stage, compute, variant=None, encode=None, decode=None):
+        """
+        compute(), or its cached value. encode/decode convert between what
+        compute returns and the JSON the cache stores (records <-> rows).
+        """
+        if self.cache is None:
+            return compute()
+        # a different paragraph source must not share cache entries with the default one
+        key = f"{content_hash}+{variant}" if variant else content_hash
+        value = self.cache.get(key, stage)
+        if value is None:
+            value = compute()
+            self.cache.put(key, stage, encode(value) if encode else value)
+            return value
+        return decode(value) if decode else value
+
+    def _cached_records(self, result, stage, cls, compute):
+        """_cached for a list of records: the cache holds them as rows"""
+        return self._cached(result.content_hash, stage, compute, self._variant(result.file_type),
+                            to_rows, lambda rows: from_rows(cls, rows))
+
+    def _variant(self, file_type):
+        if self.docx_styles and file_type == "docx":
+            return "docx_styles"
+        if self.stream and file_type == "pdf":
+            return "pdf_stream"
+        if self.pdf_layout and file_type == "pdf":
+            return "pdf_layout"
+        return None
+
+    def extract(self, path):
+        file_type = FILE_TYPES.get(os.path.splitext(path)[1].lower())
+        if file_type is None:
+            raise ValueError(f"unsupported document type: {path}")
+        content_hash = file_hash(path) if self.cache is not None else None
+        if self._variant(file_type) == "pdf_stream":
+            # nothing to read yet: split() streams the text page by page
+            return DocumentResult(path, file_type, "", pdf_page_count(path), content_hash)
+
+        def compute():
+            if file_type == "pdf":
+                # one open gives the text, the page count and the page offsets (and font sizes)
+                return read_pdf(path, self.pdf_layout, self.page_workers)
+            return {"text": extract_docx_text_fast(path), "page_count": None}
+
+        value = self._cached(content_hash, "extract", compute, self._variant(file_type))
+        layout = {k: v for k, v in value.items() if k not in ("text", "page_count")}
+        return DocumentResult(path, file_type, value["text"], value["page_count"], content_hash, layout)
+
+    def split(self, result):
+        layout = result.layout
+        variant = self._variant(result.file_type)
+        if variant == "docx_styles":
+            compute = lambda: CompactDocument.from_paragraph_dicts(index_docx_paragraphs(result.source_path))
+        elif variant == "pdf_stream":
+            def compute():
+                with instrument.stage("split_into_paragraphs") as s:
+                    doc = CompactDocument.from_paragraph_dicts(iter_pdf_paragraphs(result.source_path))
+                    s.items = len(doc.paragraphs)
+                return doc
+        elif "page_offsets" in layout:
+            compute = lambda: paragraph_records(result.text, layout["page_offsets"],
+                                                layout.get("font_runs"), layout.get("body_font_size"))
+        else:
+            compute = lambda: paragraph_records(result.text)
+        result.records = self._cached(result.content_hash, "paragraphs", compute, variant,
+                                      CompactDocument.paragraph_state, CompactDocument.from_paragraph_state)
+        if variant == "pdf_stream":
+            # no full text to count in (paragraphs are joined by line breaks in the buffer);
+            # a heading glued to the word before it counts as two
+            result.word_count = len(WORD_RE.findall(result.records.text))
+
+    def detect(self, result):
+        doc = result.records
+        doc.headings = self._cached_records(result, "headings", Heading, lambda: find_headings(doc))
+        doc.captions = self._cached_records(result, "captions", Caption, lambda: find_captions(doc))
+        doc.references = self._cached_records(result, "references", Reference, lambda: find_references(doc))
+
+    def link(self, result):
+        doc = result.records
+        doc.links = self._cached(result.content_hash, "links", lambda: link_records(doc.captions, doc.references),
+                                 self._variant(result.file_type))
+
+    def deduplicate(self, result):
+        """
+        Look the paragraphs up in the fingerprint index and record them there.
+        When an exact copy or a near-duplicate is found, paragraphs whose text
+        hash matches one of the earlier copy's take over its headings, captions
+        and references (see revisions.redetect); the others are detected anew
+        and the links rebuilt. Returns True if any paragraph was reused.
+        """
+        doc_key = os.path.normpath(result.source_path)
+        doc = result.records
+        fp = fingerprint(doc.paragraph_texts())
+        match = self.fingerprints.find(fp, exclude=doc_key)
+        stored = self.fingerprints.detections(match["doc"]) if match else None
+        reused = 0
+        if stored and stored.get("paragraph_keys"):
+            memo = ParagraphMemo(stored["paragraph_keys"], stored, stored.get("detectors"))
+            self._redetect(result, memo)
+            reused = result.revision["reused"]
+            result.revision = None
+        else:
+            self.detect(result)
+            self.link(result)
+        if match:
+            result.duplicate_of = {"doc": match["doc"], "similarity": match["similarity"],
+                                   "exact": match["exact"], "reused": reused}
+        detections = {name: doc.to_dicts(name) for name in DETECTIONS}
+        self.fingerprints.add(doc_key, fp, dict(
+            detections,
+            paragraph_keys=[record_key(doc, p) for p in doc.paragraphs],
+            detectors={name: stage_signature(name) for name in DETECTIONS},
+        ))
+        return bool(reused)
+
+    def revise(self, result, previous):
+        """
+        Detection for a new revision of a document: paragraphs whose text (and
+        style/font) is unchanged since `previous` (that revision's metadata)
+        keep their detections, only the others go through the detectors.
+        Links are rebuilt from the merged lists.
+        """
+        self._redetect(result, ParagraphMemo.from_metadata(previous))
+
+    def _redetect(self, result, memo):
+        doc = result.records
+        detections, result.revision = redetect(doc, memo)
+        doc.headings, doc.captions, doc.references = (detections[name] for name in DETECTIONS)
+        doc.links = link_records(doc.captions, doc.references)
+
+    def run(self, path, profile=False, profile_memory=False, progress=None, previous=None):
+        """
+        profile records per-stage timings into result.stages (profile_memory adds tracemalloc peaks).
+        progress, if given, is called with "extracted" and "detected" as the run gets there.
+        previous: metadata of an earlier revision of this document (see revise);
+        it takes the place of the stage cache and the fingerprint index for detection.
+        """
+        if profile or profile_memory:
+            with instrument.recording(os.path.basename(path), memory=profile_memory) as rec:
+                result = self._run(path, progress, previous)
+            result.stages = rec.stages
+            return result
+        return self._run(path, progress, previous)
+
+    def _run(self, path, progress=None, previous=None):
+        result = self.extract(path)
+        if progress:
+            progress("extracted")
+        self.split(result)
+        if previous is not None:
+            self.revise(result, previous)
+        elif self.fingerprints is not None:
+            self.deduplicate(result)
+        else:
+            self.detect(result)
+            self.link(result)
+        if progress:
+            progress("detected")
+        return result
@@ -0,0 +1,219 @@
+from patterns import WHITESPACE_RE
+
+# characters clean_title strips from the end of a heading
+TITLE_STRIP = " .:;,-—"
+
+
+def clean_title(s):
+    s = WHITESPACE_RE.sub(' ', (s or "")).strip()
+    return s.rstrip(TITLE_STRIP)
+
+
+# ---------- Records ----------
+# Every record points into CompactDocument.text with (start, end) offsets
+# instead of holding its own copy of the string. Optional fields are None
+# when the paragraph source does not have them.
+
+class Paragraph:
+    __slots__ = ("index", "start", "end", "page", "page_breaks", "font_size", "font_scale", "font_run", "style")
+
+    def __init__(self, index, start, end, page=None, page_breaks=None,
+                 font_size=None, font_scale=None, font_run=None, style=None):
+        self.index = index
+        self.start = start
+        self.end = end
+        self.page = page
+        self.page_breaks = page_breaks
+        self.font_size = font_size
+        self.font_scale = font_scale
+        self.font_run = font_run
+        self.style = style
+
+    def page_at(self, offset):
+        """Page of a character offset inside the paragraph (None if it has no page)"""
+        page = self.page
+        for at, number in self.page_breaks or ():
+            if at > offset:
+                break
+            page = number
+        return page
+
+
+class Heading:
+    # title_short is clean_title(text[short_start:short_end]), title_full clean_title(text[start:end])
+    __slots__ = ("index", "number", "classification", "short_start", "short_end", "start", "end")
+
+    def __init__(self, index, number, classification, short_start, short_end, start, end):
+        self.index = index
+        self.number = number
+        self.classification = classification
+        self.short_start = short_start
+        self.short_end = short_end
+        self.start = start
+        self.end = end
+
+
+class Caption:
+    # "text" is text[start:end].strip(), "caption_text" text[text_start:end].strip();
+    # label is the number as written, with its sub-label ("2a")
+    __slots__ = ("index", "type", "number", "label", "start", "text_start", "end", "page")
+
+    def __init__(self, index, type, number, label, start, text_start, end, page=None):
+        self.index = index
+        self.type = type
+        self.number = number
+        self.label = label
+        self.start = start
+        self.text_start = text_start
+        self.end = end
+        self.page = page
+
+
+class Reference:
+    # start/end are relative to the paragraph, as detect_references reports them
+    __slots__ = ("index", "ref_type", "ref_number", "start", "end", "page")
+
+    def __init__(self, index, ref_type, ref_number, start, end, page=None):
+        self.index = index
+        self.ref_type = ref_type
+        self.ref_number = ref_number
+        self.start = start
+        self.end = end
+        self.page = page
+
+
+HEADING_METHODS = {"numbered": "num_re", "known": "known_re", "font": "font_size", "style": "docx_style"}
+
+
+def to_rows(records):
+    """Records as JSON-able lists of their slots (trailing Nones dropped), for the stage cache."""
+    rows = []
+    for r in records:
+        row = [getattr(r, s) for s in r.__slots__]
+        while row and row[-1] is None:
+            row.pop()
+        rows.append(row)
+    return rows
+
+
+def from_rows(cls, rows):
+    return [cls(*row) for row in rows]
+
+
+# ---------- Document ----------
+class CompactDocument:
+    """
+    One shared text buffer plus offset-only paragraph/heading/caption/reference
+    records, and the caption index each reference links to. Strings and dicts
+    are only built by to_dicts(), which returns the same dicts as
+    index_paragraphs / heading_detection / detect_fig_table / detect_references
+    / link_references_to_captions.
+    """
+
+    __slots__ = ("text", "paragraphs", "headings", "captions", "references", "links")
+
+    def __init__(self, text="", paragraphs=None):
+        self.text = text
+        self.paragraphs = paragraphs or []
+        self.headings = []
+        self.captions = []
+        self.references = []
+        self.links = []
+
+    @classmethod
+    def from_paragraph_dicts(cls, items):
+        """From indexed paragraph dicts (any iterable): their texts are joined into the buffer."""
+        pieces, paragraphs = [], []
+        pos = 0
+        for item in items:
+            text = item.get("text") or ""
+            paragraphs.append(Paragraph(
+                item.get("index"), pos, pos + len(text), item.get("page"), item.get("page_breaks"),
+                item.get("font_size"), item.get("font_scale"), item.get("font_run"), item.get("style")))
+            pieces.append(text)
+            pos += len(text) + 1
+        return cls("\n".join(pieces), paragraphs)
+
+    def paragraph_text(self, p):
+        return self.text[p.start:p.end]
+
+    def paragraph_texts(self):
+        return (self.text[p.start:p.end] for p in self.paragraphs)
+
+    # ----- stage cache -----
+    def paragraph_state(self):
+        return {"text": self.text, "paragraphs": to_rows(self.paragraphs)}
+
+    @classmethod
+    def from_paragraph_state(cls, state):
+        return cls(state["text"], from_rows(Paragraph, state["paragraphs"]))
+
+    # ----- materialization (serialization time only) -----
+    def to_dicts(self, name):
+        """"paragraphs", "headings", "captions", "references" or "links" as the stage dicts"""
+        return getattr(self, f"_{name}_dicts")()
+
+    def _paragraphs_dicts(self):
+        out = []
+        for p in self.paragraphs:
+            item = {"index": p.index}
+            if p.page is not None:
+                item["page"] = p.page
+            item["text"] = self.text[p.start:p.end]
+            for field in ("page_breaks", "font_size", "font_scale", "font_run", "style"):
+                value = getattr(p, field)
+                if value is not None:
+                    item[field] = value
+            out.append(item)
+        return out
+
+    def _headings_dicts(self):
+        return [{
+            "index": h.index,
+            "number": h.number,
+            "title_short": clean_title(self.text[h.short_start:h.short_end]),
+            "title_full": clean_title(self.text[h.start:h.end]),
+            "classification": h.classification,
+            "method": HEADING_METHODS[h.classification]
+        } for h in self.headings]
+
+    def _captions_dicts(self):
+        out = []
+        for c in self.captions:
+            caption = {
+                "index": c.index,
+                "type": c.type,
+                "number": c.number,
+                "label": c.label,
+                "text": self.text[c.start:c.end].strip(),
+                "caption_text": self.text[c.text_start:c.end].strip()
+            }
+            if c.page is not None:
+                caption["page"] = c.page
+            out.append(caption)
+        return out
+
+    def _references_dicts(self):
+        out = []
+        for r in self.references:
+            reference = {
+                "index": r.index,
+                "ref_type": r.ref_type,
+                "ref_number": r.ref_number,
+                "ref_text": f"{r.ref_type.capitalize()} {r.ref_number}",
+                "start": r.start,
+                "end": r.end,
+            }
+            if r.page is not None:
+                reference["page"] = r.page
+            out.append(reference)
+        return out
+
+    def _links_dicts(self):
+        return [{
+            "ref_index": r.index,
+            "ref_text": f"{r.ref_type.capitalize()} {r.ref_number}",
+            "ref_type": r.ref_type,
+            "ref_number": r.ref_number,
+            "caption_index": caption_index
+        } for r, caption_index in zip(self.references, self.links)]
@@ -0,0 +1,224 @@
+import argparse
+import hashlib
+import os
+from collections import Counter
+
+from extract_document import find_headings, find_captions, find_references, save_json
+from build_metadata import load_json_safe
+from records import Heading, Caption, Reference
+from stage_cache import stage_signature
+
+# detection outputs that come from one paragraph alone (links are rebuilt from all of them)
+DETECTORS = {
+    "headings": find_headings,
+    "captions": find_captions,
+    "references": find_references,
+}
+DETECTIONS = tuple(DETECTORS)
+
+# paragraph fields the detectors read besides the text: a paragraph only reuses
+# its earlier detections when all of them are unchanged
+KEY_FIELDS = ("style", "font_scale", "font_run")
+
+
+# ---------- Memo ----------
+def _key(text, fields):
+    h = hashlib.blake2b(digest_size=16)
+    h.update(text.encode("utf-8"))
+    for value in fields:
+        h.update(b"\0" + repr(value).encode("utf-8"))
+    return h.hexdigest()
+
+
+def paragraph_key(item):
+    """Key of an indexed paragraph dict"""
+    return _key(item.get("text") or "", [item.get(field) for field in KEY_FIELDS])
+
+
+def record_key(doc, p):
+    """paragraph_key of a Paragraph record of a CompactDocument"""
+    return _key(doc.paragraph_text(p), [getattr(p, field) for field in KEY_FIELDS])
+
+
+class ParagraphMemo:
+    """
+    Headings, captions and references of an earlier revision, keyed by the hash
+    of the paragraph they were found in. Entries keep no index or page: those
+    belong to wherever the paragraph sits in the new revision.
+
+    keys: paragraph_key of every paragraph of that revision, in index order.
+
+    signatures: the stage_signature of each detector when the earlier revision
+    was processed (metadata["detectors"]). Outputs of a detector whose version
+    or heading vocabulary has changed since are not reused (`reusable`).
+    """
+
+    def __init__(self, keys, detections, signatures=None):
+        signatures = signatures or {}
+        self.reusable = {name for name in DETECTIONS if signatures.get(name) == stage_signature(name)}
+        by_index = {name: {} for name in DETECTIONS}
+        for name in DETECTIONS:
+            for item in detections.get(name) or []:
+                stripped = {k: v for k, v in item.items() if k not in ("index", "page")}
+                by_index[name].setdefault(item["index"], []).append(stripped)
+        self.entries = {}
+        for i, key in enumerate(keys):
+            self.entries[key] = {name: by_index[name].get(i, []) for name in DETECTIONS}
+
+    @classmethod
+    def from_metadata(cls, metadata):
+        """From a *_metadata.json dict (or DocumentResult.metadata()) of the earlier revision."""
+        return cls([paragraph_key(p) for p in metadata["paragraphs"]], metadata, metadata.get("detectors"))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        return self.entries.get(key)
+
+
+def redetect(doc, memo):
+    """
+    Detection records for the paragraphs of a CompactDocument, running the
+    detectors only on the paragraphs the memo does not have. Unchanged
+    paragraphs take their earlier detections at their new index and offsets
+    (pages are recomputed). A detector the memo has no current outputs for runs
+    over every paragraph. The result is what a full run gives: ordered by
+    paragraph, and within a paragraph as the detector ordered it.
+    Returns (detections, {"reused", "redetected"}).
+    """
+    changed = []
+    reused = {name: [] for name in DETECTIONS}
+    for p in doc.paragraphs:
+        entry = memo.get(record_key(doc, p)) if memo.reusable else None
+        adopted = _adopt(doc, p, entry, memo.reusable) if entry is not None else None
+        if adopted is None:
+            changed.append(p)
+            continue
+        for name, items in adopted.items():
+            reused[name].extend(items)
+
+    fresh = {name: detect(doc, changed if name in memo.reusable else doc.paragraphs)
+             for name, detect in DETECTORS.items()}
+    # both lists are already in paragraph order; a stable sort interleaves them
+    detections = {name: sorted(reused[name] + fresh[name], key=lambda r: r.index) for name in DETECTIONS}
+    total = len(doc.paragraphs)
+    redetected = len(changed) if len(memo.reusable) == len(DETECTIONS) else total
+    return detections, {"reused": total - redetected, "redetected": redetected}
+
+
+def _adopt(doc, p, entry, names):
+    """
+    The memo's detections (dicts) of one unchanged paragraph as records at its
+    place in doc: titles and captions are found again in the paragraph text,
+    pages recomputed. None if one of them is not there, so the paragraph is
+    detected anew instead.
+    """
+    text = doc.paragraph_text(p)
+    adopted = {}
+    if "headings" in names:
+        adopted["headings"] = []
+        for h in entry["headings"]:
+            # the short title is the start of the full one
+            at = text.find(h["title_full"])
+            if at == -1 or not h["title_full"].startswith(h["title_short"]):
+                return None
+            start = p.start + at
+            adopted["headings"].append(Heading(p.index, h["number"], h["classification"],
+                                               start, start + len(h["title_short"]),
+                                               start, start + len(h["title_full"])))
+    if "captions" in names:
+        adopted["captions"] = []
+        cursor = {}
+        for c in entry["captions"]:
+            # same text as when it was detected: search on from the previous caption of its kind
+            at = text.find(c["text"], cursor.get(c["type"], 0))
+            if at == -1 or not c["text"].endswith(c["caption_text"]):
+                return None
+            cursor[c["type"]] = at + 1
+            end = p.start + at + len(c["text"])
+            adopted["captions"].append(Caption(p.index, c["type"], c["number"], c["label"], p.start + at,
+                                               end - len(c["caption_text"]), end, p.page_at(at)))
+    if "references" in names:
+        adopted["references"] = [Reference(p.index, r["ref_type"], r["ref_number"], r["start"], r["end"],
+                                           p.page_at(r["start"]))
+                                 for r in entry["references"]]
+    return adopted
+
+
+# ---------- Delta ----------
+DELTA_KEYS = {
+    "headings": lambda h: (h.get("number"), h.get("title_full")),
+    "captions": lambda c: (c["type"], c["number"], c.get("caption_text")),
+    # a reference is a mention: "Figure 2" cited three times before and twice now is one removed
+    "references": lambda r: (r["ref_type"], r["ref_number"]),
+}
+
+
+def delta(previous, current):
+    """
+    What changed between two revisions' detections: for headings, captions and
+    references, the items only the new one has ("added") and only the old one
+    has ("removed"), compared by content rather than paragraph index.
+    """
+    out = {}
+    for name, key in DELTA_KEYS.items():
+        old = Counter(key(item) for item in previous.get(name) or [])
+        new = Counter(key(item) for item in current.get(name) or [])
+        added, removed = new - old, old - new
+        out[name] = {
+            "added": _take(current.get(name) or [], key, added),
+            "removed": _take(previous.get(name) or [], key, removed),
+        }
+    return out
+
+
+def revision_delta(previous, result):
+    """The <prefix>_delta.json report: result.revision's counts plus delta() against previous."""
+    current = {name: result.records.to_dicts(name) for name in DETECTIONS}
+    return dict(result.revision, **delta(previous, current))
+
+
+def _take(items, key, wanted):
+    """The last wanted[k] items of each key k (the extra copies are the ones further down)."""
+    wanted = Counter(wanted)
+    picked = []
+    for item in reversed(items):
+        k = key(item)
+        if wanted[k] > 0:
+            wanted[k] -= 1
+            picked.append(item)
+    return picked[::-1]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Process a new revision of a document, re-detecting only the paragraphs that changed.")
+    parser.add_argument("document", help="the new revision (PDF/DOCX)")
+    parser.add_argument("--previous", required=True, help="*_metadata.json of the earlier revision")
+    parser.add_argument("--out-dir", default="outputs")
+    parser.add_argument("--prefix", default=None, help="output file prefix (default: the file type)")
+    parser.add_argument("--docx-styles", action="store_true")
+    parser.add_argument("--pdf-layout", action="store_true")
+    args = parser.parse_args(argv)
+
+    from pipeline import Pipeline
+    previous = load_json_safe(args.previous)
+    if not previous or "paragraphs" not in previous:
+        parser.error(f"no metadata in {args.previous}")
+    pipeline = Pipeline(docx_styles=args.docx_styles, pdf_layout=args.pdf_layout)
+    result = pipeline.run(args.document, previous=previous)
+    prefix = args.prefix or result.file_type
+    result.write(args.out_dir, prefix)
+
+    changes = revision_delta(previous, result)
+    out = os.path.join(args.out_dir, f"{prefix}_delta.json")
+    save_json(changes, out)
+    print(f"{changes['reused']} paragraphs reused, {changes['redetected']} re-detected")
+    for name in DELTA_KEYS:
+        print(f"{name}: +{len(changes[name]['added'])} -{len(changes[name]['removed'])}")
+    print(f"Wrote {out}")
+
+
+if __name__ == "__main__":
+    main()
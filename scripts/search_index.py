@@ -0,0 +1,403 @@
+import argparse
+import array
+import bisect
+import glob
+import json
+import mmap
+import os
+import re
+import struct
+import tempfile
+import time
+
+SEARCH_DIR = "outputs/search"
+FIELDS = ["text", "heading", "caption"]
+TOKEN_RE = re.compile(r"\w+")
+
+# query syntax: latency  "table 3"  caption:latency  heading:"related work"  A NEAR/10 B
+CLAUSE_RE = re.compile(r'(NEAR/\d+)|(?:(\w+):)?(?:"([^"]*)"|(\S+))')
+
+LEX_MAGIC = b"PIX1"
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def _units(paragraphs, headings, captions):
+    """(field, unit, text): a unit is the item's position in its stage file"""
+    for i, p in enumerate(paragraphs):
+        yield "text", i, p.get("text") or ""
+    for i, h in enumerate(headings):
+        yield "heading", i, h.get("title_full") or ""
+    for i, c in enumerate(captions):
+        yield "caption", i, c.get("text") or ""
+
+
+# ---------- Segment files ----------
+# A segment is immutable and written once:
+#   seg_N.post  uint32 postings; per term, per unit: doc_id, unit, n, pos_1 .. pos_n
+#   seg_N.lex   b"PIX1", n_terms, key_offsets[n+1], post_start[n], post_len[n], key bytes
+# Keys are b"<field>\0<token>", sorted, so a lookup is a binary search over the
+# memory-mapped .lex file; nothing is loaded up front.
+def write_segment(path_base, postings):
+    """postings: {(field, token): {(doc_id, unit): [positions]}}"""
+    keys = sorted(postings, key=lambda k: f"{k[0]}\0{k[1]}".encode("utf-8"))
+    post = array.array("I")
+    starts, lengths, key_offsets = array.array("I"), array.array("I"), array.array("I", [0])
+    blob = bytearray()
+    for key in keys:
+        starts.append(len(post))
+        for (doc_id, unit), positions in sorted(postings[key].items()):
+            post.extend((doc_id, unit, len(positions)))
+            post.extend(positions)
+        lengths.append(len(post) - starts[-1])
+        blob += f"{key[0]}\0{key[1]}".encode("utf-8")
+        key_offsets.append(len(blob))
+
+    for suffix, write in ((".post", lambda f: post.tofile(f)),
+                          (".lex", lambda f: (f.write(LEX_MAGIC + struct.pack("<I", len(keys))),
+                                              key_offsets.tofile(f), starts.tofile(f),
+                                              lengths.tofile(f), f.write(blob)))):
+        tmp = path_base + suffix + ".tmp"
+        with open(tmp, "wb") as f:
+            write(f)
+        os.replace(tmp, path_base + suffix)
+
+
+class Segment:
+    def __init__(self, path_base):
+        self.path_base = path_base
+        self._files = []
+        self.lex, self.lex_ints = self._map(path_base + ".lex")
+        if self.lex[:4] != LEX_MAGIC:
+            raise ValueError(f"{path_base}.lex is not a search index segment")
+        self.n = struct.unpack_from("<I", self.lex, 4)[0]
+        # uint32 views straight over the mapped bytes (no copies)
+        ints = self.lex_ints[2:]
+        self.key_offsets = ints[:self.n + 1]
+        self.starts = ints[self.n + 1:2 * self.n + 1]
+        self.lengths = ints[2 * self.n + 1:3 * self.n + 1]
+        self.blob_start = 8 + 4 * (3 * self.n + 1)
+        _, self.post = self._map(path_base + ".post")
+
+    def _map(self, path):
+        f = open(path, "rb")
+        self._files.append(f)
+        if os.fstat(f.fileno()).st_size == 0:
+            return b"", memoryview(array.array("I"))
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._files.append(mm)
+        usable = len(mm) // 4 * 4
+        return mm, memoryview(mm)[:usable].cast("I")
+
+    def close(self):
+        for name in ("key_offsets", "starts", "lengths", "lex_ints", "post"):
+            view = getattr(self, name, None)
+            if isinstance(view, memoryview):
+                view.release()
+        for f in reversed(self._files):
+            f.close()
+
+    def _key(self, i):
+        a, b = self.key_offsets[i], self.key_offsets[i + 1]
+        return self.lex[self.blob_start + a:self.blob_start + b]
+
+    def lookup(self, field, token):
+        """{(doc_id, unit): positions} for one term (empty dict if absent)"""
+        target = f"{field}\0{token}".encode("utf-8")
+        i = bisect.bisect_left(range(self.n), target, key=self._key)
+        if i == self.n or self._key(i) != target:
+            return {}
+        post = self.post
+        j, end = self.starts[i], self.starts[i] + self.lengths[i]
+        out = {}
+        while j < end:
+            n = post[j + 2]
+            out[(post[j], post[j + 1])] = post[j + 3:j + 3 + n].tolist()
+            j += 3 + n
+        return out
+
+    def terms(self):
+        for i in range(self.n):
+            field, token = self._key(i).decode("utf-8").split("\0", 1)
+            yield field, token
+
+
+# ---------- Index ----------
+class SearchIndex:
+    """
+    Persistent inverted index over extracted paragraphs, headings and captions.
+    Every add_document() + commit() writes a new immutable segment, so adding
+    documents never rewrites earlier ones; re-adding a document hides its old
+    postings, and compact() merges everything into one segment.
+    """
+
+    def __init__(self, root=SEARCH_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.meta_path = os.path.join(root, "index.json")
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                self.meta = json.load(f)
+        except FileNotFoundError:
+            # docs: doc_key -> {"id", "source", "stamp"}; ids of replaced documents are dead
+            self.meta = {"segments": [], "next_doc_id": 0, "docs": {}}
+        self.pending = {}
+        self.pending_docs = {}
+        self._segments = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        self.close()
+        return False
+
+    def close(self):
+        for seg in self._segments or []:
+            seg.close()
+        self._segments = None
+
+    @property
+    def segments(self):
+        if self._segments is None:
+            self._segments = [Segment(os.path.join(self.root, s)) for s in self.meta["segments"]]
+        return self._segments
+
+    def live_ids(self):
+        return {d["id"]: key for key, d in self.meta["docs"].items()}
+
+    # ----- writes -----
+    def add_document(self, doc_key, paragraphs, headings=(), captions=(), source=None, stamp=None):
+        doc_id = self.meta["next_doc_id"]
+        self.meta["next_doc_id"] += 1
+        for field, unit, text in _units(paragraphs, headings, captions):
+            for pos, token in enumerate(tokenize(text)):
+                self.pending.setdefault((field, token), {}).setdefault((doc_id, unit), []).append(pos)
+        self.pending_docs[doc_key] = {"id": doc_id, "source": source, "stamp": stamp}
+        return doc_id
+
+    def commit(self):
+        if not self.pending_docs:
+            return None
+        name = f"seg_{len(self.meta['segments']):06d}_{int(time.time() * 1000)}"
+        write_segment(os.path.join(self.root, name), self.pending)
+        self.meta["segments"].append(name)
+        self.meta["docs"].update(self.pending_docs)
+        self.pending, self.pending_docs = {}, {}
+        self._save_meta()
+        self.close()
+        return name
+
+    def _save_meta(self):
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, self.meta_path)
+
+    def compact(self):
+        """Merge all segments into one, dropping postings of replaced documents."""
+        live = self.live_ids()
+        merged = {}
+        for seg in self.segments:
+            for field, token in seg.terms():
+                for (doc_id, unit), positions in seg.lookup(field, token).items():
+                    if doc_id in live:
+                        merged.setdefault((field, token), {})[(doc_id, unit)] = positions
+        old = list(self.meta["segments"])
+        self.close()
+        name = f"seg_{0:06d}_{int(time.time() * 1000)}"
+        write_segment(os.path.join(self.root, name), merged)
+        self.meta["segments"] = [name]
+        self._save_meta()
+        for s in old:
+            for suffix in (".lex", ".post"):
+                try:
+                    os.remove(os.path.join(self.root, s + suffix))
+                except FileNotFoundError:
+                    pass
+        return len(merged)
+
+    # ----- reads -----
+    def postings(self, field, token):
+        live = self.live_ids()
+        out = {}
+        for seg in self.segments:
+            for key, positions in seg.lookup(field, token).items():
+                if key[0] in live:
+                    out[key] = positions
+        return out
+
+    def phrase(self, field, tokens):
+        """{(doc_id, unit): [start positions]} where tokens occur consecutively"""
+        if not tokens:
+            return {}
+        lists = [self.postings(field, t) for t in tokens]
+        if len(lists) == 1:
+            return lists[0]
+        out = {}
+        for key in set(lists[0]).intersection(*lists[1:]):
+            # shift every token's positions back to the phrase start and intersect
+            starts = set(lists[0][key])
+            for i, postings in enumerate(lists[1:], 1):
+                starts &= {p - i for p in postings[key]}
+                if not starts:
+                    break
+            if starts:
+                out[key] = sorted(starts)
+        return out
+
+    def search(self, query, limit=None):
+        """
+        Parse and run a query. Clauses are ANDed within one paragraph (or heading /
+        caption) when they share a field; clauses on different fields only need to
+        match in the same document. "A NEAR/k B" keeps units where the two clauses
+        start at most k tokens apart.
+        Returns [{"doc_key", "field", "unit", "positions"}] sorted by document.
+        """
+        by_field = {}
+        previous = None
+        for field, tokens, near in parse_query(query):
+            matches = self.phrase(field, tokens)
+            if near is not None:
+                if previous is None or previous[0] != field:
+                    raise ValueError("NEAR needs a clause on the same field before it")
+                _, prev_matches, prev_len = previous
+                matches = {k: v for k, v in matches.items()
+                           if k in prev_matches and _near(prev_matches[k], prev_len, v, len(tokens), near)}
+            by_field.setdefault(field, []).append((matches, len(tokens)))
+            previous = (field, matches, len(tokens))
+
+        field_hits = {}
+        for field, results in by_field.items():
+            keys = set(results[0][0]).intersection(*(r[0] for r in results[1:]))
+            field_hits[field] = {k: sorted(set(p for r in results for p in r[0][k])) for k in keys}
+
+        docs = set.intersection(*({k[0] for k in hits} for hits in field_hits.values())) if field_hits else set()
+        live = self.live_ids()
+        out = []
+        for field, hits in field_hits.items():
+            for (doc_id, unit), positions in hits.items():
+                if doc_id in docs:
+                    out.append({"doc_key": live[doc_id], "field": field, "unit": unit, "positions": positions})
+        out.sort(key=lambda h: (h["doc_key"], FIELDS.index(h["field"]), h["unit"]))
+        return out[:limit] if limit else out
+
+
+def _near(a_starts, a_len, b_starts, b_len, k):
+    """at most k tokens between some occurrence of A and some occurrence of B"""
+    for a in a_starts:
+        for b in b_starts:
+            gap = b - (a + a_len) if b >= a else a - (b + b_len)
+            if gap <= k:
+                return True
+    return False
+
+
+def parse_query(query):
+    """[(field, tokens, near)] where near is the NEAR/k distance to the previous clause"""
+    clauses = []
+    near = None
+    for m in CLAUSE_RE.finditer(query):
+        op, field, quoted, word = m.groups()
+        if op:
+            near = int(op.split("/")[1])
+            continue
+        field = field or "text"
+        if field not in FIELDS:
+            raise ValueError(f"unknown field {field!r} (fields: {', '.join(FIELDS)})")
+        tokens = tokenize(quoted if quoted is not None else word)
+        if tokens:
+            clauses.append((field, tokens, near))
+        near = None
+    return clauses
+
+
+# ---------- Indexing stage ----------
+def _load(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return []
+
+
+def index_outputs(index, directories):
+    """
+    Add every <prefix>_paragraphs.json under the directories (with the matching
+    _headings / _captions files). Documents whose paragraphs file is unchanged
+    since it was indexed are skipped. Returns the number of documents added.
+    """
+    added = 0
+    for directory in directories:
+        for para_path in sorted(glob.glob(os.path.join(directory, "*_paragraphs.json"))):
+            prefix = para_path[:-len("_paragraphs.json")]
+            st = os.stat(para_path)
+            stamp = [st.st_mtime_ns, st.st_size]
+            doc_key = os.path.normpath(prefix)
+            known = index.meta["docs"].get(doc_key)
+            if known and known.get("stamp") == stamp:
+                continue
+            index.add_document(doc_key, _load(para_path), _load(prefix + "_headings.json"),
+                               _load(prefix + "_captions.json"), source=prefix, stamp=stamp)
+            added += 1
+    index.commit()
+    return added
+
+
+def hit_text(hit, index):
+    """The paragraph / heading / caption text a hit points at (read from the stage files)."""
+    source = index.meta["docs"][hit["doc_key"]]["source"]
+    suffix, key = {"text": ("_paragraphs.json", "text"), "heading": ("_headings.json", "title_full"),
+                   "caption": ("_captions.json", "text")}[hit["field"]]
+    items = _load(source + suffix)
+    return items[hit["unit"]].get(key, "") if hit["unit"] < len(items) else ""
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inverted index over extracted paragraphs, headings and captions.")
+    parser.add_argument("--dir", default=SEARCH_DIR, help="index directory")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    a = sub.add_parser("add", help="index the *_paragraphs.json files in these output directories")
+    a.add_argument("directories", nargs="+")
+
+    q = sub.add_parser("query", help='e.g. query \'"table 3" NEAR/10 latency\' or \'caption:pipeline\'')
+    q.add_argument("query")
+    q.add_argument("--limit", type=int, default=20)
+    q.add_argument("--show", action="store_true", help="print the matching text")
+
+    sub.add_parser("compact", help="merge segments and drop replaced documents")
+    sub.add_parser("stats")
+    args = parser.parse_args(argv)
+
+    index = SearchIndex(args.dir)
+    try:
+        if args.command == "add":
+            print(f"Indexed {index_outputs(index, args.directories)} new or changed documents "
+                  f"({len(index.meta['docs'])} total, {len(index.meta['segments'])} segments)")
+        elif args.command == "query":
+            start = time.perf_counter()
+            try:
+                hits = index.search(args.query)
+            except ValueError as e:
+                parser.error(str(e))
+            elapsed = (time.perf_counter() - start) * 1000
+            for h in hits[:args.limit]:
+                line = f"{h['doc_key']}\t{h['field']}[{h['unit']}]\tpos {','.join(map(str, h['positions'][:5]))}"
+                print(line + (f"\n    {hit_text(h, index)[:200]}" if args.show else ""))
+            print(f"{len(hits)} hits in {elapsed:.1f} ms")
+        elif args.command == "compact":
+            print(f"Compacted into one segment ({index.compact()} terms)")
+        elif args.command == "stats":
+            print(f"{len(index.meta['docs'])} documents, {len(index.meta['segments'])} segments, "
+                  f"{sum(s.n for s in index.segments)} terms")
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import signal
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urlsplit, parse_qs
+
+from pipeline import FILE_TYPES
+
+HOST = "127.0.0.1"
+PORT = 8765
+MAX_QUEUE = 32
+MAX_UPLOAD_BYTES = 100 * 1024 * 1024
+
+STATUS_TEXT = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    413: "Payload Too Large", 415: "Unsupported Media Type",
+    422: "Unprocessable Entity", 500: "Internal Server Error", 503: "Service Unavailable",
+}
+
+
+# ---------- Worker processes ----------
+_pipeline = None
+
+
+def _warm(cache_dir, cache_max_bytes, docx_styles, pdf_layout=False):
+    """
+    Pool initializer: pay for imports (fitz, docx, the pipeline and its
+    compiled patterns) and cache setup once per worker, not once per request.
+    """
+    global _pipeline
+    import fitz  # noqa: F401
+    import docx  # noqa: F401
+    from pipeline import Pipeline
+    from batch import get_cache
+    from extract_document import heading_detection, detect_fig_table, detect_references
+
+    cache = get_cache(cache_dir, cache_max_bytes) if cache_dir else None
+    _pipeline = Pipeline(cache, docx_styles=docx_styles, pdf_layout=pdf_layout)
+    warmup = [{"index": 0, "text": "1. Introduction as shown in Fig. 1 and Table 2"}]
+    heading_detection(warmup)
+    detect_fig_table(warmup)
+    detect_references(warmup)
+
+
+def _ping():
+    return os.getpid()
+
+
+class UnreadableDocument(Exception):
+    """The document could not be read at all (corrupt or not really a PDF/DOCX)."""
+
+
+def extract_metadata(path, profile=False):
+    """Runs in a warm worker: the create_metadata dict for one document, nothing written to disk."""
+    reached = []
+    try:
+        result = _pipeline.run(path, profile=profile, progress=reached.append)
+    except Exception as e:
+        if not reached:
+            # failed before the text was out: the input is at fault, not the pipeline
+            raise UnreadableDocument(f"{type(e).__name__}: {e}") from None
+        raise
+    return result.full_metadata()
+
+
+# ---------- Job queue ----------
+class ExtractionService:
+    """
+    Bounded queue in front of a pool of warm worker processes. `workers`
+    dispatcher tasks each keep one document in flight; at most max_queue
+    more wait in the queue, and submit() refuses anything beyond that.
+    """
+
+    def __init__(self, workers=None, max_queue=MAX_QUEUE, cache_dir=None,
+                 cache_max_bytes=None, docx_styles=False, pdf_layout=False):
+        from stage_cache import CACHE_MAX_BYTES
+        self.workers = workers or os.cpu_count() or 1
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.initargs = (cache_dir, cache_max_bytes or CACHE_MAX_BYTES, docx_styles, pdf_layout)
+        self.pool = self._new_pool()
+        self.dispatchers = []
+        self.running = 0
+        self.served = 0
+
+    def _new_pool(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_warm, initargs=self.initargs)
+
+    async def start(self):
+        # start every worker now so the first requests don't pay for the warm-up
+        loop = asyncio.get_running_loop()
+        pids = await asyncio.gather(*[loop.run_in_executor(self.pool, _ping) for _ in range(self.workers)])
+        self.dispatchers = [asyncio.create_task(self._dispatch()) for _ in range(self.workers)]
+        return sorted(set(pids))
+
+    async def close(self):
+        for task in self.dispatchers:
+            task.cancel()
+        await asyncio.gather(*self.dispatchers, return_exceptions=True)
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+    def submit(self, path, profile=False):
+        """Queue one document; returns a future for its metadata. Raises asyncio.QueueFull when busy."""
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((path, profile, future))
+        return future
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            path, profile, future = await self.queue.get()
+            self.running += 1
+            pool = self.pool
+            try:
+                result = await loop.run_in_executor(pool, extract_metadata, path, profile)
+                if not future.done():
+                    future.set_result(result)
+            except BrokenProcessPool as e:
+                # a worker died (segfault, OOM kill): every later submit would fail too,
+                # so the first dispatcher to notice replaces the pool
+                if self.pool is pool:
+                    self.pool = self._new_pool()
+                    pool.shutdown(wait=False, cancel_futures=True)
+                if not future.done():
+                    future.set_exception(e)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self.running -= 1
+                self.served += 1
+                self.queue.task_done()
+
+    def status(self):
+        return {
+            "workers": self.workers,
+            "running": self.running,
+            "queued": self.queue.qsize(),
+            "max_queue": self.queue.maxsize,
+            "served": self.served,
+        }
+
+
+# ---------- HTTP front end ----------
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+async def read_request(reader, max_body):
+    """Minimal HTTP/1.1 request parser: (method, target, headers, body)"""
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, target, _ = line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "malformed request line")
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length") or 0)
+    except ValueError:
+        length = -1
+    if length < 0:
+        raise HTTPError(400, "bad Content-Length")
+    if length > max_body:
+        raise HTTPError(413, f"upload larger than {max_body} bytes")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), target, headers, body
+
+
+async def write_response(writer, status, payload, extra_headers=None):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    head = [
+        f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}",
+        "Content-Type: application/json; charset=utf-8",
+        f"Content-Length: {len(body)}",
+        "Connection: close",
+    ]
+    for name, value in (extra_headers or {}).items():
+        head.append(f"{name}: {value}")
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+    await writer.drain()
+
+
+class ExtractionServer:
+    """
+    GET  /health                          -> pool and queue status
+    POST /extract  {"path": "data/x.pdf"} -> metadata of a file the server can read
+    POST /extract?name=x.pdf  <raw bytes> -> metadata of an uploaded document
+    Add "profile": true (or ?profile=1) to include per-stage timings in manifest_partial.
+    A full queue answers 503 with Retry-After instead of piling up work.
+    """
+
+    def __init__(self, service, max_upload=MAX_UPLOAD_BYTES):
+        self.service = service
+        self.max_upload = max_upload
+
+    async def handle(self, reader, writer):
+        try:
+            try:
+                request = await read_request(reader, self.max_upload)
+                if request is None:
+                    return
+                status, payload, headers = await self.route(*request)
+            except HTTPError as e:
+                status, payload, headers = e.status, {"error": str(e)}, None
+            await write_response(writer, status, payload, headers)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, target, headers, body):
+        url = urlsplit(target)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+        if url.path == "/health":
+            return 200, dict(self.service.status(), status="ok"), None
+        if url.path != "/extract":
+            raise HTTPError(404, f"no route {url.path}")
+        if method != "POST":
+            raise HTTPError(405, "use POST /extract")
+
+        profile = query.get("profile") in ("1", "true")
+        upload_dir = None
+        if headers.get("content-type", "").startswith("application/json"):
+            try:
+                options = json.loads(body or b"{}")
+                path = options["path"]
+            except (ValueError, KeyError, TypeError):
+                path = None
+            if not isinstance(path, str) or not path:
+                raise HTTPError(400, 'expected a JSON body like {"path": "data/paper.pdf"}')
+            profile = profile or bool(options.get("profile"))
+            if not os.path.isfile(path):
+                raise HTTPError(404, f"no such file: {path}")
+            if os.path.splitext(path)[1].lower() not in FILE_TYPES:
+                raise HTTPError(415, "only .pdf and .docx documents can be extracted")
+        else:
+            path, upload_dir = self.save_upload(query.get("name"), body)
+
+        try:
+            start = time.perf_counter()
+            try:
+                future = self.service.submit(os.path.abspath(path), profile)
+            except asyncio.QueueFull:
+                return 503, {"error": "extraction queue is full, retry later"}, {"Retry-After": "1"}
+            try:
+                metadata = await future
+            except BrokenProcessPool:
+                return 503, {"error": "extraction worker died, retry later"}, {"Retry-After": "1"}
+            except UnreadableDocument as e:
+                return 422, {"error": str(e)}, None
+            except Exception as e:
+                return 500, {"error": f"{type(e).__name__}: {e}"}, None
+            return 200, metadata, {"X-Extraction-Seconds": f"{time.perf_counter() - start:.4f}"}
+        finally:
+            if upload_dir:
+                shutil.rmtree(upload_dir, ignore_errors=True)
+
+    def save_upload(self, name, body):
+        """Write uploaded bytes under their own name, so file_name in the metadata matches."""
+        name = os.path.basename(name or "")
+        if os.path.splitext(name)[1].lower() not in FILE_TYPES:
+            raise HTTPError(400, "uploads need ?name=<file>.pdf or .docx")
+        if not body:
+            raise HTTPError(400, "empty upload")
+        upload_dir = tempfile.mkdtemp(prefix="extract_")
+        path = os.path.join(upload_dir, name)
+        with open(path, "wb") as f:
+            f.write(body)
+        return path, upload_dir
+
+
+async def serve(host=HOST, port=PORT, unix_socket=None, workers=None, max_queue=MAX_QUEUE,
+                cache_dir=None, docx_styles=False, max_upload=MAX_UPLOAD_BYTES, pdf_layout=False):
+    service = ExtractionService(workers, max_queue, cache_dir, docx_styles=docx_styles, pdf_layout=pdf_layout)
+    pids = await service.start()
+    server = ExtractionServer(service, max_upload)
+    if unix_socket:
+        listener = await asyncio.start_unix_server(server.handle, path=unix_socket)
+        where = unix_socket
+    else:
+        listener = await asyncio.start_server(server.handle, host, port)
+        where = f"http://{host}:{port}"
+    print(f"Serving on {where} with {len(pids)} warm workers (queue {max_queue})")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        async with listener:
+            await stop.wait()
+    finally:
+        await service.close()
+        if unix_socket and os.path.exists(unix_socket):
+            os.remove(unix_socket)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve document extraction from a pool of warm workers.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--unix", default=None, help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--max-queue", type=int, default=MAX_QUEUE,
+                        help="documents allowed to wait for a worker before requests get 503")
+    parser.add_argument("--cache-dir", default=None, help="stage cache shared by all workers")
+    parser.add_argument("--docx-styles", action="store_true")
+    parser.add_argument("--pdf-layout", action="store_true")
+    parser.add_argument("--max-upload-mb", type=int, default=MAX_UPLOAD_BYTES // (1024 * 1024))
+    args = parser.parse_args(argv)
+
+    asyncio.run(serve(args.host, args.port, args.unix, args.workers, args.max_queue,
+                      args.cache_dir, args.docx_styles, args.max_upload_mb * 1024 * 1024,
+                      args.pdf_layout))
+
+
+if __name__ == "__main__":
+    main()
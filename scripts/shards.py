@@ -0,0 +1,159 @@
+import argparse
+import glob
+import gzip
+import io
+import json
+import lzma
+import os
+import re
+import tempfile
+
+SHARD_DIR = "outputs/batch/shards"
+SHARD_PREFIX = "metadata"
+SHARD_MAX_BYTES = 256 * 1024 * 1024
+
+# compression -> (file suffix, open function for a binary file object)
+COMPRESSION = {
+    "none": (".jsonl", None),
+    "gzip": (".jsonl.gz", lambda f, mode: gzip.GzipFile(fileobj=f, mode=mode, compresslevel=6)),
+    "lzma": (".jsonl.xz", lambda f, mode: lzma.LZMAFile(f, mode=mode, preset=6)),
+}
+
+
+def dump_record(record):
+    """One compact JSON line (no indentation, no spaces after separators)."""
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+# ---------- Writing ----------
+class ShardWriter:
+    """
+    Appends JSON Lines records to <directory>/<prefix>-NNNNN.jsonl[.gz|.xz].
+
+    A shard is written to a temp file in the same directory and renamed to its
+    final name once it is closed, so readers only ever see complete shards and
+    a crash leaves at most one *.tmp file behind. A new shard is started once
+    the current one holds max_bytes of (uncompressed) records; numbering
+    continues after the shards already in the directory.
+    """
+
+    def __init__(self, directory=SHARD_DIR, prefix=SHARD_PREFIX, max_bytes=SHARD_MAX_BYTES, compression="none"):
+        if compression not in COMPRESSION:
+            raise ValueError(f"unknown compression: {compression}")
+        self.directory = directory
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.suffix, self.opener = COMPRESSION[compression]
+        os.makedirs(directory, exist_ok=True)
+        self.seq = max([shard_number(p) for p in list_shards(directory, prefix)], default=-1) + 1
+        self.raw = None      # temp file
+        self.stream = None   # what records are written to (the compressor, or raw)
+        self.tmp = None
+        self.size = 0
+        self.written = []    # final paths of the shards this writer committed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def path(self):
+        """Final path of the shard being written."""
+        return os.path.join(self.directory, f"{self.prefix}-{self.seq:05d}{self.suffix}")
+
+    def _open(self):
+        fd, self.tmp = tempfile.mkstemp(dir=self.directory, prefix=f".{self.prefix}-", suffix=".tmp")
+        self.raw = os.fdopen(fd, "wb")
+        self.stream = self.opener(self.raw, "wb") if self.opener else self.raw
+        self.size = 0
+
+    def write(self, record):
+        """record: a dict, or a line already made by dump_record. Returns the shard path it goes to."""
+        line = record if isinstance(record, str) else dump_record(record)
+        if self.stream is None:
+            self._open()
+        data = line.encode("utf-8")
+        self.stream.write(data)
+        self.size += len(data)
+        path = self.path
+        if self.size >= self.max_bytes:
+            self.commit()
+        return path
+
+    def commit(self):
+        """Close the current shard and move it into place."""
+        if self.stream is None:
+            return None
+        if self.stream is not self.raw:
+            self.stream.close()
+        self.raw.flush()
+        os.fsync(self.raw.fileno())
+        self.raw.close()
+        path = self.path
+        os.chmod(self.tmp, 0o644)  # mkstemp creates it owner-only
+        os.replace(self.tmp, path)
+        self.written.append(path)
+        self.stream = self.raw = self.tmp = None
+        self.seq += 1
+        return path
+
+    def close(self):
+        self.commit()
+
+
+# ---------- Reading ----------
+def shard_number(path):
+    m = re.search(r"-(\d+)\.jsonl", os.path.basename(path))
+    return int(m.group(1)) if m else -1
+
+
+def list_shards(directory=SHARD_DIR, prefix=SHARD_PREFIX):
+    """Committed shards in write order (temp files are skipped)."""
+    paths = glob.glob(os.path.join(directory, f"{prefix}-*.jsonl*"))
+    return sorted((p for p in paths if not p.endswith(".tmp")), key=shard_number)
+
+
+def open_shard(path):
+    """Text stream over one shard, decompressing by file suffix."""
+    if path.endswith(".gz"):
+        return io.TextIOWrapper(gzip.open(path, "rb"), encoding="utf-8")
+    if path.endswith(".xz"):
+        return io.TextIOWrapper(lzma.open(path, "rb"), encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def iter_records(source=SHARD_DIR, prefix=SHARD_PREFIX):
+    """
+    Yield the records of a shard file, or of every shard in a directory, one
+    line at a time: memory stays at one record however big the shards are.
+    """
+    paths = list_shards(source, prefix) if os.path.isdir(source) else [source]
+    for path in paths:
+        with open_shard(path) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Read metadata shards written by batch.py --output jsonl.")
+    parser.add_argument("source", nargs="?", default=SHARD_DIR, help="shard directory or one shard file")
+    parser.add_argument("--prefix", default=SHARD_PREFIX)
+    parser.add_argument("--fields", default=None,
+                        help="comma-separated fields to print per record (default: just count)")
+    args = parser.parse_args(argv)
+
+    count = 0
+    fields = args.fields.split(",") if args.fields else None
+    for record in iter_records(args.source, args.prefix):
+        count += 1
+        if fields:
+            print("\t".join(str(record.get(k)) for k in fields))
+    shards = list_shards(args.source, args.prefix) if os.path.isdir(args.source) else [args.source]
+    print(f"{count} records in {len(shards)} shards ({sum(os.path.getsize(p) for p in shards)} bytes)")
+
+
+if __name__ == "__main__":
+    main()
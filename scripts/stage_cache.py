@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import tempfile
+
+from patterns import VOCABULARY_DIGEST
+
+CACHE_DIR = "outputs/.cache"
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+# other processes grow the cache too: rescan it after writing this share of max_bytes
+CACHE_RESCAN_FRACTION = 16
+
+# Bump a stage's version whenever its function (or its regexes) change.
+# Every stage downstream of it is invalidated too, nothing upstream is.
+STAGE_VERSIONS = {
+    "extract": 2,     # read_pdf / extract_docx_text
+    "paragraphs": 3,  # paragraph_records (records.CompactDocument state)
+    "headings": 4,    # find_headings
+    "captions": 5,    # find_captions
+    "references": 5,  # find_references
+    "links": 3,       # link_records
+}
+
+# inputs besides the code: the heading vocabulary (patterns.py) decides where
+# paragraphs are cut and which of them are headings
+STAGE_INPUTS = {
+    "paragraphs": VOCABULARY_DIGEST,
+    "headings": VOCABULARY_DIGEST,
+}
+
+STAGE_DEPS = {
+    "extract": [],
+    "paragraphs": ["extract"],
+    "headings": ["paragraphs"],
+    "captions": ["paragraphs"],
+    "references": ["paragraphs"],
+    "links": ["captions", "references"],
+}
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """sha256 of the file content (read in chunks)"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def stage_signature(stage):
+    """'extract:1|paragraphs:1+<vocabulary>|references:2' - the stage plus everything it depends on"""
+    seen = set()
+    order = []
+
+    def visit(s):
+        if s in seen:
+            return
+        seen.add(s)
+        for dep in STAGE_DEPS[s]:
+            visit(dep)
+        order.append(s)
+
+    visit(stage)
+    return "|".join(f"{s}:{STAGE_VERSIONS[s]}" + (f"+{STAGE_INPUTS[s]}" if s in STAGE_INPUTS else "")
+                    for s in order)
+
+
+class StageCache:
+    """
+    On-disk cache of stage outputs keyed by (content hash, stage signature).
+    Entries are JSON files; the least recently used ones are evicted once the
+    cache grows past max_bytes. Safe to share between batch worker processes:
+    each one tracks the size it sees, and rescans the directory before evicting
+    and after every max_bytes / CACHE_RESCAN_FRACTION it writes.
+    """
+
+    def __init__(self, root=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+        self._rescan()
+
+    def _rescan(self):
+        self._size = sum(size for _, size, _ in self._entries())
+        self._written = 0
+
+    def _path(self, content_hash, stage):
+        key = hashlib.sha256(f"{content_hash}|{stage_signature(stage)}".encode("utf-8")).hexdigest()
+        return os.path.join(self.root, key[:2], f"{key}.json")
+
+    def _entries(self):
+        # (path, size, last used) for every cached file
+        for dirpath, _, names in os.walk(self.root):
+            for name in names:
+                if not name.endswith(".json"):
+                    continue
+                p = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(p)
+                except FileNotFoundError:
+                    continue  # evicted by another worker
+                yield p, st.st_size, st.st_mtime
+
+    def get(self, content_hash, stage):
+        path = self._path(content_hash, stage)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        # mtime doubles as "last used" for LRU eviction
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return value
+
+    def put(self, content_hash, stage, value):
+        path = self._path(content_hash, stage)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        try:
+            old_size = os.path.getsize(path)
+        except FileNotFoundError:
+            old_size = 0
+
+        # write to a temp file and rename so readers never see half an entry
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(value, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, path)
+
+        size = os.path.getsize(path)
+        self._size += size - old_size
+        self._written += size
+        if self._written > self.max_bytes // CACHE_RESCAN_FRACTION:
+            self._rescan()
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes."""
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._size = total
+        self._written = 0
+
+    def clear(self):
+        for path, _, _ in list(self._entries()):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._size = 0
+        self._written = 0
@@ -0,0 +1,172 @@
+import argparse
+import os
+import random
+import textwrap
+
+WORDS = (
+    "extraction pipeline document layout paragraph heading caption reference "
+    "metadata structure parsing text accuracy baseline method results analysis "
+    "dataset evaluation format segmentation table figure model approach system "
+    "performance latency throughput corpus token sentence section scientific"
+).split()
+
+SECTION_TITLES = [
+    "Introduction", "Related Work", "Background", "Methodology", "Experimental Setup",
+    "Results", "Discussion", "Limitations", "Conclusion", "Future Work"
+]
+
+PARAS_PER_PAGE = 6
+PDF_LINE_CHARS = 95
+PDF_LINE_HEIGHT = 13
+PDF_MARGIN = 50
+
+
+# ---------- Content ----------
+def _sentence(rng):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(8, 18))]
+    return " ".join(words).capitalize() + "."
+
+
+def _mention(rng, figures, tables):
+    """One figure/table mention in one of the styles detect_references handles"""
+    kind, count = ("Fig", figures) if (rng.random() < 0.5 or not tables) else ("Table", tables)
+    if count == 0:
+        return ""
+    n = rng.randint(1, count)
+    style = rng.randrange(5)
+    if style == 0:
+        return f"{'Figure' if kind == 'Fig' else 'Table'} {n}"
+    if style == 1:
+        return f"(see {kind}. {n})" if kind == "Fig" else f"(see Table {n})"
+    if style == 2 and count >= 3:
+        a = rng.randint(1, count - 2)
+        return f"{kind}s. {a}, {a + 1} and {a + 2}" if kind == "Fig" else f"Tables {a}, {a + 1} and {a + 2}"
+    if style == 3 and count >= 2:
+        a = rng.randint(1, count - 1)
+        return f"{'Figures' if kind == 'Fig' else 'Tables'} {a}–{a + 1}"
+    return f"{kind}. {n}" if kind == "Fig" else f"Table {n}"
+
+
+def make_paper(pages=None, paragraphs=30, figures=4, tables=2, mention_density=1.0,
+               sections=6, subsections=2, seed=0):
+    """
+    Returns a list of (kind, text) blocks: "title", "heading", "paragraph", "caption".
+    pages: if given, overrides paragraphs (about PARAS_PER_PAGE paragraphs per page)
+    mention_density: average number of figure/table mentions per paragraph
+    """
+    rng = random.Random(seed)
+    if pages:
+        paragraphs = pages * PARAS_PER_PAGE
+
+    blocks = [("title", "A Synthetic Study of Document Extraction")]
+    blocks.append(("heading", "Abstract"))
+    blocks.append(("paragraph", " ".join(_sentence(rng) for _ in range(4))))
+
+    # numbered headings "1. Introduction", "1.1. Setup" spread across the body
+    headings = []
+    for s in range(sections):
+        headings.append(f"{s + 1}. {SECTION_TITLES[s % len(SECTION_TITLES)]}")
+        for sub in range(subsections):
+            headings.append(f"{s + 1}.{sub + 1}. {rng.choice(WORDS).capitalize()} {rng.choice(WORDS)}")
+    every = max(1, paragraphs // max(1, len(headings)))
+
+    h = 0
+    for i in range(paragraphs):
+        if i % every == 0 and h < len(headings):
+            blocks.append(("heading", headings[h]))
+            h += 1
+
+        sentences = [_sentence(rng) for _ in range(rng.randint(3, 6))]
+        mentions = int(mention_density) + (1 if rng.random() < mention_density % 1 else 0)
+        for _ in range(mentions):
+            mention = _mention(rng, figures, tables)
+            if mention:
+                j = rng.randrange(len(sentences))
+                sentences[j] = sentences[j][:-1] + f" as shown in {mention}."
+        blocks.append(("paragraph", " ".join(sentences)))
+
+    if figures:
+        blocks.append(("heading", "Figures"))
+        for n in range(1, figures + 1):
+            blocks.append(("caption", f"Figure {n}: {_sentence(rng)}"))
+    if tables:
+        blocks.append(("heading", "Tables"))
+        for n in range(1, tables + 1):
+            blocks.append(("caption", f"Table {n}: {_sentence(rng)}"))
+    return blocks
+
+
+# ---------- Writers ----------
+def write_pdf(blocks, path):
+    """Lay the blocks out as wrapped lines with PyMuPDF. Returns the page count."""
+    import fitz
+
+    doc = fitz.open()
+    page = None
+    y = 0
+    for kind, text in blocks:
+        size = 14 if kind == "title" else 11 if kind == "heading" else 9
+        lines = textwrap.wrap(text, PDF_LINE_CHARS) or [""]
+        for line in lines + [""]:
+            if page is None or y > page.rect.height - PDF_MARGIN:
+                page = doc.new_page()
+                y = PDF_MARGIN
+            if line:
+                page.insert_text((PDF_MARGIN, y), line, fontsize=size)
+            y += PDF_LINE_HEIGHT
+    page_count = len(doc)
+    doc.save(path)
+    doc.close()
+    return page_count
+
+
+def write_docx(blocks, path):
+    from docx import Document
+
+    d = Document()
+    for kind, text in blocks:
+        if kind == "title":
+            d.add_heading(text, level=0)
+        elif kind == "heading":
+            level = text.split(" ", 1)[0].count(".") if text[0].isdigit() else 1
+            d.add_heading(text, level=max(1, level))
+        else:
+            d.add_paragraph(text)
+    d.save(path)
+
+
+def generate(out_dir, name="synthetic", formats=("pdf", "docx"), **size):
+    """Write <out_dir>/<name>.pdf/.docx; returns {"pdf": path, "docx": path, "pages": n}"""
+    os.makedirs(out_dir, exist_ok=True)
+    blocks = make_paper(**size)
+    out = {}
+    if "pdf" in formats:
+        out["pdf"] = os.path.join(out_dir, name + ".pdf")
+        out["pages"] = write_pdf(blocks, out["pdf"])
+    if "docx" in formats:
+        out["docx"] = os.path.join(out_dir, name + ".docx")
+        write_docx(blocks, out["docx"])
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic scientific papers (PDF + DOCX).")
+    parser.add_argument("--out-dir", default="outputs/synthetic")
+    parser.add_argument("--name", default="synthetic")
+    parser.add_argument("--pages", type=int, default=None)
+    parser.add_argument("--paragraphs", type=int, default=30)
+    parser.add_argument("--figures", type=int, default=4)
+    parser.add_argument("--tables", type=int, default=2)
+    parser.add_argument("--mention-density", type=float, default=1.0)
+    parser.add_argument("--sections", type=int, default=6)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    out = generate(args.out_dir, args.name, pages=args.pages, paragraphs=args.paragraphs,
+                   figures=args.figures, tables=args.tables, mention_density=args.mention_density,
+                   sections=args.sections, seed=args.seed)
+    print(f"Wrote {out['pdf']} ({out['pages']} pages) and {out['docx']}")
+
+
+if __name__ == "__main__":
+    main()
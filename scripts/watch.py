@@ -0,0 +1,225 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from pipeline import FILE_TYPES
+from batch import process_document_safe, document_prefix
+from stage_cache import CACHE_MAX_BYTES, file_hash
+from manifest_index import ManifestIndex
+
+WATCH_OUT_DIR = "outputs/watch"
+POLL_SECONDS = 2.0
+SETTLE_SECONDS = 3.0
+
+
+def log(message):
+    print(f"[{time.strftime('%H:%M:%S')}] {message}", flush=True)
+
+
+# ---------- Snapshots ----------
+def scan(directory, recursive=False):
+    """{path: (mtime_ns, size)} for every PDF/DOCX under directory (lock/hidden files skipped)"""
+    snapshot = {}
+    stack = [directory]
+    while stack:
+        try:
+            entries = list(os.scandir(stack.pop()))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            # "~$paper.docx" is Word's lock file, dot files are editor/sync temporaries
+            if entry.name.startswith(("~$", ".")):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                if recursive:
+                    stack.append(entry.path)
+            elif os.path.splitext(entry.name)[1].lower() in FILE_TYPES and entry.is_file():
+                st = entry.stat()
+                snapshot[entry.path] = (st.st_mtime_ns, st.st_size)
+    return snapshot
+
+
+def load_state(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return {p: tuple(s) for p, s in json.load(f).items()}
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_state(state, path):
+    """Atomically replace the state file (temp file + rename)."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+# ---------- Watcher ----------
+class Watcher:
+    """
+    Polls in_dir and feeds new or changed documents through the pipeline.
+
+    A file is picked up once its (mtime, size) snapshot has stayed the same for
+    one poll and it is at least `settle` seconds old, so files that are still
+    being copied are left alone. Processed snapshots are kept in
+    <out_dir>/watch_state.json; a restarted watcher only does what changed
+    while it was down. Rows in the manifest index are upserted per document.
+    """
+
+    def __init__(self, in_dir, out_dir=WATCH_OUT_DIR, index_path=None, workers=1,
+                 settle=SETTLE_SECONDS, recursive=False, prune=False, csv_path=None, **options):
+        self.in_dir = in_dir
+        self.out_dir = out_dir
+        self.workers = workers
+        self.settle = settle
+        self.recursive = recursive
+        self.prune = prune
+        self.csv_path = csv_path
+        self.options = options  # passed on to batch.process_document
+
+        self.state_path = os.path.join(out_dir, "watch_state.json")
+        self.done = load_state(self.state_path)  # path -> snapshot that was processed
+        self.previous = {}                       # last poll's snapshot, for debouncing
+        self.in_flight = {}                      # future -> (path, snapshot)
+        self.dirty = False                       # self.done changed since the last save
+        self.index = ManifestIndex(index_path or os.path.join(out_dir, "manifest.db"))
+        self.pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+
+    def close(self):
+        if self.pool:
+            self.pool.shutdown(wait=True)
+        self.index.close()
+
+    def ready(self, snapshot, now, once=False):
+        """Paths that are new or changed and have stopped changing."""
+        busy = {path for path, _ in self.in_flight.values()}
+        ready = []
+        for path, snap in snapshot.items():
+            if self.done.get(path) == snap or path in busy:
+                continue
+            stable = once or self.previous.get(path) == snap
+            if stable and now - snap[0] / 1e9 >= self.settle:
+                ready.append(path)
+        self.previous = snapshot
+        return sorted(ready)
+
+    def unchanged_content(self, path):
+        """Touched but byte-identical to what the index already has?"""
+        row = self.index.get(os.path.normpath(path))
+        return bool(row and row["content_hash"] and row["content_hash"] == file_hash(path))
+
+    def finish(self, path, snap, result):
+        self.done[path] = snap
+        self.dirty = True
+        if result.get("error"):
+            # remembered with its snapshot: retried only once the file changes again
+            log(f"failed {path}: {result['error']}")
+            return False
+        self.index.upsert(result)
+        log(f"indexed {path} ({result['paragraph_count']} paragraphs, {result['seconds']}s)")
+        return True
+
+    def poll(self, once=False):
+        """One scan: start ready documents, collect finished ones. Returns the number indexed."""
+        indexed = 0
+        snapshot = scan(self.in_dir, self.recursive)
+
+        # output prefix -> the first file (by path) that has it: 'a/paper.pdf' and
+        # 'b/paper.pdf' would overwrite each other's outputs, so only a/ is processed
+        owners = {}
+        for path in sorted(snapshot):
+            owners.setdefault(document_prefix(path), path)
+        for path in self.ready(snapshot, time.time(), once):
+            snap = snapshot[path]
+            owner = owners[document_prefix(path)]
+            if owner != path:
+                # remembered with its snapshot like a failure: not retried until it changes
+                log(f"skipped {path}: its outputs would overwrite those of {owner}")
+                self.done[path] = snap
+                self.dirty = True
+                continue
+            if self.unchanged_content(path):
+                self.done[path] = snap
+                self.dirty = True
+                continue
+            if self.pool:
+                fut = self.pool.submit(process_document_safe, path, self.out_dir, self.options)
+                self.in_flight[fut] = (path, snap)
+            else:
+                indexed += self.finish(path, snap, process_document_safe(path, self.out_dir, self.options))
+
+        for fut in [f for f in self.in_flight if f.done()]:
+            path, snap = self.in_flight.pop(fut)
+            indexed += self.finish(path, snap, fut.result())
+
+        removed = [p for p in self.done if p not in snapshot]
+        for path in removed:
+            del self.done[path]
+            self.dirty = True
+            if self.prune:
+                self.index.delete(os.path.normpath(path))
+                log(f"removed {path}")
+
+        if self.dirty:
+            save_state(self.done, self.state_path)
+            self.dirty = False
+        if self.csv_path and (indexed or (removed and self.prune)):
+            self.index.export_csv(self.csv_path)
+        return indexed
+
+    def run(self, interval=POLL_SECONDS, once=False):
+        log(f"watching {self.in_dir} every {interval}s ({len(self.done)} documents already processed)")
+        try:
+            while True:
+                self.poll(once)
+                if once and not self.in_flight:
+                    return
+                time.sleep(interval if not once else 0.1)
+        except KeyboardInterrupt:
+            log("stopping")
+        finally:
+            for fut, (path, snap) in list(self.in_flight.items()):
+                self.finish(path, snap, fut.result())
+            save_state(self.done, self.state_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Watch a folder and extract new or changed PDF/DOCX files.")
+    parser.add_argument("in_dir")
+    parser.add_argument("--out-dir", default=WATCH_OUT_DIR)
+    parser.add_argument("--index", default=None, help="SQLite manifest index (default: <out-dir>/manifest.db)")
+    parser.add_argument("--csv", default=None, help="re-export this manifest CSV whenever documents are indexed")
+    parser.add_argument("--interval", type=float, default=POLL_SECONDS, help="seconds between scans")
+    parser.add_argument("--settle", type=float, default=SETTLE_SECONDS,
+                        help="a file must be this many seconds old and unchanged for one scan")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--recursive", action="store_true")
+    parser.add_argument("--prune", action="store_true", help="drop deleted files from the index")
+    parser.add_argument("--once", action="store_true", help="process what is there now and exit")
+    parser.add_argument("--cache-dir", default=None)
+    parser.add_argument("--dump-intermediates", action="store_true")
+    parser.add_argument("--docx-styles", action="store_true")
+    parser.add_argument("--pdf-layout", action="store_true")
+    args = parser.parse_args(argv)
+
+    watcher = Watcher(args.in_dir, args.out_dir, args.index, args.workers, args.settle,
+                      args.recursive, args.prune, args.csv,
+                      dump_intermediates=args.dump_intermediates,
+                      cache_dir=args.cache_dir,
+                      cache_max_bytes=CACHE_MAX_BYTES,
+                      docx_styles=args.docx_styles,
+                      pdf_layout=args.pdf_layout)
+    try:
+        watcher.run(args.interval, args.once)
+    finally:
+        watcher.close()
+
+
+if __name__ == "__main__":
+    main()